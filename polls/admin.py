@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Topic, TopicRelation, TopicRelationVote, Resource, ResourceRelation, UserGoal, UserKnowledge
+from .models import AggregationWatermark, Topic, TopicComponent, TopicRelation, TopicRelationVote, Resource, ResourceRelation, ResourceVote, UserGoal, UserKnowledge
 
 
 class TopicRelationAdmin(admin.ModelAdmin):
@@ -8,10 +8,18 @@ class TopicRelationAdmin(admin.ModelAdmin):
     search_fields = ['source__title', 'target__title']
 
 
+class TopicComponentAdmin(admin.ModelAdmin):
+    list_display = ['topic', 'component']
+    list_filter = ['component']
+
+
+admin.site.register(AggregationWatermark)
 admin.site.register(Topic)
+admin.site.register(TopicComponent, TopicComponentAdmin)
 admin.site.register(TopicRelation, TopicRelationAdmin)
 admin.site.register(TopicRelationVote)
 admin.site.register(Resource)
 admin.site.register(ResourceRelation)
+admin.site.register(ResourceVote)
 admin.site.register(UserGoal)
 admin.site.register(UserKnowledge)
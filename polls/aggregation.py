@@ -0,0 +1,102 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, Max, OuterRef
+
+from .graph import Action, record_change, record_reload
+from .models import AggregationWatermark, TopicRelation, TopicRelationVote
+
+
+WATERMARK = 'topic_relation_votes'
+
+# Past this many changed edges in one batch, workers reload the graph rather
+# than replaying each one.
+RELOAD_THRESHOLD = 500
+
+
+def origin_weight(origin):
+    return getattr(settings, 'POLLS_VOTE_ORIGIN_WEIGHTS', {}).get(origin, 1)
+
+
+def edge_scores(votes, chunk_size):
+    """Yield lists of up to chunk_size ((source, target, type), score) pairs.
+
+    The DB counts votes per edge and origin, and the groups are streamed in
+    edge order so each edge's score is complete before it is handed out.
+    Votes without a source topic are skipped.
+    """
+    groups = votes.filter(source__isnull=False).values_list('source_id', 'target_id', 'relation_type', 'origin').annotate(
+        count=Count('id')).order_by('source_id', 'target_id', 'relation_type')
+
+    batch, edge, score = [], None, 0
+    for source_id, target_id, relation_type, origin, count in groups.iterator(chunk_size=chunk_size):
+        key = (source_id, target_id, relation_type)
+        if key != edge:
+            if edge is not None:
+                batch.append((edge, score))
+                if len(batch) >= chunk_size:
+                    yield batch
+                    batch = []
+            edge, score = key, 0
+        score += count * origin_weight(origin)
+    if edge is not None:
+        batch.append((edge, score))
+    if batch:
+        yield batch
+
+
+def apply_scores(scores):
+    """Set TopicRelation.weight from {(source, target, type): score}.
+
+    Edges with votes but no relation are left alone. Returns the number of
+    relations whose weight changed.
+    """
+    relations = TopicRelation.objects.filter(
+        source__in=set(source for source, _, _ in scores),
+        target__in=set(target for _, target, _ in scores),
+    ).only('source_id', 'target_id', 'relation_type', 'weight')
+
+    changed = []
+    for relation in relations:
+        score = scores.get((relation.source_id, relation.target_id, relation.relation_type))
+        if score is not None and relation.weight != score:
+            relation.weight = score
+            changed.append(relation)
+
+    with transaction.atomic():
+        TopicRelation.objects.bulk_update(changed, ['weight'])
+        # bulk_update skips the signals that keep cached graphs in step.
+        if len(changed) > RELOAD_THRESHOLD:
+            record_reload()
+        else:
+            for relation in changed:
+                record_change(Action.EDGE_ADDED, relation.source_id, relation.target_id,
+                              relation.relation_type, weight=relation.weight)
+    return len(changed)
+
+
+def aggregate_votes(full=False, chunk_size=1000):
+    """Recompute relation weights from their votes.
+
+    Only edges with votes newer than the stored watermark are rescored,
+    from all their votes, unless `full`. A vote whose id was handed out
+    before the watermark but committed after it is only picked up by the
+    next full run, and so is a deleted vote. Returns (edges scored,
+    relations changed).
+    """
+    watermark, _ = AggregationWatermark.objects.get_or_create(name=WATERMARK)
+    high = TopicRelationVote.objects.aggregate(high=Max('id'))['high'] or 0
+
+    votes = TopicRelationVote.objects.filter(id__lte=high)
+    if not full:
+        votes = votes.filter(Exists(TopicRelationVote.objects.filter(
+            id__gt=watermark.last_id, id__lte=high, source=OuterRef('source'),
+            target=OuterRef('target'), relation_type=OuterRef('relation_type'))))
+
+    scored = changed = 0
+    for batch in edge_scores(votes, chunk_size):
+        scored += len(batch)
+        changed += apply_scores(dict(batch))
+
+    # Only ever move forward, in case a slower run started earlier.
+    AggregationWatermark.objects.filter(pk=watermark.pk, last_id__lt=high).update(last_id=high)
+    return scored, changed
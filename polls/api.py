@@ -0,0 +1,174 @@
+import json
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseBadRequest
+from django.views.decorators.http import condition
+
+from .graph import PREREQ_TYPES, RELATION_TYPES, get_graph
+from .knowledge import get_known_topics
+from .models import Topic, TopicRelation
+from .pagination import KeysetPaginator
+
+try:
+    import orjson
+except ImportError:  # optional; falls back to the stdlib encoder
+    orjson = None
+
+
+# Read-only JSON views of the topic graph, answered from the in-process
+# graph. Every response carries an ETag naming the graph state it was built
+# from (plus the user's known topics where those matter), so clients can
+# revalidate with If-None-Match and get a 304 until something changes.
+
+RELATION_NAMES = {t: TopicRelation.RelationType(t).name.lower() for t in RELATION_TYPES}
+
+
+def json_response(data):
+    if orjson is not None:
+        content = orjson.dumps(data)
+    else:
+        content = json.dumps(data, separators=(',', ':'))
+    return HttpResponse(content, content_type='application/json')
+
+
+def topic_titles(graph, ids):
+    # Titles from the mmapped snapshot where it has them, the DB otherwise.
+    titles = {}
+    missing = []
+    for topic_id in ids:
+        title = graph.title(topic_id)
+        if title is None:
+            missing.append(topic_id)
+        else:
+            titles[topic_id] = title
+    if missing:
+        titles.update(Topic.objects.filter(id__in=missing).values_list('id', 'title'))
+    return titles
+
+
+def topics_json(graph, ids):
+    titles = topic_titles(graph, ids)
+    return [{'id': i, 'title': titles[i]} for i in sorted(ids) if i in titles]
+
+
+def edge_json(source, target, relation_type, weight):
+    return {'source': source, 'target': target, 'type': RELATION_NAMES[relation_type], 'weight': weight}
+
+
+def get_known_ids(request):
+    # Read once per request; both the ETag and the view need it.
+    if not hasattr(request, '_known_ids'):
+        request._known_ids = get_known_topics(request.user.id if request.user.is_authenticated else None)
+    return request._known_ids
+
+
+def graph_etag(request, *args, **kwargs):
+    return f"graph-{get_graph().state_tag}"
+
+
+def prereqs_etag(request, *args, **kwargs):
+    # The known set's version changes whenever the user's knowledge does.
+    if not request.user.is_authenticated:
+        return f"{graph_etag(request)}-anon"
+    return f"{graph_etag(request)}-{request.user.id}.{get_known_ids(request).version}"
+
+
+def get_topic_id(graph, topic_id):
+    if topic_id not in graph:
+        raise Http404(f"No topic {topic_id}")
+    return topic_id
+
+
+@condition(etag_func=graph_etag)
+def topic_list(request):
+    # ?after=<cursor>&limit=<n>, in id order.
+    try:
+        limit = min(int(request.GET.get('limit', 100)), getattr(settings, 'POLLS_API_MAX_NODES', 500))
+    except ValueError:
+        return HttpResponseBadRequest("limit must be a number")
+    paginator = KeysetPaginator(Topic.objects.all(), max(limit, 1), keys=('id',))
+    page = paginator.page(request.GET.get('after'))
+    return json_response({
+        'results': [{'id': topic.id, 'title': topic.title} for topic in page],
+        'next': page.next_cursor(),
+    })
+
+
+@condition(etag_func=graph_etag)
+def topic_detail(request, topic_id):
+    # The topic and every relation into or out of it.
+    graph = get_graph()
+    get_topic_id(graph, topic_id)
+    edges = []
+    for relation_type in RELATION_TYPES:
+        edges.extend(edge_json(s, topic_id, relation_type, w) for s, w in graph.incoming(topic_id, relation_type))
+        edges.extend(edge_json(topic_id, t, relation_type, w) for t, w in graph.outgoing(topic_id, relation_type))
+    ids = {topic_id} | {e['source'] for e in edges} | {e['target'] for e in edges}
+    titles = topic_titles(graph, ids)
+    return json_response({
+        'id': topic_id,
+        'title': titles.get(topic_id),
+        'topics': [{'id': i, 'title': titles[i]} for i in sorted(ids) if i in titles],
+        'edges': edges,
+    })
+
+
+@condition(etag_func=graph_etag)
+def neighbourhood(request, topic_id):
+    """Topics within ?depth= hops (default 1) along ?types= (comma-separated
+    names, default all) in ?direction= in/out/both, with every edge of those
+    types between them. Capped at POLLS_API_MAX_NODES topics; `truncated`
+    says when the cap was hit.
+    """
+    graph = get_graph()
+    get_topic_id(graph, topic_id)
+    try:
+        depth = min(int(request.GET.get('depth', 1)), getattr(settings, 'POLLS_API_MAX_DEPTH', 3))
+        types = RELATION_TYPES
+        if request.GET.get('types'):
+            types = tuple(TopicRelation.RelationType[name.upper()] for name in request.GET['types'].split(','))
+    except (ValueError, KeyError):
+        return HttpResponseBadRequest("depth must be a number and types relation type names")
+    direction = request.GET.get('direction', 'both')
+    if direction not in ('in', 'out', 'both'):
+        return HttpResponseBadRequest("direction must be in, out or both")
+
+    hops, truncated = graph.neighbourhood(
+        topic_id, depth, types, direction, limit=getattr(settings, 'POLLS_API_MAX_NODES', 500))
+    edges = [
+        edge_json(source, target, relation_type, weight)
+        for source in hops
+        for relation_type in types
+        for target, weight in graph.outgoing(source, relation_type)
+        if target in hops
+    ]
+    titles = topic_titles(graph, hops)
+    return json_response({
+        'id': topic_id,
+        'topics': [{'id': i, 'title': titles[i], 'hops': hops[i]} for i in sorted(hops) if i in titles],
+        'edges': edges,
+        'truncated': truncated,
+    })
+
+
+@condition(etag_func=prereqs_etag)
+def prereqs(request, topic_id):
+    # Everything the topic needs that the current user doesn't know yet, and
+    # of those the ones they can start on now.
+    graph = get_graph()
+    get_topic_id(graph, topic_id)
+    prereq_ids, next_step_ids = graph.prereq_closure(topic_id, get_known_ids(request))
+    ids = prereq_ids | next_step_ids
+    edges = [
+        edge_json(source, target, relation_type, weight)
+        for target in ids | {topic_id}
+        for relation_type in PREREQ_TYPES
+        for source, weight in graph.incoming(target, relation_type)
+        if source in ids
+    ]
+    return json_response({
+        'id': topic_id,
+        'prereqs': topics_json(graph, prereq_ids),
+        'next_steps': sorted(next_step_ids),
+        'edges': edges,
+    })
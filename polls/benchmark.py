@@ -0,0 +1,94 @@
+import random
+import statistics
+
+from django.contrib.auth.models import User
+from django.test import Client
+from django.urls import reverse
+
+from .instrumentation import instrument
+from .views import get_all_prereqs
+
+
+CASES = ('get_all_prereqs', 'topic detail', 'search', 'topic list page', 'user detail')
+
+
+class BenchmarkResult:
+    """Timings (ms) and per-call costs of one benchmark case."""
+
+    def __init__(self, name):
+        self.name = name
+        self.times = []
+        self.queries = []
+        self.nodes = []
+
+    def add(self, metrics):
+        self.times.append(metrics.total_time * 1000)
+        self.queries.append(metrics.queries)
+        self.nodes.append(metrics.nodes)
+
+    def as_dict(self):
+        times = sorted(self.times)
+        return {
+            'calls': len(times),
+            'median_ms': round(statistics.median(times), 3),
+            'p95_ms': round(times[min(len(times) - 1, int(len(times) * 0.95))], 3),
+            'max_queries': max(self.queries),
+            'mean_queries': round(statistics.mean(self.queries), 2),
+            'mean_graph_nodes': round(statistics.mean(self.nodes), 1),
+        }
+
+
+def _get(client, url, **params):
+    response = client.get(url, params)
+    if response.status_code != 200:
+        raise AssertionError(f"GET {url} returned {response.status_code}")
+    return response
+
+
+def benchmark_cases(client, topic_ids, user_ids, rng):
+    """{name: callable} for each thing measured. Each call picks its own
+    random topic (and user where it matters)."""
+    def prereqs():
+        get_all_prereqs(rng.choice(topic_ids), rng.choice(user_ids))
+
+    def topic_detail():
+        _get(client, reverse('polls:topic_detail', args=[rng.choice(topic_ids)]))
+
+    def search():
+        _get(client, reverse('polls:topic_search_results'), q=str(rng.randrange(len(topic_ids))))
+
+    cursor = [None]
+
+    def topic_list():
+        # Keeps paging forward, starting over at the end.
+        params = {'after': cursor[0]} if cursor[0] else {}
+        page = _get(client, reverse('polls:topics'), **params).context['page_obj']
+        cursor[0] = page.next_cursor()
+
+    def user_detail():
+        _get(client, reverse('polls:user_detail', args=[rng.choice(user_ids)]))
+
+    return dict(zip(CASES, (prereqs, topic_detail, search, topic_list, user_detail)))
+
+
+def run_benchmarks(topic_ids, user_ids, repeat=20, seed=0, only=None):
+    """Time each case `repeat` times, after one untimed call to warm caches
+    and load the graph. Pages are fetched with the test client, logged in
+    as the first user, so they aren't answered from the anonymous page
+    cache. Returns {name: BenchmarkResult}.
+    """
+    rng = random.Random(seed)
+    client = Client()
+    client.force_login(User.objects.get(pk=user_ids[0]))
+    results = {}
+    for name, case in benchmark_cases(client, topic_ids, user_ids, rng).items():
+        if only and name not in only:
+            continue
+        case()
+        result = results[name] = BenchmarkResult(name)
+        for _ in range(repeat):
+            with instrument() as metrics:
+                case()
+            result.add(metrics)
+    return results
+
@@ -0,0 +1,260 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .graph import PREREQ_TYPES, TopicGraph
+from .knowledge import get_known_topics
+from .models import Topic, TopicClosure, TopicRelation, UserKnowledge
+
+
+CHILD_OF = TopicRelation.RelationType.CHILD_OF
+
+
+# The whole prereq/child ancestor closure of one topic in a single query.
+# UNION (rather than UNION ALL) drops rows already produced, which is what
+# stops the recursion on cycles; both SQLite and PostgreSQL support this.
+PREREQ_CLOSURE_SQL = """
+WITH RECURSIVE known(topic_id) AS (
+    SELECT topic_id FROM {knowledge} WHERE user_id = %(user_id)s
+), closure(id) AS (
+    SELECT CAST(%(topic_id)s AS bigint)
+    UNION
+    SELECT r.source_id FROM {relation} r JOIN closure c ON r.target_id = c.id
+    WHERE r.relation_type IN ({types}) AND r.source_id NOT IN (SELECT topic_id FROM known)
+)
+SELECT t.id, t.title,
+    (t.id <> %(topic_id)s OR EXISTS (
+        SELECT 1 FROM {relation} r JOIN closure c ON r.target_id = c.id
+        WHERE r.source_id = t.id AND r.relation_type IN ({types})
+    )) AS is_prereq,
+    (t.id NOT IN (SELECT topic_id FROM known) AND NOT EXISTS (
+        SELECT 1 FROM {relation} r
+        WHERE r.target_id = t.id AND r.relation_type IN ({types})
+        AND r.source_id NOT IN (SELECT topic_id FROM known)
+    )) AS is_next_step
+FROM closure c JOIN {topic} t ON t.id = c.id
+"""
+
+
+def _format(sql):
+    quote = connection.ops.quote_name
+    return sql.format(
+        knowledge=quote(UserKnowledge._meta.db_table),
+        relation=quote(TopicRelation._meta.db_table),
+        topic=quote(Topic._meta.db_table),
+        types=", ".join(str(int(t)) for t in PREREQ_TYPES),
+    )
+
+
+def prereq_closure(topic_id, user_id):
+    """Same `(prereq_topics, next_steps)` as the in-memory graph, in one query."""
+    prereq_topics = set()
+    next_steps = set()
+    params = {'topic_id': topic_id, 'user_id': user_id}
+    for topic in Topic.objects.raw(_format(PREREQ_CLOSURE_SQL), params):
+        if topic.is_prereq:
+            prereq_topics.add(topic)
+        if topic.is_next_step:
+            next_steps.add(topic)
+    return prereq_topics, next_steps
+
+
+def closure_rows(graph, topic_id):
+    # TopicClosure rows for everything `topic_id` needs, per `graph`.
+    child_depths = graph.ancestors(topic_id, (CHILD_OF,))
+    return [
+        TopicClosure(ancestor_id=ancestor, descendant_id=topic_id, depth=depth,
+                     child_depth=child_depths.get(ancestor))
+        for ancestor, depth in graph.ancestors(topic_id).items()
+    ]
+
+
+def maintains_closure():
+    return getattr(settings, 'POLLS_GRAPH_BACKEND', 'memory') == 'closure'
+
+
+def schedule_closure_update(source_id, target_id, relation_type, removed=False):
+    # Called for each changed edge. Runs after commit, once the cached graph
+    # has caught up with the change.
+    if maintains_closure():
+        transaction.on_commit(lambda: update_closure(source_id, target_id, relation_type, removed))
+
+
+def _reach(topic_id, field):
+    # {topic: (depth, child_depth)} for the stored ancestors (field
+    # 'descendant') or descendants ('ancestor') of `topic_id`, with the
+    # topic itself at no distance.
+    other = 'ancestor_id' if field == 'descendant' else 'descendant_id'
+    rows = TopicClosure.objects.filter(**{field: topic_id}).values_list(other, 'depth', 'child_depth')
+    reach = {topic_id_: (depth, child_depth) for topic_id_, depth, child_depth in rows}
+    reach[topic_id] = (0, 0)
+    return reach
+
+
+def _rows_between(source_id, target_id):
+    # Stored pairs that could go through `source -> target`, by subquery,
+    # since either side can be too big to list.
+    ancestors = TopicClosure.objects.filter(descendant=source_id).values('ancestor_id')
+    descendants = TopicClosure.objects.filter(ancestor=target_id).values('descendant_id')
+    return TopicClosure.objects.filter(
+        Q(ancestor=source_id) | Q(ancestor__in=ancestors),
+        Q(descendant=target_id) | Q(descendant__in=descendants))
+
+
+def _upsert(rows):
+    TopicClosure.objects.bulk_create(
+        rows, batch_size=1000, update_conflicts=True,
+        unique_fields=['descendant', 'ancestor'], update_fields=['depth', 'child_depth'])
+
+
+def _shorter(a, b):
+    return b if a is None or (b is not None and b < a) else a
+
+
+def update_closure(source_id, target_id, relation_type, removed=False):
+    """Update TopicClosure for one added or removed `source -> target` edge.
+
+    Only pairs (a, d) with a in {source} + its ancestors and d in {target} +
+    its descendants can go through the edge. An addition gives each of
+    those pairs a path of depth(a, source) + 1 + depth(target, d), kept if
+    shorter. A removal re-derives just those pairs, walking the edges that
+    can lie between them (read from TopicRelation, so no in-memory graph is
+    needed) from whichever side has fewer topics. Returns how many rows
+    were written.
+    """
+    if removed:
+        return _remove_edge(source_id, target_id)
+    if Topic.objects.filter(pk__in={source_id, target_id}).count() != len({source_id, target_id}):
+        return 0  # deleted since; the cascade took its rows
+
+    ancestors = _reach(source_id, 'descendant')
+    descendants = _reach(target_id, 'ancestor')
+    child_edge = relation_type == CHILD_OF
+    existing = {
+        (ancestor, descendant): (depth, child_depth)
+        for ancestor, descendant, depth, child_depth in _rows_between(source_id, target_id).values_list(
+            'ancestor_id', 'descendant_id', 'depth', 'child_depth').iterator()
+    }
+    rows = []
+    for ancestor, (up, child_up) in ancestors.items():
+        for descendant, (down, child_down) in descendants.items():
+            depth = up + 1 + down
+            child_depth = None
+            if child_edge and child_up is not None and child_down is not None:
+                child_depth = child_up + 1 + child_down
+            old = existing.get((ancestor, descendant))
+            if old is not None:
+                depth, child_depth = min(depth, old[0]), _shorter(child_depth, old[1])
+                if (depth, child_depth) == old:
+                    continue
+            rows.append(TopicClosure(
+                ancestor_id=ancestor, descendant_id=descendant, depth=depth, child_depth=child_depth))
+    _upsert(rows)
+    return len(rows)
+
+
+def _region(source_id, target_id):
+    # The edges among topics that are both reachable from `source` or its
+    # ancestors and lead to `target` or its descendants, per the stored
+    # closure. Any path between a pair of _rows_between lies in there, so
+    # walking them replaces walking the whole graph.
+    ancestors = TopicClosure.objects.filter(descendant=source_id).values('ancestor_id')
+    descendants = TopicClosure.objects.filter(ancestor=target_id).values('descendant_id')
+    below = TopicClosure.objects.filter(Q(ancestor=source_id) | Q(ancestor__in=ancestors)).values('descendant_id')
+    above = TopicClosure.objects.filter(Q(descendant=target_id) | Q(descendant__in=descendants)).values('ancestor_id')
+
+    def inside(field):
+        return (
+            (Q(**{field: source_id}) | Q(**{f"{field}__in": ancestors}) | Q(**{f"{field}__in": below}))
+            & (Q(**{field: target_id}) | Q(**{f"{field}__in": descendants}) | Q(**{f"{field}__in": above})))
+
+    return TopicRelation.objects.filter(inside('source'), inside('target'), relation_type__in=PREREQ_TYPES).values_list(
+        'source_id', 'target_id', 'relation_type', 'weight')
+
+
+def _remove_edge(source_id, target_id):
+    ancestors = set(_reach(source_id, 'descendant'))
+    descendants = set(_reach(target_id, 'ancestor'))
+    graph = TopicGraph([], list(_region(source_id, target_id)))
+    rows = []
+    if len(ancestors) <= len(descendants):
+        for ancestor in ancestors:
+            if ancestor not in graph:
+                continue
+            child_depths = graph.descendants(ancestor, (CHILD_OF,))
+            for descendant, depth in graph.descendants(ancestor).items():
+                if descendant in descendants:
+                    rows.append(TopicClosure(
+                        ancestor_id=ancestor, descendant_id=descendant, depth=depth,
+                        child_depth=child_depths.get(descendant)))
+    else:
+        for descendant in descendants:
+            if descendant in graph:
+                rows.extend(row for row in closure_rows(graph, descendant) if row.ancestor_id in ancestors)
+
+    with transaction.atomic():
+        _rows_between(source_id, target_id).delete()
+        TopicClosure.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def rebuild_closure(batch_size=5000):
+    # Replace the whole table, working from a fresh load of TopicRelation.
+    graph = TopicGraph.load()
+    count = 0
+    with transaction.atomic():
+        TopicClosure.objects.all().delete()
+        rows = []
+        for topic_id in graph.topic_ids():
+            rows.extend(closure_rows(graph, topic_id))
+            if len(rows) >= batch_size:
+                TopicClosure.objects.bulk_create(rows)
+                count += len(rows)
+                rows = []
+        TopicClosure.objects.bulk_create(rows)
+        count += len(rows)
+    return count
+
+
+def check_closure():
+    """Compare TopicClosure against a live traversal of TopicRelation.
+
+    Returns (missing, extra, wrong) lists of (ancestor, descendant) pairs,
+    all empty if the table is consistent.
+    """
+    graph = TopicGraph.load()
+    expected = {}
+    for topic_id in graph.topic_ids():
+        for row in closure_rows(graph, topic_id):
+            expected[row.ancestor_id, row.descendant_id] = (row.depth, row.child_depth)
+
+    actual = {
+        (ancestor, descendant): (depth, child_depth)
+        for ancestor, descendant, depth, child_depth in TopicClosure.objects.values_list(
+            'ancestor_id', 'descendant_id', 'depth', 'child_depth').iterator()
+    }
+    missing = sorted(expected.keys() - actual.keys())
+    extra = sorted(actual.keys() - expected.keys())
+    wrong = sorted(k for k in expected.keys() & actual.keys() if expected[k] != actual[k])
+    return missing, extra, wrong
+
+
+def prereq_closure_from_table(topic_id, user_id):
+    """Same `(prereq_topics, next_steps)` as the traversals.
+
+    TopicClosure only narrows things down to the topic's ancestors: the
+    edges among them are read in one query and walked here, skipping known
+    topics exactly like the in-memory graph does.
+    """
+    ancestors = TopicClosure.objects.filter(descendant=topic_id).values('ancestor_id')
+    edges = TopicRelation.objects.filter(
+        relation_type__in=PREREQ_TYPES, source__in=ancestors
+    ).filter(Q(target=topic_id) | Q(target__in=ancestors)).values_list(
+        'source_id', 'target_id', 'relation_type', 'weight')
+    subgraph = TopicGraph([topic_id], list(edges))
+    prereq_ids, next_step_ids = subgraph.prereq_closure(topic_id, get_known_topics(user_id))
+
+    topics = Topic.objects.in_bulk(prereq_ids | next_step_ids)
+    prereq_topics = set(topics[i] for i in prereq_ids if i in topics)
+    next_steps = set(topics[i] for i in next_step_ids if i in topics)
+    return prereq_topics, next_steps
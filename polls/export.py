@@ -0,0 +1,108 @@
+from array import array
+import json
+import sys
+
+from asgiref.sync import sync_to_async
+
+from .graph import EDGE_LIST_HEADER, EDGE_LIST_MAGIC, EDGE_LIST_RECORD, EDGE_LIST_VERSION, missing_change_ids
+from .models import Resource, ResourceRelation, Topic, TopicGraphChange, TopicRelation
+
+
+def _line(record):
+    return json.dumps(record) + "\n"
+
+
+def export_jsonl(chunk_size=2000):
+    """Yield the graph as JSONL lines in the format `import_graph` reads.
+
+    Everything is streamed with iterator(), and references are titles, so
+    the output can be loaded into another database as is.
+    """
+    for topic_id, title in Topic.objects.order_by('id').values_list('id', 'title').iterator(chunk_size):
+        yield _line({'kind': 'topic', 'id': topic_id, 'title': title})
+
+    relations = TopicRelation.objects.order_by('id').values_list(
+        'source__title', 'target__title', 'relation_type', 'weight')
+    for source, target, relation_type, weight in relations.iterator(chunk_size):
+        yield _line({
+            'kind': 'relation', 'source': source, 'target': target,
+            'relation_type': TopicRelation.RelationType(relation_type).name.lower(), 'weight': weight,
+        })
+
+    resources = Resource.objects.order_by('id').values_list('title', 'author', 'link')
+    for title, author, link in resources.iterator(chunk_size):
+        yield _line({'kind': 'resource', 'title': title, 'author': author, 'link': link})
+
+    links = ResourceRelation.objects.order_by('id').values_list('resource__title', 'topic__title', 'votes')
+    for resource, topic, votes in links.iterator(chunk_size):
+        yield _line({'kind': 'resource_relation', 'resource': resource, 'topic': topic, 'votes': votes})
+
+
+def export_edge_list(chunk_size=20000):
+    """Yield the graph as a binary edge list (see graph.EDGE_LIST_HEADER).
+
+    Topic ids are gathered first (4 bytes each) because the header counts
+    them; edges are then streamed chunk_size records at a time. Ids must fit
+    in int32. Edges written after the generation was read may or may not
+    be included, which TopicGraph.sync() sorts out on load. The generation
+    stops short of any recent change that hasn't committed yet, so loaders
+    replay it if it does.
+    """
+    generation = TopicGraphChange.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    generation = min(missing_change_ids(generation), default=generation + 1) - 1
+    ids = array('i', Topic.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size))
+    if sys.byteorder == 'big':
+        ids.byteswap()
+    yield EDGE_LIST_HEADER.pack(EDGE_LIST_MAGIC, EDGE_LIST_VERSION, generation, len(ids))
+    yield ids.tobytes()
+    del ids
+
+    edges = TopicRelation.objects.order_by().values_list('source_id', 'target_id', 'relation_type', 'weight')
+    chunk = bytearray()
+    for edge in edges.iterator(chunk_size):
+        chunk += EDGE_LIST_RECORD.pack(*edge)
+        if len(chunk) >= chunk_size * EDGE_LIST_RECORD.size:
+            yield bytes(chunk)
+            chunk.clear()
+    if chunk:
+        yield bytes(chunk)
+
+
+def _take(iterator, size):
+    # The iterator's next pieces, joined until they reach `size`, or None at the end.
+    parts = []
+    total = 0
+    for part in iterator:
+        parts.append(part)
+        total += len(part)
+        if total >= size:
+            break
+    if not parts:
+        return None
+    return parts[0][:0].join(parts)
+
+
+async def aiter_export(export, size=1 << 16):
+    """Async version of an export generator, for ASGI responses.
+
+    The sync generator (and its DB cursor) runs in the thread-sensitive
+    executor, a chunk of about `size` at a time, so nothing is buffered
+    beyond that chunk.
+    """
+    iterator = export()
+    take = sync_to_async(_take)
+    try:
+        while True:
+            chunk = await take(iterator, size)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        await sync_to_async(iterator.close)()
+
+
+# name -> (generator, content type, file extension)
+FORMATS = {
+    'jsonl': (export_jsonl, 'application/x-ndjson', 'jsonl'),
+    'edges': (export_edge_list, 'application/octet-stream', 'bin'),
+}
@@ -0,0 +1,937 @@
+from array import array
+from bisect import bisect_left
+from datetime import timedelta
+import heapq
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .instrumentation import count_traversal
+from .models import Topic, TopicGraphChange, TopicRelation
+
+
+RELATION_TYPES = tuple(TopicRelation.RelationType.values)
+
+Action = TopicGraphChange.Action
+
+# How long a skipped change id is re-checked for before we assume its
+# transaction rolled back rather than committed late.
+GAP_TIMEOUT = 60
+
+def missing_change_ids(generation, window=1000):
+    # Ids among the last `window` up to `generation` that aren't in the log:
+    # ids are handed out before commit, so these may still show up, and a
+    # graph loaded at `generation` watches for them as sync() does for the
+    # ids it skips. Ids older than a row logged GAP_TIMEOUT ago are settled.
+    settled = TopicGraphChange.objects.filter(
+        id__lte=generation, created__lt=timezone.now() - timedelta(seconds=GAP_TIMEOUT),
+    ).order_by('-id').values_list('id', flat=True).first() or 0
+    start = max(settled, generation - window) + 1
+    present = set(TopicGraphChange.objects.filter(id__gte=start, id__lte=generation).values_list('id', flat=True))
+    return [i for i in range(start, generation + 1) if i not in present]
+
+
+def change_retention():
+    # Seconds TopicGraphChange rows are kept before they may be pruned; well
+    # past GAP_TIMEOUT, so a late commit is seen before it goes.
+    return max(getattr(settings, 'POLLS_GRAPH_CHANGE_RETENTION', 24 * 60 * 60), 2 * GAP_TIMEOUT)
+
+
+# Edge types that get walked when collecting everything needed for a goal.
+PREREQ_TYPES = (TopicRelation.RelationType.PREREQ_OF, TopicRelation.RelationType.CHILD_OF)
+
+# Binary edge list written by `manage.py export_graph --format edges`: a
+# header (magic, version, generation, topic count), that many int32 topic
+# ids, then (source, target, relation_type, weight) records to the end of
+# the file. Everything is little-endian.
+EDGE_LIST_MAGIC = b'TGEL'
+EDGE_LIST_VERSION = 1
+EDGE_LIST_HEADER = struct.Struct('<4sIqq')
+EDGE_LIST_RECORD = struct.Struct('<iiif')
+
+# Snapshot written by `write_snapshot`: the CSR arrays themselves, in native
+# byte order, so a worker can mmap them instead of building its own. Header
+# (magic, version, generation, topic count, edge count per relation type),
+# then int64 ids, then for each relation type the in and out
+# (offsets, neighbours, weights) arrays, then title offsets and the UTF-8
+# title blob. Every section is a multiple of 8 bytes, so all arrays stay
+# aligned.
+SNAPSHOT_MAGIC = b'TGS' + sys.byteorder[0].upper().encode()
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('<4sIqq' + 'q' * len(RELATION_TYPES))
+
+
+def _build_csr(ids, edges, key, value):
+    # Group edges by one endpoint (`key`) into CSR arrays:
+    # neighbours of ids[i] live in neighbours[offsets[i]:offsets[i + 1]].
+    counts = [0] * (len(ids) + 1)
+    for edge in edges:
+        counts[bisect_left(ids, edge[key]) + 1] += 1
+    for i in range(len(ids)):
+        counts[i + 1] += counts[i]
+
+    offsets = array('q', counts)
+    neighbours = array('q', bytes(8 * len(edges)))
+    weights = array('d', bytes(8 * len(edges)))
+    fill = list(counts[:-1])
+    for edge in edges:
+        i = bisect_left(ids, edge[key])
+        neighbours[fill[i]] = edge[value]
+        weights[fill[i]] = edge[3]
+        fill[i] += 1
+    return offsets, neighbours, weights
+
+
+class TopicGraph:
+    """In-memory copy of every TopicRelation.
+
+    Edges are split by relation type and stored CSR-style twice, grouped by
+    target (`_in`, i.e. "what points at this topic") and by source (`_out`).
+    Topics are addressed by id; `ids` is sorted so lookups are a bisect.
+
+    The CSR arrays are never modified. Edits go into a small overlay of
+    added/removed edges (see `apply`) until `compact` folds them back in.
+    Edges are a set of (source, target, relation_type): duplicate rows count
+    once, and adding an existing edge just updates its weight.
+    """
+
+    def __init__(self, ids, edges, generation=0):
+        edges = list({(e[0], e[1], e[2]): e for e in edges}.values())
+        self.ids = array('q', sorted(set(ids).union(
+            *((e[0], e[1]) for e in edges))))
+        self._in = {}
+        self._out = {}
+        for relation_type in RELATION_TYPES:
+            typed = [e for e in edges if e[2] == relation_type]
+            self._in[relation_type] = _build_csr(self.ids, typed, 1, 0)
+            self._out[relation_type] = _build_csr(self.ids, typed, 0, 1)
+        self._init_state(generation)
+
+    def _init_state(self, generation):
+        # Last TopicGraphChange id reflected here, plus skipped ids that may
+        # still show up from transactions that hadn't committed yet.
+        self.generation = generation
+        self._gaps = {}
+        self.needs_reload = False
+        # (ids, offsets, blob) title table when loaded from a snapshot, and
+        # the topics saved since, whose titles it may have wrong.
+        self._titles = None
+        self._stale_titles = set()
+        self._clear_overlay()
+        self._clear_memos()
+
+    def _clear_overlay(self):
+        self._added = {}  # (source, target, type) -> weight
+        self._removed = set()  # masks base edges, including reweighted ones
+        self._added_in = {t: {} for t in RELATION_TYPES}  # type -> target -> {source: weight}
+        self._added_out = {t: {} for t in RELATION_TYPES}  # type -> source -> {target: weight}
+        self._masked_in = {t: set() for t in RELATION_TYPES}  # targets with masked base edges
+        self._masked_out = {t: set() for t in RELATION_TYPES}
+        self._new_ids = set()
+        self._deleted_ids = set()
+
+    def _clear_memos(self):
+        # Per-topic numbers derived from the whole graph; dropped on any edit.
+        self._depths = {}
+        self._subtree_sizes = {}
+        self._components = None
+        self._condensation = None
+
+    @classmethod
+    def load(cls):
+        # Read the generation first: a change that commits while we load may
+        # then be applied on top of a base that already has it, which is
+        # harmless since applying a change is idempotent.
+        generation = TopicGraphChange.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        gaps = missing_change_ids(generation)
+        ids = Topic.objects.order_by('id').values_list('id', flat=True)
+        edges = TopicRelation.objects.order_by().values_list(
+            'source_id', 'target_id', 'relation_type', 'weight')
+        graph = cls(list(ids), list(edges), generation)
+        graph._gaps = dict.fromkeys(gaps, time.monotonic())
+        return graph
+
+    @classmethod
+    def load_edge_list(cls, path):
+        # Much quicker than the ORM for big graphs. The file may be behind
+        # the DB; sync() catches up from its generation.
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, version, generation, topic_count = EDGE_LIST_HEADER.unpack_from(data)
+            if magic != EDGE_LIST_MAGIC or version != EDGE_LIST_VERSION:
+                raise ValueError(f"{path} is not a version {EDGE_LIST_VERSION} edge list.")
+            start = EDGE_LIST_HEADER.size + 4 * topic_count
+            ids = array('i', data[EDGE_LIST_HEADER.size:start])
+            if sys.byteorder == 'big':
+                ids.byteswap()
+            edges = list(EDGE_LIST_RECORD.iter_unpack(data[start:]))
+        return cls(ids, edges, generation)
+
+    @classmethod
+    def load_snapshot(cls, path):
+        # The arrays stay views into the mapping, which the OS shares between
+        # every process that maps the same file.
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(data)
+        magic, version, generation, topic_count, *edge_counts = SNAPSHOT_HEADER.unpack_from(view)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError(f"{path} is not a version {SNAPSHOT_VERSION} snapshot for this machine.")
+
+        pos = SNAPSHOT_HEADER.size
+
+        def take(fmt, count):
+            nonlocal pos
+            part = view[pos:pos + 8 * count].cast(fmt)
+            pos += 8 * count
+            return part
+
+        graph = cls.__new__(cls)
+        graph.ids = take('q', topic_count)
+        graph._in = {}
+        graph._out = {}
+        for relation_type, edge_count in zip(RELATION_TYPES, edge_counts):
+            for csr in (graph._in, graph._out):
+                csr[relation_type] = (take('q', topic_count + 1), take('q', edge_count), take('d', edge_count))
+        title_offsets = take('q', topic_count + 1)
+        graph._init_state(generation)
+        graph._titles = (graph.ids, title_offsets, view[pos:])
+        return graph
+
+    def write_snapshot(self, path, titles):
+        """Write this graph to `path` for load_snapshot, replacing it atomically.
+
+        `titles` is an iterable of (id, title) in id order; topics it skips
+        get no title.
+        """
+        graph = self
+        if self.overlay_size or self._new_ids or self._deleted_ids:
+            graph = TopicGraph(self.topic_ids(), list(self.edges()))
+        # Workers replay the log from the snapshot's generation, so start
+        # them before any change that might still commit late.
+        generation = min(self._gaps, default=self.generation + 1) - 1
+
+        title_offsets = array('q', [0])
+        blob = bytearray()
+        titles = iter(titles)
+        title_id, title = next(titles, (None, None))
+        for topic_id in graph.ids:
+            while title_id is not None and title_id < topic_id:
+                title_id, title = next(titles, (None, None))
+            if title_id == topic_id:
+                blob += title.encode()
+            title_offsets.append(len(blob))
+        blob += bytes(-len(blob) % 8)
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(SNAPSHOT_HEADER.pack(
+                SNAPSHOT_MAGIC, SNAPSHOT_VERSION, generation, len(graph.ids),
+                *(len(graph._out[t][1]) for t in RELATION_TYPES)))
+            f.write(graph.ids)
+            for relation_type in RELATION_TYPES:
+                for csr in (graph._in, graph._out):
+                    for part in csr[relation_type]:
+                        f.write(part)
+            f.write(title_offsets)
+            f.write(blob)
+        os.replace(tmp_path, path)
+
+    def title(self, topic_id):
+        # From the snapshot this graph was loaded from; None if there wasn't
+        # one or the topic has been saved since.
+        if self._titles is None or topic_id in self._stale_titles:
+            return None
+        ids, offsets, blob = self._titles
+        i = bisect_left(ids, topic_id)
+        if i == len(ids) or ids[i] != topic_id:
+            return None
+        return bytes(blob[offsets[i]:offsets[i + 1]]).decode() or None
+
+    def __contains__(self, topic_id):
+        if topic_id in self._deleted_ids:
+            return False
+        return topic_id in self._new_ids or self._index(topic_id) is not None
+
+    def __len__(self):
+        return len(self.ids) + len(self._new_ids) - len(self._deleted_ids)
+
+    def edges(self):
+        # Every (source, target, relation_type, weight), overlay included.
+        for relation_type in RELATION_TYPES:
+            offsets, neighbours, weights = self._out[relation_type]
+            for i, source in enumerate(self.ids):
+                for j in range(offsets[i], offsets[i + 1]):
+                    if (source, neighbours[j], relation_type) not in self._removed:
+                        yield source, neighbours[j], relation_type, weights[j]
+        for (source, target, relation_type), weight in self._added.items():
+            yield source, target, relation_type, weight
+
+    def topic_ids(self):
+        return (set(self.ids) | self._new_ids) - self._deleted_ids
+
+    @property
+    def overlay_size(self):
+        return len(self._added) + len(self._removed)
+
+    @property
+    def state_tag(self):
+        # Names the set of changes applied: the generation, plus the skipped
+        # ids still outstanding, since one committing later changes the
+        # graph without moving the generation.
+        if not self._gaps:
+            return str(self.generation)
+        return f"{self.generation}-{zlib.crc32(array('q', sorted(self._gaps)).tobytes()):x}"
+
+    def compact(self):
+        # Rebuild the CSR arrays with the overlay folded in.
+        compacted = TopicGraph(self.topic_ids(), list(self.edges()), self.generation)
+        self.__dict__.update(
+            compacted.__dict__, _gaps=self._gaps, _titles=self._titles, _stale_titles=self._stale_titles)
+
+    def _index(self, topic_id):
+        i = bisect_left(self.ids, topic_id)
+        if i < len(self.ids) and self.ids[i] == topic_id:
+            return i
+        return None
+
+    def _base_edges(self, csr, topic_id, relation_type):
+        offsets, neighbours, weights = csr[relation_type]
+        i = self._index(topic_id)
+        if i is None:
+            return []
+        start, end = offsets[i], offsets[i + 1]
+        return list(zip(neighbours[start:end], weights[start:end]))
+
+    def incoming(self, topic_id, relation_type):
+        # (source_id, weight) for every `source -> topic_id` edge.
+        edges = self._base_edges(self._in, topic_id, relation_type)
+        if topic_id in self._masked_in[relation_type]:
+            edges = [(s, w) for s, w in edges if (s, topic_id, relation_type) not in self._removed]
+        added = self._added_in[relation_type].get(topic_id)
+        if added:
+            edges.extend(added.items())
+        return edges
+
+    def outgoing(self, topic_id, relation_type):
+        # (target_id, weight) for every `topic_id -> target` edge.
+        edges = self._base_edges(self._out, topic_id, relation_type)
+        if topic_id in self._masked_out[relation_type]:
+            edges = [(t, w) for t, w in edges if (topic_id, t, relation_type) not in self._removed]
+        added = self._added_out[relation_type].get(topic_id)
+        if added:
+            edges.extend(added.items())
+        return edges
+
+    def add_edge(self, source, target, relation_type, weight):
+        key = (source, target, relation_type)
+        self.remove_edge(source, target, relation_type)
+        self._clear_memos()
+        self._added[key] = weight
+        self._added_in[relation_type].setdefault(target, {})[source] = weight
+        self._added_out[relation_type].setdefault(source, {})[target] = weight
+
+    def remove_edge(self, source, target, relation_type):
+        key = (source, target, relation_type)
+        if self._added.pop(key, None) is not None:
+            del self._added_in[relation_type][target][source]
+            del self._added_out[relation_type][source][target]
+        # Base edges can't be deleted from the arrays, so mask them instead.
+        self._removed.add(key)
+        self._masked_in[relation_type].add(target)
+        self._masked_out[relation_type].add(source)
+        self._clear_memos()
+
+    def apply(self, change):
+        if change.action == Action.EDGE_ADDED:
+            self.add_edge(change.source_id, change.target_id, change.relation_type, change.weight)
+        elif change.action == Action.EDGE_REMOVED:
+            self.remove_edge(change.source_id, change.target_id, change.relation_type)
+        elif change.action == Action.TOPIC_SAVED:
+            self._stale_titles.add(change.source_id)
+            self._deleted_ids.discard(change.source_id)
+            if self._index(change.source_id) is None:
+                self._new_ids.add(change.source_id)
+        elif change.action == Action.TOPIC_DELETED:
+            # Its edges are removed by their own (cascaded) changes.
+            self._stale_titles.add(change.source_id)
+            self._new_ids.discard(change.source_id)
+            self._deleted_ids.add(change.source_id)
+        elif change.action == Action.RELOAD:
+            self.needs_reload = True
+
+    def sync(self):
+        """Apply changes logged (by any process) since this graph was loaded.
+
+        Returns False if a bulk write asked for a full reload instead.
+        """
+        now = time.monotonic()
+        self._gaps = {i: seen for i, seen in self._gaps.items() if now - seen < GAP_TIMEOUT}
+
+        changes = TopicGraphChange.objects.filter(id__gt=self.generation)
+        if self._gaps:
+            changes = changes | TopicGraphChange.objects.filter(id__in=list(self._gaps))
+        for change in changes.order_by('id'):
+            self._gaps.pop(change.id, None)
+            if change.id > self.generation:
+                # Ids are handed out before commit, so a lower id can still
+                # appear later on; remember the skipped ones.
+                for missing in range(self.generation + 1, min(change.id, self.generation + 1000)):
+                    self._gaps[missing] = now
+                self.generation = change.id
+            self.apply(change)
+
+        if self.overlay_size > max(1000, len(self.ids) // 10):
+            self.compact()
+        return not self.needs_reload
+
+    def sources(self, topic_id, relation_type):
+        return [source for source, _ in self.incoming(topic_id, relation_type)]
+
+    def targets(self, topic_id, relation_type):
+        return [target for target, _ in self.outgoing(topic_id, relation_type)]
+
+    def prereq_sources(self, topic_id):
+        return [
+            source
+            for relation_type in PREREQ_TYPES
+            for source in self.sources(topic_id, relation_type)
+        ]
+
+    def prereq_closure(self, topic_id, known=()):
+        """Walk prereq and child edges back from `topic_id`, skipping `known` ids.
+
+        Returns `(prereq_ids, next_step_ids)`, where next steps are the unknown
+        topics that have no unknown prereqs/children of their own.
+        """
+        prereqs = set()
+        next_steps = set()
+        open_list = [topic_id]
+        closed_set = set()  # there are some cycles in the data
+        edges = 0
+
+        while open_list:
+            curr = open_list.pop()
+            if curr in closed_set:
+                continue
+            closed_set.add(curr)
+
+            added_child = False
+            for relation_type in PREREQ_TYPES:
+                sources = self.sources(curr, relation_type)
+                edges += len(sources)
+                for source in sources:
+                    if source in known:
+                        continue
+                    prereqs.add(source)
+                    added_child = True
+                    if source not in closed_set:
+                        open_list.append(source)
+
+            if not added_child and curr not in known:
+                next_steps.add(curr)
+
+        count_traversal(len(closed_set), edges)
+        return prereqs, next_steps
+
+    def next_steps_by_goal(self, goal_ids, known=()):
+        """`prereq_closure`'s next steps for several goals in one traversal.
+
+        The union of the goals' subgraphs is walked once; each topic then gets
+        a bitmask of the goals that reach it, so shared prereqs aren't
+        revisited per goal. Returns {goal_id: next_step_ids}.
+        """
+        goal_ids = list(dict.fromkeys(goal_ids))
+        unknown_sources = {}
+        open_list = list(goal_ids)
+        while open_list:
+            curr = open_list.pop()
+            if curr in unknown_sources:
+                continue
+            sources = unknown_sources[curr] = [
+                source
+                for relation_type in PREREQ_TYPES
+                for source in self.sources(curr, relation_type)
+                if source not in known
+            ]
+            open_list.extend(s for s in sources if s not in unknown_sources)
+        count_traversal(len(unknown_sources), sum(map(len, unknown_sources.values())))
+
+        goal_masks = {}
+        for bit, goal_id in enumerate(goal_ids):
+            goal_masks[goal_id] = goal_masks.get(goal_id, 0) | (1 << bit)
+        open_list = list(goal_masks)
+        while open_list:
+            curr = open_list.pop()
+            mask = goal_masks[curr]
+            for source in unknown_sources[curr]:
+                if goal_masks.get(source, 0) | mask != goal_masks.get(source, 0):
+                    goal_masks[source] = goal_masks.get(source, 0) | mask
+                    open_list.append(source)
+
+        next_steps = {goal_id: set() for goal_id in goal_ids}
+        for topic_id, sources in unknown_sources.items():
+            if sources or topic_id in known:
+                continue
+            mask = goal_masks[topic_id]
+            for bit, goal_id in enumerate(goal_ids):
+                if mask >> bit & 1:
+                    next_steps[goal_id].add(topic_id)
+        return next_steps
+
+    def depth(self, topic_id):
+        """Length of the longest chain of prereqs/children below a topic.
+
+        Measured on the condensed graph, so every topic on a cycle gets the
+        same depth. Only the topic's own ancestors are condensed, and the
+        depths of all of them are memoized until the graph changes, so a
+        learning path costs one walk of the goal's subgraph.
+        """
+        if topic_id not in self._depths:
+            ancestors = self.ancestors(topic_id)
+            self._subtree_sizes[topic_id] = len(ancestors)
+            ids = set(ancestors) | {topic_id}
+            component_of, condensed = self.condensation(ids)
+            for member in ids:
+                self._depths[member] = condensed._chain_depth(component_of.get(member, member))
+        return self._depths[topic_id]
+
+    def _chain_depth(self, topic_id):
+        # Memoized longest chain below `topic_id`, for every topic on the way.
+        # Edges that close a cycle are ignored, so only use on acyclic graphs.
+        depths = self._depths
+        if topic_id in depths:
+            return depths[topic_id]
+
+        on_stack = {topic_id}
+        stack = [(topic_id, iter(self.prereq_sources(topic_id)))]
+        while stack:
+            curr, sources = stack[-1]
+            for source in sources:
+                if source not in depths and source not in on_stack:
+                    on_stack.add(source)
+                    stack.append((source, iter(self.prereq_sources(source))))
+                    break
+            else:
+                stack.pop()
+                on_stack.discard(curr)
+                depths[curr] = 1 + max(
+                    (depths[s] for s in self.prereq_sources(curr) if s in depths), default=-1)
+        return depths[topic_id]
+
+    def strongly_connected_components(self, topic_ids=None):
+        """Prereq/child cycles, as lists of topic ids (Tarjan's algorithm).
+
+        Only components that actually contain a cycle are returned: two or
+        more topics, or one topic that is its own prereq. `topic_ids`
+        limits the search to those topics and their ancestors; the answer
+        for the whole graph is memoized until the graph changes.
+        """
+        if topic_ids is None and self._components is not None:
+            return self._components
+
+        index = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+        components = []
+
+        def visit(topic_id):
+            index[topic_id] = lowlink[topic_id] = len(index)
+            stack.append(topic_id)
+            on_stack.add(topic_id)
+            work.append((topic_id, iter(self.prereq_sources(topic_id))))
+
+        for root in sorted(self.topic_ids() if topic_ids is None else topic_ids):
+            if root in index:
+                continue
+            work = []
+            visit(root)
+            while work:
+                curr, sources = work[-1]
+                for source in sources:
+                    if source not in index:
+                        visit(source)
+                        break
+                    if source in on_stack:
+                        lowlink[curr] = min(lowlink[curr], index[source])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[curr])
+                    if lowlink[curr] == index[curr]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == curr:
+                                break
+                        if len(component) > 1 or curr in self.prereq_sources(curr):
+                            components.append(sorted(component))
+
+        if topic_ids is None:
+            self._components = components
+        return components
+
+    def condensation(self, topic_ids=None):
+        """Collapse each cycle into one topic, giving an acyclic graph.
+
+        Returns `(component_of, condensed)`: a map from each topic on a cycle
+        to its component's smallest id (other topics stand for themselves),
+        and a TopicGraph over those ids with the prereq/child edges between
+        different components. `topic_ids`, if given, must include the
+        ancestors of each of its topics; only those are condensed. The whole
+        graph's condensation is memoized until the graph changes.
+        """
+        whole = topic_ids is None
+        if whole and self._condensation is not None:
+            return self._condensation
+
+        component_of = {}
+        for component in self.strongly_connected_components(topic_ids):
+            for topic_id in component:
+                component_of[topic_id] = component[0]
+
+        if whole:
+            topic_ids = self.topic_ids()
+            all_edges = self.edges()
+        else:
+            all_edges = (
+                (source, target, relation_type, weight)
+                for target in topic_ids
+                for relation_type in PREREQ_TYPES
+                for source, weight in self.incoming(target, relation_type)
+            )
+        edges = {}
+        for source, target, relation_type, weight in all_edges:
+            if relation_type not in PREREQ_TYPES:
+                continue
+            source = component_of.get(source, source)
+            target = component_of.get(target, target)
+            if source != target:
+                key = (source, target, relation_type)
+                edges[key] = max(weight, edges.get(key, weight))
+
+        condensed = TopicGraph(
+            set(component_of.get(t, t) for t in topic_ids),
+            [key + (w,) for key, w in edges.items()], self.generation)
+        if whole:
+            self._condensation = (component_of, condensed)
+        return component_of, condensed
+
+    def subtree_size(self, topic_id):
+        # Number of distinct topics below this one. Memoized like depth().
+        if topic_id not in self._subtree_sizes:
+            self._subtree_sizes[topic_id] = len(self.ancestors(topic_id))
+        return self._subtree_sizes[topic_id]
+
+    def learning_path(self, goal_id, known=()):
+        """Order `goal_id` and its unknown prereqs so each comes after what it needs.
+
+        Among topics that are ready at the same time, the one with the
+        heaviest edge into the rest of the path goes first, then the
+        shallowest. Cycles can't be ordered; each one found is broken at its
+        heaviest topic and reported.
+
+        Returns `(path, cycles)`: topic ids ending with the goal, and a list
+        of cycles, each a list of topic ids in prereq order starting where
+        it was broken.
+        """
+        prereqs, _ = self.prereq_closure(goal_id, known)
+        nodes = prereqs | {goal_id}
+        needs = {topic_id: set() for topic_id in nodes}
+        needed_by = {topic_id: [] for topic_id in nodes}
+        priority = dict.fromkeys(nodes, 0.0)
+        for topic_id in nodes:
+            for relation_type in PREREQ_TYPES:
+                for source, weight in self.incoming(topic_id, relation_type):
+                    if source in nodes and source not in known:
+                        needs[topic_id].add(source)
+                        needed_by[source].append(topic_id)
+                        priority[source] = max(priority[source], weight)
+
+        def push(topic_id):
+            heapq.heappush(ready, (-priority[topic_id], self.depth(topic_id), topic_id))
+
+        # Condenses the goal's subgraph once, memoizing every depth used below.
+        self.depth(goal_id)
+
+        ready = []
+        for topic_id in nodes:
+            if not needs[topic_id]:
+                push(topic_id)
+
+        path = []
+        cycles = []
+        done = set()
+        while len(done) < len(nodes):
+            if not ready:
+                cycle = self._find_cycle(needs, nodes - done)
+                first = min(cycle, key=lambda topic_id: (-priority[topic_id], topic_id))
+                start = cycle.index(first)
+                cycles.append(cycle[start:] + cycle[:start])
+                needs[first] = set()
+                push(first)
+                continue
+
+            curr = heapq.heappop(ready)[2]
+            if curr in done:
+                continue
+            done.add(curr)
+            path.append(curr)
+            for topic_id in needed_by[curr]:
+                needs[topic_id].discard(curr)
+                if not needs[topic_id] and topic_id not in done:
+                    push(topic_id)
+
+        if goal_id not in prereqs:
+            path.remove(goal_id)
+            path.append(goal_id)
+        return path, cycles
+
+    @staticmethod
+    def _find_cycle(needs, remaining):
+        # Every remaining topic still needs another remaining topic, so
+        # following those back from anywhere has to loop.
+        curr = min(remaining)
+        seen = {}
+        walk = []
+        while curr not in seen:
+            seen[curr] = len(walk)
+            walk.append(curr)
+            curr = min(needs[curr])
+        cycle = walk[seen[curr]:]
+        cycle.reverse()
+        return cycle
+
+    def ancestors(self, topic_id, relation_types=PREREQ_TYPES):
+        # Fewest hops back to every topic reachable from `topic_id` against the
+        # edge direction. `topic_id` itself is only included if it's on a cycle.
+        return self._reach(topic_id, relation_types, self.sources)
+
+    def descendants(self, topic_id, relation_types=PREREQ_TYPES):
+        # Same as ancestors(), following the edges forwards.
+        return self._reach(topic_id, relation_types, self.targets)
+
+    def _reach(self, topic_id, relation_types, neighbours_of):
+        depths = {}
+        frontier = [topic_id]
+        depth = 0
+        edges = 0
+        while frontier:
+            depth += 1
+            next_frontier = []
+            for curr in frontier:
+                for relation_type in relation_types:
+                    neighbours = neighbours_of(curr, relation_type)
+                    edges += len(neighbours)
+                    for neighbour in neighbours:
+                        if neighbour not in depths:
+                            depths[neighbour] = depth
+                            next_frontier.append(neighbour)
+            frontier = next_frontier
+        count_traversal(len(depths), edges)
+        return depths
+
+    def neighbourhood(self, topic_id, depth, relation_types=RELATION_TYPES, direction='both', limit=None):
+        """Topics within `depth` hops of `topic_id` as {id: hops}.
+
+        `direction` is 'in' (follow edges backwards), 'out' or 'both'. Stops
+        adding topics once there are `limit` of them; the second value
+        returned says whether that happened.
+        """
+        hops = {topic_id: 0}
+        frontier = [topic_id]
+        edges = 0
+        for hop in range(1, depth + 1):
+            next_frontier = []
+            for curr in frontier:
+                for relation_type in relation_types:
+                    neighbours = []
+                    if direction in ('in', 'both'):
+                        neighbours.extend(self.sources(curr, relation_type))
+                    if direction in ('out', 'both'):
+                        neighbours.extend(self.targets(curr, relation_type))
+                    edges += len(neighbours)
+                    for neighbour in neighbours:
+                        if neighbour in hops:
+                            continue
+                        if limit is not None and len(hops) >= limit:
+                            count_traversal(len(hops), edges)
+                            return hops, True
+                        hops[neighbour] = hop
+                        next_frontier.append(neighbour)
+            frontier = next_frontier
+        count_traversal(len(hops), edges)
+        return hops, False
+
+
+
+_graph = None
+_graph_lock = threading.Lock()
+_last_sync = 0
+_last_snapshot = (0, None)  # (time, generation)
+_snapshot_writer = None
+
+
+def get_graph():
+    # Loaded once per process on first use, then kept up to date from the
+    # TopicGraphChange log (at most every POLLS_GRAPH_SYNC_INTERVAL seconds).
+    global _graph, _last_sync
+    with _graph_lock:
+        interval = getattr(settings, 'POLLS_GRAPH_SYNC_INTERVAL', 0)
+        if _graph is not None and time.monotonic() - _last_sync > change_retention() - GAP_TIMEOUT:
+            # Idle long enough that changes it hasn't seen may be pruned.
+            _graph = None
+        if _graph is not None and time.monotonic() - _last_sync >= interval:
+            if not _graph.sync():
+                _graph = None
+            _last_sync = time.monotonic()
+        if _graph is None:
+            _graph = _load_graph()
+            _last_sync = time.monotonic()
+        return _graph
+
+
+def _load_graph():
+    # Fastest source first; each is then brought up to date from the log.
+    sources = (
+        (getattr(settings, 'POLLS_GRAPH_SNAPSHOT', None), TopicGraph.load_snapshot),
+        (getattr(settings, 'POLLS_GRAPH_EDGE_LIST', None), TopicGraph.load_edge_list),
+    )
+    oldest = None
+    for path, load in sources:
+        if path:
+            try:
+                graph = load(path)
+                if oldest is None:
+                    oldest = TopicGraphChange.objects.order_by('id').values_list('id', flat=True).first() or 0
+                # Older than the pruned log, so it can't catch up.
+                if graph.generation < oldest - 1:
+                    continue
+                if graph.sync():
+                    return graph
+            except (OSError, ValueError, struct.error):
+                pass
+    return TopicGraph.load()
+
+
+def _write_snapshot_if_due():
+    # Caller holds _graph_lock. Rebuilding the CSR arrays and reading every
+    # title is too slow for an on_commit hook, so this only decides; the
+    # write happens on a thread of its own.
+    global _last_snapshot, _snapshot_writer
+    path = getattr(settings, 'POLLS_GRAPH_SNAPSHOT', None)
+    if not path or (_snapshot_writer is not None and _snapshot_writer.is_alive()):
+        return False
+    written_at, generation = _last_snapshot
+    current = _graph.generation if _graph is not None else None
+    interval = getattr(settings, 'POLLS_GRAPH_SNAPSHOT_INTERVAL', 300)
+    if interval is None or time.monotonic() - written_at < interval:
+        return False
+    if current is not None and current == generation:
+        return False
+    _last_snapshot = (time.monotonic(), current)
+    _snapshot_writer = threading.Thread(target=_write_snapshot_in_background, args=(path,), daemon=True)
+    _snapshot_writer.start()
+    return True
+
+
+def _write_snapshot_in_background(path):
+    try:
+        write_snapshot(path)
+    finally:
+        # The thread's own connection, which nothing else will close.
+        connection.close()
+
+
+def write_snapshot(path=None):
+    """Write the graph snapshot to `path` (default POLLS_GRAPH_SNAPSHOT).
+
+    Works from a graph loaded for the purpose, so it never holds
+    _graph_lock or touches the one requests use. False if there's no path
+    or the file couldn't be written.
+    """
+    path = path or getattr(settings, 'POLLS_GRAPH_SNAPSHOT', None)
+    if not path:
+        return False
+    graph = _load_graph()
+    try:
+        graph.write_snapshot(path, Topic.objects.order_by('id').values_list('id', 'title').iterator())
+    except OSError:
+        # Workers keep using the previous snapshot and catch up from the log.
+        return False
+    prune_changes()
+    return True
+
+
+def _saved_generation(path):
+    # Generation in the header of a snapshot or edge list; None if unreadable.
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(SNAPSHOT_HEADER.size)
+        if header[:4] == SNAPSHOT_MAGIC:
+            return SNAPSHOT_HEADER.unpack(header)[2]
+        if header[:4] == EDGE_LIST_MAGIC:
+            return EDGE_LIST_HEADER.unpack_from(header)[2]
+    except (OSError, struct.error):
+        pass
+    return None
+
+
+def prune_changes():
+    """Delete TopicGraphChange rows older than change_retention() that no
+    worker, snapshot or edge list still needs. Returns how many went.
+
+    The newest prunable row is kept, so a saved graph can tell it's behind
+    the log: its generation is below the oldest row's id minus one.
+    """
+    rows = TopicGraphChange.objects.filter(
+        created__lt=timezone.now() - timedelta(seconds=change_retention()))
+    # Workers loading these replay the log from their generation.
+    for path in (getattr(settings, 'POLLS_GRAPH_SNAPSHOT', None), getattr(settings, 'POLLS_GRAPH_EDGE_LIST', None)):
+        generation = _saved_generation(path) if path else None
+        if generation is not None:
+            rows = rows.filter(id__lte=generation + 1)
+    cutoff = rows.order_by('-id').values_list('id', flat=True).first()
+    if cutoff is None:
+        return 0
+    deleted, _ = TopicGraphChange.objects.filter(id__lt=cutoff).delete()
+    return deleted
+
+
+def sync_graph():
+    # Apply pending changes now, e.g. right after this process wrote some.
+    global _graph
+    with _graph_lock:
+        if _graph is not None and not _graph.sync():
+            _graph = None
+        _write_snapshot_if_due()
+
+
+def record_change(action, source_id=None, target_id=None, relation_type=None, weight=None):
+    TopicGraphChange.objects.create(
+        action=action, source_id=source_id, target_id=target_id,
+        relation_type=relation_type, weight=weight)
+    transaction.on_commit(sync_graph)
+
+
+def record_reload():
+    # For bulk writes (bulk_create, update(), raw SQL) that bypass signals.
+    record_change(Action.RELOAD)
+
+
+def reset_graph():
+    global _graph, _last_snapshot
+    with _graph_lock:
+        _graph = None
+        _last_snapshot = (0, None)
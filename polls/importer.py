@@ -0,0 +1,215 @@
+import csv
+import json
+import time
+
+from django.db import transaction
+from django.db.models import Max
+
+from .closure import maintains_closure, rebuild_closure
+from .graph import record_reload
+from .models import Resource, ResourceRelation, Topic, TopicRelation
+from .pagecache import invalidate_topics
+
+
+KINDS = ('topic', 'relation', 'resource', 'resource_relation')
+# Kinds whose pending rows must be written before a batch of each kind, so
+# that its titles resolve.
+NEEDS = {
+    'topic': (),
+    'relation': ('topic',),
+    'resource': ('topic',),
+    'resource_relation': ('topic', 'resource'),
+}
+
+
+# Between the topic titles of a CSV resource row's `topics` column.
+TOPICS_SEPARATOR = '|'
+
+
+def read_records(stream, fmt, kind=None):
+    """Yield record dicts from a JSONL or CSV text stream.
+
+    JSONL lines name their own "kind"; CSV files hold one kind, given by
+    `kind`, with a header row naming the fields. In CSV, a resource's
+    `topics` are titles separated by TOPICS_SEPARATOR.
+    """
+    if fmt == 'jsonl':
+        for line in stream:
+            if line.strip():
+                record = json.loads(line)
+                if kind is not None:
+                    record.setdefault('kind', kind)
+                yield record
+    elif fmt == 'csv':
+        if kind is None:
+            raise ValueError("CSV imports need a kind.")
+        for record in csv.DictReader(stream):
+            record['kind'] = kind
+            if 'topics' in record:
+                record['topics'] = [title for title in (record['topics'] or '').split(TOPICS_SEPARATOR) if title]
+            yield record
+    else:
+        raise ValueError(f"Unknown format {fmt!r}.")
+
+
+def relation_type(value):
+    if isinstance(value, str) and not value.isdigit():
+        return TopicRelation.RelationType[value.upper()]
+    return TopicRelation.RelationType(int(value))
+
+
+class GraphImporter:
+    """Bulk-loads topics, relations and resources from a stream of records.
+
+    Records are buffered per kind and written batch_size at a time, each
+    batch in its own transaction. Topics and resources are matched by
+    title through in-memory title -> id maps, which are the only state that
+    grows with the input; rows already present (by title, or by edge for
+    relations) are skipped, so an import can be rerun after a failure.
+    Signals are bypassed, so each batch that adds topics or relations logs
+    a graph reload in its own transaction, and `close()` rebuilds the
+    closure table at the end (or after a failure).
+    """
+
+    def __init__(self, batch_size=5000, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.topic_ids = dict(Topic.objects.values_list('title', 'id'))
+        self.resource_ids = dict(Resource.objects.values_list('title', 'id'))
+        # Only topics that existed before can have cached pages to expire.
+        self.old_topic_max = Topic.objects.aggregate(high=Max('id'))['high'] or 0
+        self.pending = {kind: [] for kind in KINDS}
+        self.created = dict.fromkeys(KINDS, 0)
+        self.skipped = dict.fromkeys(KINDS, 0)
+        self.read = 0
+        self.start = time.monotonic()
+
+    def add(self, record):
+        kind = record.get('kind')
+        if kind not in self.pending:
+            raise ValueError(f"Unknown record kind {kind!r}.")
+        self.pending[kind].append(record)
+        self.read += 1
+        if len(self.pending[kind]) >= self.batch_size:
+            self.flush(kind)
+        if self.progress and self.read % (self.batch_size * 10) == 0:
+            self.progress(self)
+
+    def import_records(self, records):
+        for record in records:
+            self.add(record)
+
+    def flush(self, kind):
+        for needed in NEEDS[kind]:
+            self.flush(needed)
+        records, self.pending[kind] = self.pending[kind], []
+        if not records:
+            return
+        with transaction.atomic():
+            created = self.created[kind]
+            getattr(self, f'_import_{kind}s')(records)
+            if kind in ('topic', 'relation') and self.created[kind] > created:
+                record_reload()
+
+    def finish(self):
+        for kind in KINDS:
+            self.flush(kind)
+        self.close()
+        return self.created
+
+    def close(self):
+        # Also called when an import fails partway; its committed batches stay.
+        if self.created['relation'] and maintains_closure():
+            transaction.on_commit(rebuild_closure)
+
+    @property
+    def rate(self):
+        return self.read / max(time.monotonic() - self.start, 1e-9)
+
+    def _create_named(self, model, ids, rows):
+        created = model.objects.bulk_create(rows)
+        missing = []
+        for row in created:
+            if row.pk is None:
+                missing.append(row.title)
+            else:
+                ids[row.title] = row.pk
+        # Backends that don't return ids from bulk inserts.
+        if missing:
+            ids.update(model.objects.filter(title__in=missing).values_list('title', 'id'))
+        return len(created)
+
+    def _import_topics(self, records):
+        rows, seen = [], set()
+        for record in records:
+            title = record['title']
+            if title in self.topic_ids or title in seen:
+                self.skipped['topic'] += 1
+                continue
+            seen.add(title)
+            rows.append(Topic(title=title))
+        self.created['topic'] += self._create_named(Topic, self.topic_ids, rows)
+
+    def _import_resources(self, records):
+        rows, seen, links = [], set(), []
+        for record in records:
+            title = record['title']
+            topics = record.get('topics') or ()
+            for topic in [topics] if isinstance(topics, str) else topics:
+                links.append({'resource': title, 'topic': topic})
+            if title in self.resource_ids or title in seen:
+                self.skipped['resource'] += 1
+                continue
+            seen.add(title)
+            rows.append(Resource(title=title, author=record.get('author', ''), link=record.get('link', '')))
+        self.created['resource'] += self._create_named(Resource, self.resource_ids, rows)
+        if links:
+            self._import_resource_relations(links)
+
+    def _import_relations(self, records):
+        edges, resolved = {}, 0
+        for record in records:
+            source = self.topic_ids.get(record['source'])
+            target = self.topic_ids.get(record['target'])
+            if source is None or target is None:
+                self.skipped['relation'] += 1
+                continue
+            resolved += 1
+            key = (source, target, relation_type(record.get('relation_type', 'prereq_of')))
+            weight = record.get('weight')
+            edges.setdefault(key, 1.0 if weight in (None, '') else float(weight))
+        existing = set(TopicRelation.objects.filter(
+            source__in=set(source for source, _, _ in edges),
+            target__in=set(target for _, target, _ in edges),
+        ).values_list('source_id', 'target_id', 'relation_type'))
+        rows = [
+            TopicRelation(source_id=source, target_id=target, relation_type=kind, weight=weight)
+            for (source, target, kind), weight in edges.items() if (source, target, kind) not in existing
+        ]
+        TopicRelation.objects.bulk_create(rows, ignore_conflicts=True)
+        self.created['relation'] += len(rows)
+        self.skipped['relation'] += resolved - len(rows)
+        invalidate_topics(*(i for row in rows for i in (row.source_id, row.target_id) if i <= self.old_topic_max))
+
+    def _import_resource_relations(self, records):
+        links, resolved = {}, 0
+        for record in records:
+            resource = self.resource_ids.get(record['resource'])
+            topic = self.topic_ids.get(record['topic'])
+            if resource is None or topic is None:
+                self.skipped['resource_relation'] += 1
+                continue
+            resolved += 1
+            links.setdefault((resource, topic), int(record.get('votes') or 0))
+        existing = set(ResourceRelation.objects.filter(
+            resource__in=set(resource for resource, _ in links),
+            topic__in=set(topic for _, topic in links),
+        ).values_list('resource_id', 'topic_id'))
+        rows = [
+            ResourceRelation(resource_id=resource, topic_id=topic, votes=votes)
+            for (resource, topic), votes in links.items() if (resource, topic) not in existing
+        ]
+        ResourceRelation.objects.bulk_create(rows, ignore_conflicts=True)
+        self.created['resource_relation'] += len(rows)
+        self.skipped['resource_relation'] += resolved - len(rows)
+        invalidate_topics(*(row.topic_id for row in rows if row.topic_id <= self.old_topic_max))
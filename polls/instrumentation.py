@@ -0,0 +1,182 @@
+from contextlib import contextmanager
+import contextvars
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('polls_request_metrics', default=None)
+
+
+class RequestMetrics:
+    """What a request (or an `instrument()` block) cost.
+
+    Times are in seconds. `nodes` and `edges` are how many topics and edges
+    the graph traversals visited.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.nodes = 0
+        self.edges = 0
+        self.render_time = 0.0
+        self.total_time = 0.0
+
+    def merge(self, other):
+        self.queries += other.queries
+        self.db_time += other.db_time
+        self.nodes += other.nodes
+        self.edges += other.edges
+        self.render_time += other.render_time
+
+    def as_dict(self):
+        return {
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 3),
+            'graph_nodes': self.nodes,
+            'graph_edges': self.edges,
+            'render_ms': round(self.render_time * 1000, 3),
+            'total_ms': round(self.total_time * 1000, 3),
+        }
+
+    def server_timing(self):
+        # Durations are in milliseconds, as the header wants.
+        return ", ".join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'graph;desc="{self.nodes} nodes, {self.edges} edges"',
+            f'render;dur={self.render_time * 1000:.1f}',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ])
+
+
+def current_metrics():
+    return _current.get()
+
+
+def count_traversal(nodes, edges):
+    # Called once per traversal by polls.graph, not per edge.
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.nodes += nodes
+        metrics.edges += edges
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - start
+
+
+def _wrap(connection):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    # Connections are per thread, and the async ORM uses its own, so every
+    # connection gets the wrapper as it opens. It does nothing outside
+    # instrument().
+    _wrap(connection)
+
+
+@contextmanager
+def instrument(name=None):
+    """Collect RequestMetrics for the block, and log them if `name` is given.
+
+    Counts whatever runs in this context, including sync_to_async threads
+    started from it. A nested block's numbers are added to the outer one's.
+    """
+    for connection in connections.all(initialized_only=True):
+        _wrap(connection)
+    outer = _current.get()
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    start = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        metrics.total_time = time.perf_counter() - start
+        _current.reset(token)
+        if outer is not None:
+            outer.merge(metrics)
+        if name is not None:
+            log_metrics(name, metrics)
+
+
+def log_metrics(name, metrics, **fields):
+    """Log `metrics` as one record, in logfmt in the message and as a
+    `metrics` dict on the record for structured handlers.
+
+    At INFO, or WARNING past POLLS_SLOW_REQUEST_MS.
+    """
+    data = dict(fields, **metrics.as_dict())
+    slow = getattr(settings, 'POLLS_SLOW_REQUEST_MS', None)
+    level = logging.WARNING if slow is not None and data['total_ms'] >= slow else logging.INFO
+    if logger.isEnabledFor(level):
+        logger.log(
+            level, "%s %s", name, " ".join(f"{key}={value}" for key, value in data.items()),
+            extra={'metrics': data})
+
+
+class InstrumentationMiddleware:
+    """Measures each request with instrument(), adds a Server-Timing header
+    (unless POLLS_SERVER_TIMING is off) and logs the numbers.
+
+    Render time is measured around TemplateResponse.render(), so queries
+    made from templates are counted in both db and render.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with instrument() as metrics:
+            response = self.get_response(request)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        with instrument() as metrics:
+            response = await self.get_response(request)
+        return self.finish(request, response, metrics)
+
+    def process_template_response(self, request, response):
+        metrics = _current.get()
+        if metrics is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                metrics.render_time += time.perf_counter() - start
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, metrics):
+        if getattr(settings, 'POLLS_SERVER_TIMING', True):
+            response['Server-Timing'] = metrics.server_timing()
+        match = request.resolver_match
+        log_metrics(
+            "request", metrics, method=request.method, path=request.path,
+            view=match.view_name if match else None, status=response.status_code)
+        return response
@@ -0,0 +1,228 @@
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+import struct
+import sys
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .models import KnownTopicsVersion, UserKnowledge
+
+
+ARRAY_LIMIT = 4096  # ids per chunk past which a bitmap is smaller than an array
+BITMAP_BYTES = 1 << 13  # one bit for each of the 65536 ids in a chunk
+
+_CHUNK_HEADER = struct.Struct('<IBI')  # high bits, is bitmap, count
+
+
+class KnownTopics:
+    """A set of topic ids, stored roaring-style.
+
+    Ids are split into chunks of 65536 by their high bits. A chunk is a
+    sorted array of the low 16 bits while it holds few ids, and becomes an
+    8 KiB bitmap once it holds more than ARRAY_LIMIT. A thousand known
+    topics take about 2 KB, where a set of ints takes around 60 KB.
+    Membership is a bitmap probe or a short bisect.
+    """
+
+    def __init__(self, ids=()):
+        self._chunks = {}  # high -> array('H') of sorted lows, or bytearray bitmap
+        self._len = 0
+        self.version = None
+        self.update(ids)
+
+    def __contains__(self, topic_id):
+        chunk = self._chunks.get(topic_id >> 16)
+        if chunk is None:
+            return False
+        low = topic_id & 0xFFFF
+        if isinstance(chunk, bytearray):
+            return bool(chunk[low >> 3] & (1 << (low & 7)))
+        i = bisect_left(chunk, low)
+        return i < len(chunk) and chunk[i] == low
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        # Ascending order.
+        for high in sorted(self._chunks):
+            base = high << 16
+            chunk = self._chunks[high]
+            if isinstance(chunk, bytearray):
+                for byte_index, byte in enumerate(chunk):
+                    while byte:
+                        bit = byte & -byte
+                        yield base | (byte_index << 3) | (bit.bit_length() - 1)
+                        byte ^= bit
+            else:
+                for low in chunk:
+                    yield base | low
+
+    def update(self, ids):
+        by_high = {}
+        for topic_id in ids:
+            by_high.setdefault(topic_id >> 16, set()).add(topic_id & 0xFFFF)
+        for high, lows in by_high.items():
+            chunk = self._chunks.get(high)
+            if isinstance(chunk, bytearray):
+                for low in lows:
+                    if not chunk[low >> 3] & (1 << (low & 7)):
+                        chunk[low >> 3] |= 1 << (low & 7)
+                        self._len += 1
+                continue
+            old = len(chunk) if chunk is not None else 0
+            lows.update(chunk or ())
+            self._len += len(lows) - old
+            if len(lows) > ARRAY_LIMIT:
+                bitmap = bytearray(BITMAP_BYTES)
+                for low in lows:
+                    bitmap[low >> 3] |= 1 << (low & 7)
+                self._chunks[high] = bitmap
+            else:
+                self._chunks[high] = array('H', sorted(lows))
+
+    def add(self, topic_id):
+        self.update((topic_id,))
+
+    def to_bytes(self):
+        parts = []
+        for high, chunk in sorted(self._chunks.items()):
+            if isinstance(chunk, bytearray):
+                parts.append(_CHUNK_HEADER.pack(high, 1, bin(int.from_bytes(chunk, 'little')).count('1')))
+                parts.append(bytes(chunk))
+            else:
+                parts.append(_CHUNK_HEADER.pack(high, 0, len(chunk)))
+                lows = array('H', chunk)
+                if sys.byteorder == 'big':
+                    lows.byteswap()
+                parts.append(lows.tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        known = cls()
+        pos = 0
+        while pos < len(data):
+            high, is_bitmap, count = _CHUNK_HEADER.unpack_from(data, pos)
+            pos += _CHUNK_HEADER.size
+            if is_bitmap:
+                known._chunks[high] = bytearray(data[pos:pos + BITMAP_BYTES])
+                pos += BITMAP_BYTES
+            else:
+                lows = array('H', data[pos:pos + 2 * count])
+                if sys.byteorder == 'big':
+                    lows.byteswap()
+                known._chunks[high] = lows
+                pos += 2 * count
+            known._len += count
+        return known
+
+
+# Each user's set is cached under their KnownTopicsVersion, which is kept in
+# the DB (like the graph's TopicGraphChange generation) so every worker sees
+# a bump as soon as it commits, whatever cache backend is configured. A
+# cached set is only ever read for the exact version it was loaded at.
+# Adding topics derives the new version's set from the previous one, so
+# marking a topic known doesn't cost a reload. Each process also keeps the
+# sets it used recently.
+
+_recent = OrderedDict()  # (user_id, version) -> KnownTopics
+_recent_lock = threading.Lock()
+
+
+def _data_key(user_id, version):
+    return f"known-topics:{user_id}:{version}"
+
+
+def _timeout():
+    return getattr(settings, 'POLLS_KNOWN_TOPICS_TTL', 86400)
+
+
+def known_topics_version(user_id):
+    return KnownTopicsVersion.objects.filter(user=user_id).values_list('version', flat=True).first() or 0
+
+
+def _remember(user_id, known):
+    with _recent_lock:
+        _recent[user_id, known.version] = known
+        _recent.move_to_end((user_id, known.version))
+        while len(_recent) > getattr(settings, 'POLLS_KNOWN_TOPICS_LOCAL', 1000):
+            _recent.popitem(last=False)
+
+
+def _cached(user_id, version):
+    with _recent_lock:
+        known = _recent.get((user_id, version))
+    if known is None:
+        data = cache.get(_data_key(user_id, version))
+        if data is not None:
+            known = KnownTopics.from_bytes(data)
+            known.version = version
+            _remember(user_id, known)
+    return known
+
+
+def _store(user_id, known):
+    cache.set(_data_key(user_id, known.version), known.to_bytes(), _timeout())
+    _remember(user_id, known)
+
+
+def get_known_topics(user_id):
+    """The ids of the topics `user_id` knows, as a KnownTopics.
+
+    One query for the version when the set is cached. The result may be
+    shared with other requests; don't modify it.
+    """
+    if not user_id:
+        return KnownTopics()
+    version = known_topics_version(user_id)
+    known = _cached(user_id, version)
+    if known is None:
+        # Read after the version, so this is at least as new as `version`;
+        # anything newer comes with a higher version of its own.
+        known = KnownTopics(UserKnowledge.objects.filter(user=user_id).values_list('topic_id', flat=True))
+        known.version = version
+        _store(user_id, known)
+    return known
+
+
+def _bump(user_id):
+    # Must run in the transaction making the change; the row lock orders
+    # concurrent writers, so each gets its own version.
+    versions = KnownTopicsVersion.objects.filter(user=user_id)
+    if not versions.update(version=F('version') + 1):
+        _, created = KnownTopicsVersion.objects.get_or_create(user_id=user_id, defaults={'version': 1})
+        if not created:
+            versions.update(version=F('version') + 1)
+    return versions.values_list('version', flat=True).get()
+
+
+def _add_known(user_id, version, topic_ids):
+    # Exactly these ids were added between `version - 1` and `version`.
+    previous = _cached(user_id, version - 1)
+    if previous is not None:
+        known = KnownTopics(previous)
+        known.update(topic_ids)
+        known.version = version
+        _store(user_id, known)
+
+
+def known_topics_added(user_id, topic_ids):
+    topic_ids = list(topic_ids)
+    version = _bump(user_id)
+    transaction.on_commit(lambda: _add_known(user_id, version, topic_ids))
+
+
+def known_topics_changed(user_id):
+    # For removals: the next read reloads from the DB.
+    _bump(user_id)
+
+
+def reset_known_topics():
+    with _recent_lock:
+        _recent.clear()
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from polls.aggregation import aggregate_votes
+
+
+class Command(BaseCommand):
+    help = ("Set TopicRelation weights from TopicRelationVotes. Only edges with new "
+            "votes since the last run are rescored unless --full is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Rescore every voted edge.")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        scored, changed = aggregate_votes(full=options['full'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Scored {scored} edges, changed {changed} weights in {time.monotonic() - start:.1f}s."))
@@ -0,0 +1,108 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, migrations
+from django.db.migrations.loader import MigrationLoader
+
+from polls import closure
+from polls.models import TopicRelation, UserKnowledge
+from polls.synthetic import generate_graph
+
+
+PREREQ_OF = TopicRelation.RelationType.PREREQ_OF
+CHILD_OF = TopicRelation.RelationType.CHILD_OF
+
+# The migration that added the composite indexes and unique constraints.
+# They're dropped and re-added on the current schema, rather than by
+# migrating back to before it, which would leave the models ahead of the
+# tables.
+MIGRATION = '0022_relation_indexes_and_constraints'
+
+
+class Command(BaseCommand):
+    help = ("Time the hot TopicRelation/UserKnowledge lookups on a synthetic graph without, then "
+            "with, the indexes and constraints of migration 0022. Runs in a throwaway test database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--topics', type=int, default=20000)
+        parser.add_argument('--edges-per-topic', type=int, default=5)
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--known', type=int, default=500, help="Known topics per user.")
+        parser.add_argument('--lookups', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, serialize=False)
+        try:
+            start = time.perf_counter()
+            topic_ids, user_ids = generate_graph(
+                options['topics'], options['edges_per_topic'], users=options['users'],
+                known_per_user=options['known'], seed=options['seed'])
+            self.stdout.write(
+                f"{len(topic_ids)} topics, {TopicRelation.objects.count()} relations, "
+                f"{UserKnowledge.objects.count()} known rows in {time.perf_counter() - start:.1f}s")
+
+            rng = random.Random(options['seed'])
+            sample = [(rng.choice(topic_ids), rng.choice(user_ids)) for _ in range(options['lookups'])]
+            # generate_graph makes the first 0.1% of topics hubs.
+            hubs = topic_ids[:max(1, len(topic_ids) // 1000)]
+            self.set_indexes(False)
+            before = self.time_lookups(sample, hubs)
+            start = time.perf_counter()
+            self.set_indexes(True)
+            self.stdout.write(f"Indexed in {time.perf_counter() - start:.1f}s")
+            after = self.time_lookups(sample, hubs)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(f"{'lookup':<24}{'before µs':>12}{'after µs':>12}{'speedup':>10}")
+        for name in before:
+            self.stdout.write(
+                f"{name:<24}{before[name]:>12.1f}{after[name]:>12.1f}{before[name] / after[name]:>9.1f}x")
+
+    def set_indexes(self, present):
+        loader = MigrationLoader(connection)
+        added = [
+            operation for operation in loader.get_migration('polls', MIGRATION).operations
+            if isinstance(operation, (migrations.AddIndex, migrations.AddConstraint))]
+        removed = [
+            migrations.RemoveIndex(operation.model_name, operation.index.name)
+            if isinstance(operation, migrations.AddIndex)
+            else migrations.RemoveConstraint(operation.model_name, operation.constraint.name)
+            for operation in added]
+        # Through the migration state, since SQLite rebuilds the table for a
+        # constraint change and would bring back whatever the models declare.
+        state = loader.project_state()
+        if present:
+            for operation in removed:
+                operation.state_forwards('polls', state)
+        with connection.schema_editor() as editor:
+            for operation in added if present else removed:
+                new_state = state.clone()
+                operation.state_forwards('polls', new_state)
+                operation.database_forwards('polls', editor, state, new_state)
+                state = new_state
+
+    def time_lookups(self, sample, hubs):
+        # Mean microseconds per call of each lookup over the sample.
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        lookups = {
+            'edges into topic': lambda t, u: list(TopicRelation.objects.filter(
+                target=t, relation_type=PREREQ_OF).values_list('source_id', flat=True)),
+            'edges out of topic': lambda t, u: list(TopicRelation.objects.filter(
+                source=t, relation_type=CHILD_OF).values_list('target_id', flat=True)),
+            'edges out of hub': lambda t, u: list(TopicRelation.objects.filter(
+                source=hubs[t % len(hubs)], relation_type=CHILD_OF).values_list('target_id', flat=True)),
+            'user knows topic': lambda t, u: UserKnowledge.objects.filter(user=u, topic=t).exists(),
+            'prereq closure (sql)': lambda t, u: list(closure.prereq_closure(t, u)),
+        }
+        timings = {}
+        for name, lookup in lookups.items():
+            calls = sample if 'closure' not in name else sample[:max(1, len(sample) // 100)]
+            start = time.perf_counter()
+            for topic_id, user_id in calls:
+                lookup(topic_id, user_id)
+            timings[name] = (time.perf_counter() - start) / len(calls) * 1e6
+        return timings
@@ -0,0 +1,57 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from polls.benchmark import CASES, run_benchmarks
+from polls.models import Resource, TopicRelation, UserKnowledge
+from polls.synthetic import generate_graph
+
+
+class Command(BaseCommand):
+    help = ("Time get_all_prereqs and the topic, search, list and user pages on a synthetic graph, "
+            "reporting query counts alongside. Runs in a throwaway test database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--topics', type=int, default=10000, help="1k up to about 1M is sensible.")
+        parser.add_argument('--edges-per-topic', type=int, default=5, help="Branching factor.")
+        parser.add_argument('--cycle-rate', type=float, default=0.01, help="Fraction of edges that point back.")
+        parser.add_argument('--resources-per-topic', type=int, default=2)
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--known', type=int, default=200, help="Known topics per user.")
+        parser.add_argument('--goals', type=int, default=5, help="Goals per user.")
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--case', action='append', choices=CASES, help="Only run this case; may be repeated.")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, serialize=False)
+        try:
+            start = time.perf_counter()
+            topic_ids, user_ids = generate_graph(
+                options['topics'], options['edges_per_topic'], users=max(1, options['users']),
+                known_per_user=options['known'], goals_per_user=options['goals'], seed=options['seed'],
+                cycle_rate=options['cycle_rate'], resources_per_topic=options['resources_per_topic'])
+            if not options['json']:
+                self.stdout.write(
+                    f"{len(topic_ids)} topics, {TopicRelation.objects.count()} relations, "
+                    f"{Resource.objects.count()} resources, {UserKnowledge.objects.count()} known rows "
+                    f"in {time.perf_counter() - start:.1f}s")
+            results = run_benchmarks(topic_ids, user_ids, options['repeat'], options['seed'], options['case'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['json']:
+            self.stdout.write(json.dumps({name: result.as_dict() for name, result in results.items()}, indent=2))
+            return
+        self.stdout.write(f"{'case':<18}{'median ms':>11}{'p95 ms':>10}{'queries':>9}{'graph nodes':>13}")
+        for name, result in results.items():
+            row = result.as_dict()
+            self.stdout.write(
+                f"{name:<18}{row['median_ms']:>11.2f}{row['p95_ms']:>10.2f}"
+                f"{row['max_queries']:>9}{row['mean_graph_nodes']:>13.1f}")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.closure import check_closure
+
+
+class Command(BaseCommand):
+    help = "Compare the TopicClosure table against a live traversal of TopicRelation."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--show', type=int, default=10, help="Pairs to print per problem.")
+
+    def handle(self, *args, **options):
+        missing, extra, wrong = check_closure()
+        for label, pairs in (("missing", missing), ("extra", extra), ("wrong depth/type", wrong)):
+            if pairs:
+                self.stdout.write(f"{len(pairs)} {label} (ancestor, descendant) pairs: "
+                                  f"{pairs[:options['show']]}")
+        if missing or extra or wrong:
+            raise CommandError("TopicClosure is out of date; run rebuild_topic_closure.")
+        self.stdout.write(self.style.SUCCESS("TopicClosure is consistent."))
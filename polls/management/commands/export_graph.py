@@ -0,0 +1,36 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand
+
+from polls.export import FORMATS
+
+
+class Command(BaseCommand):
+    help = ("Write every topic, relation and resource as JSONL (which import_graph reads), "
+            "or the topic graph as a binary edge list (which POLLS_GRAPH_EDGE_LIST loads).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Output file, or '-' for stdout.")
+        parser.add_argument('--format', choices=sorted(FORMATS), default='jsonl')
+        parser.add_argument('--chunk-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        export = FORMATS[options['format']][0]
+        chunks = export(options['chunk_size']) if options['chunk_size'] else export()
+        binary = options['format'] != 'jsonl'
+
+        if options['path'] == '-':
+            out = sys.stdout.buffer if binary else sys.stdout
+            for chunk in chunks:
+                out.write(chunk)
+            return
+
+        # Write next to the target and rename, so readers never see half a file.
+        tmp_path = f"{options['path']}.tmp"
+        with open(tmp_path, 'wb' if binary else 'w', **({} if binary else {'encoding': 'utf-8'})) as out:
+            for chunk in chunks:
+                out.write(chunk)
+        os.replace(tmp_path, options['path'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {os.path.getsize(options['path'])} bytes to {options['path']}."))
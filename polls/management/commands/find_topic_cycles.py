@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from polls.graph import TopicGraph
+from polls.models import Topic, TopicComponent
+
+
+class Command(BaseCommand):
+    help = ("Find prereq/child cycles (strongly connected components) in TopicRelation. "
+            "Cheap enough to run from cron with --save to keep TopicComponent, the list of "
+            "cycles shown in the admin, current.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--save', action='store_true', help="Replace the stored TopicComponent rows.")
+        parser.add_argument('--show', type=int, default=20, help="Cycles to print.")
+
+    def handle(self, *args, **options):
+        graph = TopicGraph.load()
+        components = graph.strongly_connected_components()
+        _, condensed = graph.condensation()
+
+        edge_count = sum(1 for _ in graph.edges())
+        condensed_edge_count = sum(1 for _ in condensed.edges())
+        self.stdout.write(
+            f"{len(graph)} topics / {edge_count} relations, condensed to "
+            f"{len(condensed)} topics / {condensed_edge_count} relations.")
+
+        shown = components[:options['show']]
+        titles = Topic.objects.in_bulk([t for component in shown for t in component])
+        for component in shown:
+            self.stdout.write(f"cycle of {len(component)}: " + ", ".join(
+                str(titles.get(t, t)) for t in component))
+        if len(components) > len(shown):
+            self.stdout.write(f"... and {len(components) - len(shown)} more.")
+
+        if options['save']:
+            with transaction.atomic():
+                TopicComponent.objects.all().delete()
+                TopicComponent.objects.bulk_create([
+                    TopicComponent(topic_id=topic_id, component_id=component[0])
+                    for component in components
+                    for topic_id in component
+                ], batch_size=1000)
+
+        if components:
+            self.stdout.write(self.style.WARNING(f"Found {len(components)} cycles."))
+        else:
+            self.stdout.write(self.style.SUCCESS("No cycles found."))
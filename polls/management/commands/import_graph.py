@@ -0,0 +1,44 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.importer import KINDS, TOPICS_SEPARATOR, GraphImporter, read_records
+
+
+class Command(BaseCommand):
+    help = ("Bulk-load topics, relations and resources from JSONL or CSV files "
+            "('-' reads stdin). JSONL records carry a \"kind\" of "
+            + ", ".join(KINDS) + "; CSV files hold one kind, given with --kind, and separate a "
+            f"resource's topics with {TOPICS_SEPARATOR!r}.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+')
+        parser.add_argument('--format', choices=['jsonl', 'csv'],
+                            help="Defaults to each file's extension, or jsonl.")
+        parser.add_argument('--kind', choices=KINDS)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def progress(self, importer):
+        self.stderr.write(f"{importer.read} records read ({importer.rate:.0f}/s)")
+
+    def handle(self, *args, **options):
+        importer = GraphImporter(batch_size=options['batch_size'], progress=self.progress)
+        path = None
+        try:
+            for path in options['paths']:
+                fmt = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+                if path == '-':
+                    importer.import_records(read_records(sys.stdin, fmt, options['kind']))
+                else:
+                    with open(path, newline='', encoding='utf-8') as stream:
+                        importer.import_records(read_records(stream, fmt, options['kind']))
+            created = importer.finish()
+        except (OSError, ValueError, KeyError) as e:
+            # Records still buffered when it failed may be from any file.
+            importer.close()
+            raise CommandError(f"{path}: {e!r}")
+
+        for kind in KINDS:
+            self.stdout.write(f"{kind}: {created[kind]} created, {importer.skipped[kind]} skipped")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {importer.read} records at {importer.rate:.0f}/s."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from polls.graph import prune_changes
+
+
+class Command(BaseCommand):
+    help = ("Delete TopicGraphChange rows older than settings.POLLS_GRAPH_CHANGE_RETENTION that the "
+            "graph snapshot and edge list no longer need. write_graph_snapshot does this too.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f"Deleted {prune_changes()} graph changes."))
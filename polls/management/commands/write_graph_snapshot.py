@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.graph import write_snapshot
+
+
+class Command(BaseCommand):
+    help = "Write the topic graph snapshot at settings.POLLS_GRAPH_SNAPSHOT for workers to mmap."
+
+    def handle(self, *args, **options):
+        path = getattr(settings, 'POLLS_GRAPH_SNAPSHOT', None)
+        if not path:
+            raise CommandError("POLLS_GRAPH_SNAPSHOT is not set.")
+        if not write_snapshot():
+            raise CommandError(f"Couldn't write {path}.")
+        self.stdout.write(self.style.SUCCESS(f"Wrote {path}."))
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0014_remove_resource_topic_remove_resource_votes_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopicGraphChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.IntegerField(choices=[(1, 'Edge Added'), (2, 'Edge Removed'), (3, 'Topic Saved'), (4, 'Topic Deleted'), (5, 'Reload')])),
+                ('source_id', models.BigIntegerField(null=True)),
+                ('target_id', models.BigIntegerField(null=True)),
+                ('relation_type', models.IntegerField(choices=[(1, 'Child Of'), (2, 'Prereq Of')], null=True)),
+                ('weight', models.FloatField(null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0015_topicgraphchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopicClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('via_type', models.IntegerField(choices=[(1, 'Child Of'), (2, 'Prereq Of')])),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='closure_descendants', to='polls.topic')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='closure_ancestors', to='polls.topic')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='topicclosure',
+            constraint=models.UniqueConstraint(fields=('descendant', 'ancestor'), name='unique_topic_closure'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0016_topicclosure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopicComponent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('component', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='component_members', to='polls.topic')),
+                ('topic', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='component_membership', to='polls.topic')),
+            ],
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+import polls.models
+
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE polls_topic_fts USING fts5("
+    "title, content='polls_topic', content_rowid='id', prefix='2 3')",
+    "CREATE TRIGGER polls_topic_fts_insert AFTER INSERT ON polls_topic BEGIN "
+    "INSERT INTO polls_topic_fts(rowid, title) VALUES (new.id, new.title); END",
+    "CREATE TRIGGER polls_topic_fts_delete AFTER DELETE ON polls_topic BEGIN "
+    "INSERT INTO polls_topic_fts(polls_topic_fts, rowid, title) VALUES ('delete', old.id, old.title); END",
+    "CREATE TRIGGER polls_topic_fts_update AFTER UPDATE OF title ON polls_topic BEGIN "
+    "INSERT INTO polls_topic_fts(polls_topic_fts, rowid, title) VALUES ('delete', old.id, old.title); "
+    "INSERT INTO polls_topic_fts(rowid, title) VALUES (new.id, new.title); END",
+    "INSERT INTO polls_topic_fts(polls_topic_fts) VALUES ('rebuild')",
+]
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS polls_topic_fts_insert",
+    "DROP TRIGGER IF EXISTS polls_topic_fts_delete",
+    "DROP TRIGGER IF EXISTS polls_topic_fts_update",
+    "DROP TABLE IF EXISTS polls_topic_fts",
+]
+
+# PostgreSQL indexes the title expressions polls.search queries instead.
+POSTGRESQL_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX polls_topic_title_tsv ON polls_topic USING gin (to_tsvector('simple', title))",
+    "CREATE INDEX polls_topic_title_trgm ON polls_topic USING gin (title gin_trgm_ops)",
+]
+POSTGRESQL_REVERSE = [
+    "DROP INDEX IF EXISTS polls_topic_title_tsv",
+    "DROP INDEX IF EXISTS polls_topic_title_trgm",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0017_topiccomponent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopicSearchIndex',
+            fields=[
+                ('topic', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='polls.topic')),
+                ('title', polls.models.FullTextField()),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'polls_topic_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(
+            run_for_vendor({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD}),
+            run_for_vendor({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRESQL_REVERSE}),
+        ),
+    ]
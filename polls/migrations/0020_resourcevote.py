@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:53
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('polls', '0019_topic_title_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceVote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resource_relation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.resourcerelation')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='resourcevote',
+            constraint=models.UniqueConstraint(fields=('user', 'resource_relation'), name='unique_resource_vote'),
+        ),
+    ]
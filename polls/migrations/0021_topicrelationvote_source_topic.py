@@ -0,0 +1,48 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0020_resourcevote'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='topicrelationvote',
+            old_name='source',
+            new_name='origin',
+        ),
+        migrations.AlterField(
+            model_name='topicrelationvote',
+            name='origin',
+            field=models.CharField(default='user', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='topicrelationvote',
+            name='source',
+            # Existing votes never recorded their source (the old model
+            # declared `source` twice and only the CharField stuck), so they
+            # keep a null one and aren't scored.
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='source_votes', to='polls.topic'),
+        ),
+        migrations.AlterField(
+            model_name='topicrelationvote',
+            name='target',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='target_votes', to='polls.topic'),
+        ),
+        migrations.AddIndex(
+            model_name='topicrelationvote',
+            index=models.Index(fields=['source', 'target', 'relation_type'], name='relation_vote_edge'),
+        ),
+        migrations.CreateModel(
+            name='AggregationWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:05
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def delete_duplicates(apps, schema_editor):
+    # Keep the oldest row of each group the new constraints make unique.
+    for model_name, fields in (
+        ('TopicRelation', ('source', 'relation_type', 'target')),
+        ('UserGoal', ('user', 'topic')),
+        ('UserKnowledge', ('user', 'topic')),
+    ):
+        model = apps.get_model('polls', model_name)
+        groups = model.objects.values(*fields).annotate(keep=Min('id'), count=Count('id')).filter(count__gt=1)
+        for group in groups.iterator():
+            keep = group.pop('keep')
+            del group['count']
+            model.objects.filter(**group).exclude(id=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0021_topicrelationvote_source_topic'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='topicrelation',
+            index=models.Index(fields=['target', 'relation_type'], name='topic_relation_in'),
+        ),
+        migrations.AddConstraint(
+            model_name='topicrelation',
+            constraint=models.UniqueConstraint(fields=('source', 'relation_type', 'target'), name='unique_topic_relation'),
+        ),
+        migrations.AddConstraint(
+            model_name='usergoal',
+            constraint=models.UniqueConstraint(fields=('user', 'topic'), name='unique_user_goal'),
+        ),
+        migrations.AddConstraint(
+            model_name='userknowledge',
+            constraint=models.UniqueConstraint(fields=('user', 'topic'), name='unique_user_knowledge'),
+        ),
+    ]
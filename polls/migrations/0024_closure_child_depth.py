@@ -0,0 +1,62 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:27
+
+from django.db import migrations, models
+
+
+CHILD_OF, PREREQ_OF = 1, 2
+
+
+def rebuild_closure(apps, schema_editor):
+    # Depths of child-reached rows used to count child edges only, so
+    # rebuild the table (if it's in use) from TopicRelation.
+    TopicClosure = apps.get_model('polls', 'TopicClosure')
+    TopicRelation = apps.get_model('polls', 'TopicRelation')
+    if not TopicClosure.objects.exists():
+        return
+    sources = {}
+    for source, target, relation_type in TopicRelation.objects.filter(
+            relation_type__in=(PREREQ_OF, CHILD_OF)).values_list('source_id', 'target_id', 'relation_type'):
+        sources.setdefault(target, []).append((source, relation_type))
+
+    def reach(topic_id, types):
+        depths, frontier, depth = {}, [topic_id], 0
+        while frontier:
+            depth += 1
+            next_frontier = []
+            for curr in frontier:
+                for source, relation_type in sources.get(curr, ()):
+                    if relation_type in types and source not in depths:
+                        depths[source] = depth
+                        next_frontier.append(source)
+            frontier = next_frontier
+        return depths
+
+    TopicClosure.objects.all().delete()
+    rows = []
+    for topic_id in sources:
+        child_depths = reach(topic_id, (CHILD_OF,))
+        rows.extend(
+            TopicClosure(ancestor_id=ancestor, descendant_id=topic_id, depth=depth,
+                         child_depth=child_depths.get(ancestor))
+            for ancestor, depth in reach(topic_id, (PREREQ_OF, CHILD_OF)).items())
+    TopicClosure.objects.bulk_create(rows, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0023_knowntopicsversion'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='topicclosure',
+            name='via_type',
+        ),
+        migrations.AddField(
+            model_name='topicclosure',
+            name='child_depth',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(rebuild_closure, migrations.RunPython.noop),
+    ]
@@ -15,10 +15,46 @@ class Topic(models.Model):
     # resources = models.ManyToManyField(Resource)
     # ehh, maybe just keep as foreign key - otherwise hard to keep track of topic-specific date for a resource
 
+    class Meta:
+        indexes = [
+            # Backs keyset pagination of the topic list.
+            models.Index(fields=['title', 'id'], name='topic_title_id'),
+        ]
+
     def __str__(self):
         return self.title
 
 
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", lhs_params + rhs_params
+
+
+class FullTextField(models.TextField):
+    pass
+
+
+FullTextField.register_lookup(Match)
+
+
+# SQLite FTS5 index over Topic.title, kept in sync by triggers (see
+# migration 0018). Only exists on SQLite; see polls.search.
+class TopicSearchIndex(models.Model):
+    topic = models.OneToOneField(
+        Topic, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid', related_name="search_index")
+    title = FullTextField()
+    # FTS5's hidden bm25 column; lower is a better match.
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'polls_topic_fts'
+
+
 # TODO: investigate performance of this vs. ManyToMany version.
 class TopicRelation(models.Model):
     source = models.ForeignKey(Topic, on_delete=models.CASCADE, related_name="source_topic")
@@ -33,18 +69,67 @@ class TopicRelation(models.Model):
     # Created by processing TopicRelationVotes.
     weight = models.FloatField(default=1)
 
+    class Meta:
+        constraints = [
+            # Also the index for "edges of this type out of a topic".
+            models.UniqueConstraint(fields=['source', 'relation_type', 'target'], name='unique_topic_relation'),
+        ]
+        indexes = [
+            models.Index(fields=['target', 'relation_type'], name='topic_relation_in'),
+        ]
+
     def __str__(self):
         return f"{self.source} -> {self.target}"
 
 
+# Materialized ancestor closure of the prereq/child graph: a row for every
+# topic (ancestor) that some topic (descendant) needs, kept up to date by
+# polls.closure when TopicRelation changes.
+class TopicClosure(models.Model):
+    ancestor = models.ForeignKey(Topic, on_delete=models.CASCADE, related_name="closure_descendants")
+    descendant = models.ForeignKey(Topic, on_delete=models.CASCADE, related_name="closure_ancestors")
+
+    # Fewest hops from descendant back to ancestor.
+    depth = models.PositiveIntegerField()
+    # Fewest hops using child edges alone, or None if there's no such path.
+    child_depth = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['descendant', 'ancestor'], name='unique_topic_closure'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} -({self.depth})-> {self.descendant_id}"
+
+
+# Topics that sit on a prereq/child cycle, grouped by strongly connected
+# component, for curators to find and break cycles in the admin. Written by
+# `manage.py find_topic_cycles --save`. Nothing reads it when answering
+# requests: the traversals work per topic on the cyclic graph, and depth()
+# condenses the live graph itself (see TopicGraph.depth).
+class TopicComponent(models.Model):
+    topic = models.OneToOneField(Topic, on_delete=models.CASCADE, related_name="component_membership")
+    # The component's topic with the smallest id, which names the cycle.
+    component = models.ForeignKey(Topic, on_delete=models.CASCADE, related_name="component_members")
+
+    def __str__(self):
+        return f"{self.topic} (cycle {self.component_id})"
+
+
 # should point to topicrelation? or no
+# Summed into TopicRelation.weight by polls.aggregation.
 class TopicRelationVote(models.Model):
-    source = models.ForeignKey(Topic, on_delete=models.CASCADE)
-    target = models.ForeignKey(Topic, on_delete=models.CASCADE)
+    # Null on votes from before it was recorded (see migration 0021); those
+    # are kept but never scored.
+    source = models.ForeignKey(Topic, on_delete=models.CASCADE, related_name="source_votes", null=True)
+    target = models.ForeignKey(Topic, on_delete=models.CASCADE, related_name="target_votes")
     relation_type = models.IntegerField(choices=TopicRelation.RelationType.choices)
 
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    source = models.CharField(max_length=200)
+    # Where the vote comes from; settings.POLLS_VOTE_ORIGIN_WEIGHTS says how
+    # much each kind counts.
+    origin = models.CharField(max_length=200, default='user')
     reason = models.TextField()
 
     # some possible vote sources
@@ -52,14 +137,34 @@ class TopicRelationVote(models.Model):
     # - references to textbooks / trustworthy sources
     # - also optionally a text description of why
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['source', 'target', 'relation_type'], name='relation_vote_edge'),
+        ]
+
     def __str__(self):
         return f"vote for {self.source} -> {self.target}"
 
 
+# How far a batch job has got through an append-only table, by id.
+class AggregationWatermark(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_id}"
+
+
 class UserGoal(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     topic = models.ForeignKey(Topic, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'topic'], name='unique_user_goal'),
+        ]
+
     def __str__(self):
         return f"{self.user} has goal of {self.topic}"
 
@@ -68,8 +173,23 @@ class UserKnowledge(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     topic = models.ForeignKey(Topic, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'topic'], name='unique_user_knowledge'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} knows {self.topic}"
+
+
+class KnownTopicsVersion(models.Model):
+    # Bumped in the same transaction as every change to the user's
+    # UserKnowledge rows. Cached known-topic sets are keyed by it.
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
     def __str__(self):
-        return f"{self.user} knows {self.target}"
+        return f"{self.user} v{self.version}"
 
 
 class Resource(models.Model):
@@ -91,3 +211,42 @@ class ResourceRelation(models.Model):
 
     def __str__(self):
         return f"({self.topic.title}) {self.resource.title}"
+
+
+# Append-only log of edits to the topic graph. Worker processes replay rows
+# past the id they last saw to patch their cached copy of the graph, so the
+# ids double as a DB-wide generation counter.
+class TopicGraphChange(models.Model):
+    class Action(models.IntegerChoices):
+        EDGE_ADDED = 1  # also used when an existing edge's weight changes
+        EDGE_REMOVED = 2
+        TOPIC_SAVED = 3
+        TOPIC_DELETED = 4
+        RELOAD = 5  # for bulk writes that skip signals
+    action = models.IntegerField(choices=Action.choices)
+
+    # Plain ids rather than foreign keys, the topics may be gone by now.
+    source_id = models.BigIntegerField(null=True)
+    target_id = models.BigIntegerField(null=True)
+    relation_type = models.IntegerField(choices=TopicRelation.RelationType.choices, null=True)
+    weight = models.FloatField(null=True)
+    # For pruning: rows older than POLLS_GRAPH_CHANGE_RETENTION can go.
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.get_action_display()} {self.source_id} -> {self.target_id}"
+
+
+# One row per user per resource they voted for, so nobody votes twice.
+# ResourceRelation.votes is the running total of these.
+class ResourceVote(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    resource_relation = models.ForeignKey(ResourceRelation, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'resource_relation'], name='unique_resource_vote'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} voted for {self.resource_relation_id}"
@@ -0,0 +1,65 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Q
+
+from .models import ResourceRelation, TopicRelation
+
+
+# Rendered topic pages are cached under a per-topic version that any write
+# touching the topic replaces, so stale entries are never read again and just
+# age out of the cache. The versions live in the same cache as the pages, so
+# it has to be shared between workers (see CACHES['topic_pages']). A version
+# is a fresh random token rather than a counter: backends like the file
+# cache have no atomic incr, and a token can't be lost to a concurrent bump
+# the way an increment can.
+
+
+def topic_cache():
+    return caches[getattr(settings, 'POLLS_TOPIC_CACHE', 'default')]
+
+
+def _version_key(topic_id):
+    return f"topic-version:{topic_id}"
+
+
+def _new_version():
+    return uuid.uuid4().hex
+
+
+def topic_version(topic_id):
+    cache = topic_cache()
+    version = cache.get(_version_key(topic_id))
+    if version is None:
+        cache.add(_version_key(topic_id), _new_version(), timeout=None)
+        version = cache.get(_version_key(topic_id))
+    return version
+
+
+def page_key(topic_id):
+    return f"topic-page:{topic_id}:{topic_version(topic_id)}"
+
+
+def bump_topic_versions(topic_ids):
+    topic_cache().set_many({_version_key(topic_id): _new_version() for topic_id in set(topic_ids)}, timeout=None)
+
+
+def invalidate_topics(*topic_ids):
+    # Wait for the commit, or a reader could cache the old rows under the new version.
+    transaction.on_commit(lambda: bump_topic_versions(topic_ids))
+
+
+def invalidate_neighbours(topic_id):
+    # Pages that show this topic's title as a neighbour.
+    neighbours = TopicRelation.objects.filter(
+        Q(source=topic_id) | Q(target=topic_id)
+    ).values_list('source_id', 'target_id')
+    invalidate_topics(topic_id, *(i for pair in neighbours for i in pair))
+
+
+def invalidate_resource(resource_id):
+    invalidate_topics(*ResourceRelation.objects.filter(
+        resource=resource_id
+    ).values_list('topic_id', flat=True))
@@ -0,0 +1,184 @@
+import base64
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import IntegerField, Q
+
+
+# Keyset ("cursor") pagination: pages are found by filtering on the sort
+# key of the last row seen, rather than with OFFSET, so deep pages cost the
+# same as the first one given an index on the keys.
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        return None
+    return values if isinstance(values, list) else None
+
+
+class KeysetPage:
+
+    def __init__(self, object_list, keys, has_next, has_previous, count=None):
+        self.object_list = object_list
+        self.keys = keys
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.count = count  # total rows (possibly an estimate), or None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def _cursor(self, obj):
+        return encode_cursor([getattr(obj, key.lstrip('-')) for key in self.keys])
+
+    def next_cursor(self):
+        return self._cursor(self.object_list[-1]) if self._has_next and self.object_list else None
+
+    def previous_cursor(self):
+        return self._cursor(self.object_list[0]) if self._has_previous and self.object_list else None
+
+
+class KeysetPaginator:
+    """Paginate `queryset` in order of `keys` (field names, '-' for descending).
+
+    The keys together have to be unique, so end them with 'id'.
+    """
+
+    def __init__(self, queryset, per_page, keys=('title', 'id'), count=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.keys = list(keys)
+        self.count = count
+
+    def _after(self, values, reverse=False):
+        # Rows past `values` in key order: (k1 > v1) OR (k1 = v1 AND k2 > v2) ...
+        condition = Q()
+        equal = {}
+        for key, value in zip(self.keys, values):
+            name = key.lstrip('-')
+            ascending = not key.startswith('-')
+            lookup = 'gt' if ascending != reverse else 'lt'
+            condition |= Q(**equal, **{f"{name}__{lookup}": value})
+            equal[name] = value
+        return condition
+
+    def _field(self, name):
+        annotation = self.queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        try:
+            return self.queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+    def _clean(self, values):
+        # The cursor's values converted to the keys' field types, or None if
+        # they don't fit.
+        if values is None or len(values) != len(self.keys):
+            return None
+        cleaned = []
+        for key, value in zip(self.keys, values):
+            if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+                return None
+            field = self._field(key.lstrip('-'))
+            if field is None:
+                if isinstance(value, int) and not self._fits(value, field):
+                    return None
+                cleaned.append(value)
+                continue
+            try:
+                value = field.to_python(value)
+            except ValidationError:
+                return None
+            if value is None or (isinstance(value, int) and not self._fits(value, field)):
+                return None
+            cleaned.append(value)
+        return cleaned
+
+    def _fits(self, value, field):
+        # SQLite reports no range, but can't bind anything past 64 bits either.
+        low, high = None, None
+        if isinstance(field, IntegerField):
+            low, high = connections[self.queryset.db].ops.integer_field_range(field.get_internal_type())
+        return (-2 ** 63 if low is None else low) <= value <= (2 ** 63 - 1 if high is None else high)
+
+    def _query(self, after, before):
+        # Rows after the `after` cursor, or (if given instead) before `before`.
+        # A bad cursor gives the first page.
+        values = self._clean(decode_cursor(before or after or ''))
+        backwards = values is not None and bool(before)
+
+        ordering = self.keys
+        if backwards:
+            ordering = [key[1:] if key.startswith('-') else '-' + key for key in self.keys]
+        queryset = self.queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._after(values, reverse=backwards))
+        return queryset[:self.per_page + 1], values is not None, backwards
+
+    def _page(self, rows, after_cursor, backwards):
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+            return KeysetPage(rows, self.keys, has_next=True, has_previous=more, count=self.count)
+        return KeysetPage(rows, self.keys, has_next=more, has_previous=after_cursor, count=self.count)
+
+    def page(self, after=None, before=None):
+        queryset, after_cursor, backwards = self._query(after, before)
+        rows = list(queryset)
+        if not rows and after_cursor:
+            # Nothing past the cursor (a stale link, or before the first
+            # row): show the first page instead.
+            return self.page()
+        return self._page(rows, after_cursor, backwards)
+
+    async def apage(self, after=None, before=None):
+        queryset, after_cursor, backwards = self._query(after, before)
+        rows = [row async for row in queryset]
+        if not rows and after_cursor:
+            return await self.apage()
+        return self._page(rows, after_cursor, backwards)
+
+
+def estimated_count(queryset, key, timeout=300):
+    # COUNT(*) is a full scan, so only run it every `timeout` seconds.
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
+
+
+class KeysetPaginationMixin:
+    """Keyset pagination for a ListView, driven by ?after= / ?before= cursors."""
+    paginate_keys = ('title', 'id')
+
+    def get_count(self, queryset):
+        # Total shown next to the page links; None to skip counting.
+        return None
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size, self.paginate_keys, self.get_count(queryset))
+        page = paginator.page(self.request.GET.get('after'), self.request.GET.get('before'))
+        return paginator, page, page.object_list, page.has_other_pages()
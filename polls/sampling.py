@@ -0,0 +1,52 @@
+import random
+import threading
+
+from django.db.models import Max, Min
+
+from .models import Topic
+
+
+BATCH_SIZE = 100
+
+
+def sample_topics(count, attempts=3):
+    """Up to `count` random topics, without reading the whole table.
+
+    Ids are drawn from the id range and fetched in one query; draws that
+    land in gaps (deleted topics) are redrawn a few times. Sparse tables can
+    come back short, and an empty one gives [].
+    """
+    bounds = Topic.objects.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return []
+
+    topics = {}
+    for _ in range(attempts):
+        wanted = count - len(topics)
+        if wanted <= 0:
+            break
+        # Overdraw a little to make up for gaps.
+        candidates = set(random.randint(bounds['low'], bounds['high']) for _ in range(wanted * 2))
+        for topic in Topic.objects.filter(id__in=candidates - topics.keys()).only('id', 'title'):
+            topics[topic.id] = topic
+    sample = list(topics.values())[:count]
+    random.shuffle(sample)
+    return sample
+
+
+_batch = []
+_batch_lock = threading.Lock()
+
+
+def random_topic():
+    # Served from a per-process batch of pre-sampled topics, so most calls
+    # don't query at all. None if there are no topics.
+    with _batch_lock:
+        if not _batch:
+            _batch.extend(sample_topics(BATCH_SIZE))
+        return _batch.pop() if _batch else None
+
+
+def reset_random_topics():
+    with _batch_lock:
+        _batch.clear()
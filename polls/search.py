@@ -0,0 +1,48 @@
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, Case, F, FloatField, IntegerField, Value, When
+from django.db.models.expressions import RawSQL
+
+from .models import Topic
+
+
+# Topic search, backed by the FTS5 table on SQLite and by the tsvector
+# index on PostgreSQL (both created in migration 0018). Every word of the
+# query has to prefix-match a word of the title. Results are ordered by
+# `prefix` (0 if the title starts with the query), then `rank` (lower is
+# better), then id.
+
+
+def search_terms(query):
+    return re.findall(r"\w+", query or "")
+
+
+def search_topics(query):
+    terms = search_terms(query)
+    if not terms:
+        # Annotated like a real result, so it can still be paginated.
+        return Topic.objects.none().annotate(
+            rank=Value(0.0, output_field=FloatField()), prefix=Value(1, output_field=IntegerField())
+        ).order_by('prefix', 'rank', 'id')
+
+    if connection.vendor == 'sqlite':
+        # Quoted, so words like AND/OR/NEAR are just words.
+        match = " ".join(f'"{term}"*' for term in terms)
+        topics = Topic.objects.filter(search_index__title__match=match).annotate(
+            rank=F('search_index__rank'))
+    elif connection.vendor == 'postgresql':
+        tsquery = " & ".join(f"{term}:*" for term in terms)
+        topics = Topic.objects.filter(RawSQL(
+            "to_tsvector('simple', polls_topic.title) @@ to_tsquery('simple', %s)",
+            [tsquery], output_field=BooleanField())
+        ).annotate(rank=RawSQL(
+            "-ts_rank(to_tsvector('simple', polls_topic.title), to_tsquery('simple', %s))",
+            [tsquery], output_field=FloatField()))
+    else:
+        topics = Topic.objects.filter(title__icontains=query).annotate(
+            rank=Value(0.0, output_field=FloatField()))
+
+    return topics.annotate(
+        prefix=Case(When(title__istartswith=query.strip(), then=0), default=1, output_field=IntegerField())
+    ).order_by('prefix', 'rank', 'id')
@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .aggregation import aggregate_votes
+from .closure import schedule_closure_update
+from .graph import Action, record_change
+from .knowledge import known_topics_added, known_topics_changed
+from .models import Resource, ResourceRelation, Topic, TopicRelation, TopicRelationVote, UserKnowledge
+from .pagecache import invalidate_neighbours, invalidate_resource, invalidate_topics
+from .suggest import update_suggest_index
+
+
+def _edge(relation):
+    return relation.source_id, relation.target_id, relation.relation_type
+
+
+def _record_removal(source_id, target_id, relation_type):
+    record_change(Action.EDGE_REMOVED, source_id, target_id, relation_type)
+    schedule_closure_update(source_id, target_id, relation_type, removed=True)
+
+
+@receiver(pre_save, sender=TopicRelation)
+def remember_old_edge(sender, instance, raw=False, **kwargs):
+    # An edit may move the edge, in which case the old one has to go.
+    instance._old_edge = None
+    if instance.pk and not raw:
+        instance._old_edge = TopicRelation.objects.filter(pk=instance.pk).values_list(
+            'source_id', 'target_id', 'relation_type').first()
+
+
+@receiver(post_save, sender=TopicRelation)
+def relation_saved(sender, instance, raw=False, **kwargs):
+    old_edge = getattr(instance, '_old_edge', None)
+    if old_edge and old_edge != _edge(instance):
+        _record_removal(*old_edge)
+        invalidate_topics(old_edge[0], old_edge[1])
+    record_change(Action.EDGE_ADDED, *_edge(instance), weight=instance.weight)
+    schedule_closure_update(*_edge(instance))
+    invalidate_topics(instance.source_id, instance.target_id)
+
+
+@receiver(post_delete, sender=TopicRelation)
+def relation_deleted(sender, instance, **kwargs):
+    _record_removal(*_edge(instance))
+    invalidate_topics(instance.source_id, instance.target_id)
+
+
+@receiver(post_save, sender=Topic)
+def topic_saved(sender, instance, created=False, **kwargs):
+    record_change(Action.TOPIC_SAVED, instance.pk)
+    if not created:
+        invalidate_neighbours(instance.pk)
+    transaction.on_commit(lambda: update_suggest_index(instance.pk, instance.title))
+
+
+@receiver(post_delete, sender=Topic)
+def topic_deleted(sender, instance, **kwargs):
+    record_change(Action.TOPIC_DELETED, instance.pk)
+    invalidate_topics(instance.pk)
+    topic_id = instance.pk
+    transaction.on_commit(lambda: update_suggest_index(topic_id))
+
+
+@receiver(post_save, sender=ResourceRelation)
+@receiver(post_delete, sender=ResourceRelation)
+def resource_relation_changed(sender, instance, **kwargs):
+    invalidate_topics(instance.topic_id)
+
+
+@receiver(post_save, sender=Resource)
+def resource_saved(sender, instance, created=False, **kwargs):
+    if not created:
+        invalidate_resource(instance.pk)
+
+
+@receiver(post_save, sender=TopicRelationVote)
+def relation_vote_saved(sender, instance, raw=False, **kwargs):
+    if getattr(settings, 'POLLS_AGGREGATE_VOTES_ON_SAVE', False) and not raw:
+        transaction.on_commit(aggregate_votes)
+
+
+@receiver(post_save, sender=UserKnowledge)
+def knowledge_saved(sender, instance, created=False, **kwargs):
+    if created:
+        known_topics_added(instance.user_id, [instance.topic_id])
+    else:
+        known_topics_changed(instance.user_id)
+
+
+@receiver(post_delete, sender=UserKnowledge)
+def knowledge_deleted(sender, instance, origin=None, **kwargs):
+    # Not when the user is being deleted: their version row is already gone.
+    if isinstance(origin, User) or getattr(origin, 'model', None) is User:
+        return
+    known_topics_changed(instance.user_id)
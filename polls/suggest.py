@@ -0,0 +1,196 @@
+from bisect import bisect_left, insort
+import heapq
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count
+
+from .models import Topic, UserGoal, UserKnowledge
+
+
+logger = logging.getLogger(__name__)
+
+
+class PrefixIndex:
+    """Per-process type-ahead index over Topic.title.
+
+    Titles are kept lowercased in one sorted list, so the titles starting
+    with a prefix are a contiguous range found by bisect. The top `k` of
+    each range by popularity (goal + knowledge rows) is precomputed for
+    prefixes of up to `max_prefix` characters, where ranges are largest;
+    longer prefixes are ranked on the fly.
+    """
+
+    def __init__(self, topics, popularity, k=10, max_prefix=3):
+        self.k = k
+        self.max_prefix = max_prefix
+        self.popularity = popularity
+        self.titles = {}
+        self.entries = []  # (lowercased title, topic id), sorted
+        for topic_id, title in topics:
+            self.titles[topic_id] = title
+            self.entries.append((title.lower(), topic_id))
+        self.entries.sort()
+        self.top = {}
+        self._precompute()
+
+    @classmethod
+    def load(cls):
+        popularity = {}
+        for model in (UserGoal, UserKnowledge):
+            for topic_id, count in model.objects.values_list('topic').annotate(Count('id')).order_by():
+                popularity[topic_id] = popularity.get(topic_id, 0) + count
+        topics = Topic.objects.values_list('id', 'title').iterator(chunk_size=10000)
+        return cls(topics, popularity, k=getattr(settings, 'POLLS_SUGGEST_LIMIT', 10))
+
+    def _rank(self, topic_id):
+        return (self.popularity.get(topic_id, 0), -topic_id)
+
+    def _best(self, topic_ids):
+        return heapq.nlargest(self.k, topic_ids, key=self._rank)
+
+    def _precompute(self):
+        for length in range(1, self.max_prefix + 1):
+            group = []
+            prefix = None
+            for key, topic_id in self.entries:
+                if len(key) < length:
+                    continue
+                if key[:length] != prefix:
+                    if group:
+                        self.top[prefix] = self._best(group)
+                    prefix, group = key[:length], []
+                group.append(topic_id)
+            if group:
+                self.top[prefix] = self._best(group)
+
+    def _range(self, prefix):
+        start = bisect_left(self.entries, (prefix,))
+        end = bisect_left(self.entries, (prefix + '\U0010ffff',))
+        return (topic_id for _, topic_id in self.entries[start:end])
+
+    def suggest(self, prefix):
+        # Up to k (topic id, title) pairs whose title starts with `prefix`.
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        if prefix in self.top:
+            topic_ids = self.top[prefix]
+        elif len(prefix) <= self.max_prefix:
+            topic_ids = []  # precomputed, so nothing starts with it
+        else:
+            topic_ids = self._best(self._range(prefix))
+        return [(topic_id, self.titles[topic_id]) for topic_id in topic_ids]
+
+    def _refresh_prefixes(self, key):
+        for length in range(1, min(len(key), self.max_prefix) + 1):
+            prefix = key[:length]
+            top = self._best(self._range(prefix))
+            if top:
+                self.top[prefix] = top
+            else:
+                self.top.pop(prefix, None)
+
+    def remove(self, topic_id):
+        title = self.titles.pop(topic_id, None)
+        if title is None:
+            return
+        entry = (title.lower(), topic_id)
+        i = bisect_left(self.entries, entry)
+        if i < len(self.entries) and self.entries[i] == entry:
+            del self.entries[i]
+        self._refresh_prefixes(entry[0])
+
+    def add(self, topic_id, title):
+        self.remove(topic_id)
+        self.titles[topic_id] = title
+        insort(self.entries, (title.lower(), topic_id))
+        self._refresh_prefixes(title.lower())
+
+
+_index = None
+_index_loaded = 0
+_index_lock = threading.Lock()
+# One build at a time. While one runs, topic edits are also logged here to
+# be replayed onto the new index, which may have read the rows before them.
+_build_lock = threading.Lock()
+_build_edits = None
+_rebuilding = False
+
+
+def get_suggest_index():
+    # Loaded on first use, then rebuilt every POLLS_SUGGEST_TTL seconds to
+    # pick up other processes' edits and popularity changes. The rebuild
+    # reads every topic, so it runs on a thread of its own and the old index
+    # keeps answering meanwhile. This process's own topic edits are applied
+    # straight away by update_suggest_index.
+    global _rebuilding
+    with _index_lock:
+        index = _index
+        ttl = getattr(settings, 'POLLS_SUGGEST_TTL', 300)
+        if index is not None and time.monotonic() - _index_loaded > ttl and not _rebuilding:
+            _rebuilding = True
+            threading.Thread(target=_rebuild_in_background, daemon=True).start()
+    if index is None:
+        # Nothing to answer with yet, so the first request waits for it.
+        _build(replace=False)
+        with _index_lock:
+            index = _index
+    return index
+
+
+def _build(replace=True):
+    global _index, _index_loaded, _build_edits
+    with _build_lock:
+        with _index_lock:
+            if _index is not None and not replace:
+                return  # another request loaded it first
+            _build_edits = []
+        try:
+            index = PrefixIndex.load()
+        except Exception:
+            with _index_lock:
+                _build_edits = None
+            raise
+        with _index_lock:
+            for topic_id, title in _build_edits:
+                _apply_edit(index, topic_id, title)
+            _index, _index_loaded, _build_edits = index, time.monotonic(), None
+
+
+def _rebuild_in_background():
+    global _rebuilding
+    try:
+        _build()
+    except Exception:
+        logger.exception("Couldn't rebuild the suggest index")
+    finally:
+        with _index_lock:
+            _rebuilding = False
+        # The thread's own connection, which nothing else will close.
+        connection.close()
+
+
+def _apply_edit(index, topic_id, title):
+    if title is None:
+        index.remove(topic_id)
+    else:
+        index.add(topic_id, title)
+
+
+def update_suggest_index(topic_id, title=None):
+    # Pass no title for a deleted topic.
+    with _index_lock:
+        if _build_edits is not None:
+            _build_edits.append((topic_id, title))
+        if _index is not None:
+            _apply_edit(_index, topic_id, title)
+
+
+def reset_suggest_index():
+    global _index
+    with _index_lock:
+        _index = None
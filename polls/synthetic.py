@@ -0,0 +1,85 @@
+import random
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .graph import record_reload
+from .models import Resource, ResourceRelation, Topic, TopicRelation, UserGoal, UserKnowledge
+
+
+PREREQ_OF = TopicRelation.RelationType.PREREQ_OF
+CHILD_OF = TopicRelation.RelationType.CHILD_OF
+
+
+def generate_graph(topics, edges_per_topic=5, users=0, known_per_user=0, goals_per_user=0,
+                   seed=0, batch_size=5000, prefix="synthetic", cycle_rate=0.0, resources_per_topic=0):
+    """Bulk-insert a random curriculum for benchmarks. Returns (topic ids, user ids).
+
+    Topic i gets edges from `edges_per_topic` earlier topics, mostly nearby
+    ones, so closures stay a realistic size. A few early topics act as hubs
+    that many later ones point back to. About a quarter of the edges are
+    CHILD_OF, the rest PREREQ_OF. A `cycle_rate` fraction of edges come from
+    a nearby later topic instead, which closes cycles. Each topic gets
+    `resources_per_topic` resources of its own, and each user knows and
+    wants random topics.
+    """
+    rng = random.Random(seed)
+    topic_ids = []
+    with transaction.atomic():
+        for start in range(0, topics, batch_size):
+            created = Topic.objects.bulk_create(
+                Topic(title=f"{prefix} {i}") for i in range(start, min(start + batch_size, topics)))
+            topic_ids.extend(t.pk for t in created)
+        if None in topic_ids:
+            topic_ids = list(Topic.objects.filter(title__startswith=f"{prefix} ").order_by('id').values_list('id', flat=True))
+
+        hubs = topic_ids[:max(1, topics // 1000)]
+        rows = []
+        for i, target in enumerate(topic_ids[1:], start=1):
+            for _ in range(edges_per_topic):
+                if cycle_rate and rng.random() < cycle_rate and i + 1 < topics:
+                    source = topic_ids[rng.randrange(i + 1, min(topics, i + 51))]
+                elif rng.random() < 0.1:
+                    source = rng.choice(hubs)
+                else:
+                    source = topic_ids[rng.randrange(max(0, i - 50), i)]
+                if source == target:
+                    continue
+                relation_type = CHILD_OF if rng.random() < 0.25 else PREREQ_OF
+                rows.append(TopicRelation(source_id=source, target_id=target, relation_type=relation_type))
+            if len(rows) >= batch_size:
+                TopicRelation.objects.bulk_create(rows, ignore_conflicts=True)
+                rows = []
+        TopicRelation.objects.bulk_create(rows, ignore_conflicts=True)
+
+        if resources_per_topic:
+            _generate_resources(rng, topic_ids, resources_per_topic, batch_size, prefix)
+
+        user_ids = []
+        for i in range(users):
+            user = User.objects.create(username=f"{prefix}-user-{seed}-{i}")
+            user_ids.append(user.pk)
+            known = rng.sample(topic_ids, min(known_per_user, len(topic_ids)))
+            UserKnowledge.objects.bulk_create(
+                [UserKnowledge(user=user, topic_id=t) for t in known], ignore_conflicts=True)
+            goals = rng.sample(topic_ids, min(goals_per_user, len(topic_ids)))
+            UserGoal.objects.bulk_create([UserGoal(user=user, topic_id=t) for t in goals], ignore_conflicts=True)
+
+        record_reload()
+    return topic_ids, user_ids
+
+
+def _generate_resources(rng, topic_ids, per_topic, batch_size, prefix):
+    step = max(1, batch_size // per_topic)
+    for start in range(0, len(topic_ids), step):
+        batch = topic_ids[start:start + step]
+        titles = [f"{prefix} resource {topic_id}-{n}" for topic_id in batch for n in range(per_topic)]
+        created = Resource.objects.bulk_create(
+            Resource(title=title, author=f"{prefix} author", link="#") for title in titles)
+        resource_ids = [r.pk for r in created]
+        if None in resource_ids:
+            by_title = dict(Resource.objects.filter(title__in=titles).values_list('title', 'id'))
+            resource_ids = [by_title[title] for title in titles]
+        ResourceRelation.objects.bulk_create(
+            ResourceRelation(resource_id=resource_id, topic_id=batch[i // per_topic], votes=rng.randrange(100))
+            for i, resource_id in enumerate(resource_ids))
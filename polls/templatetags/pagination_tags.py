@@ -3,9 +3,13 @@ from django import template
 
 register = template.Library()
 
+# Current query string with the page position replaced, e.g.
+# {% url_replace after=page_obj.next_cursor %}. Leave out the position to
+# get the first page.
 @register.simple_tag(takes_context=True)
 def url_replace(context, **kwargs):
     query = context['request'].GET.copy()
-    if query.get('page'): query.pop('page')
-    query.update(kwargs)
+    for key in ('page', 'after', 'before'):
+        if query.get(key): query.pop(key)
+    query.update({key: value for key, value in kwargs.items() if value is not None})
     return query.urlencode()
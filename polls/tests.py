@@ -1,129 +1,1561 @@
-import datetime
+from datetime import timedelta
+from io import StringIO
+import os
+import random
+import tempfile
+import time
+from unittest import mock
 
-from django.test import TestCase
-from django.utils import timezone
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+
+from . import closure, graph as graph_module
+from .closure import check_closure
+from .aggregation import aggregate_votes
+from .benchmark import CASES, run_benchmarks
+from .export import FORMATS as EXPORT_FORMATS
+from .graph import TopicGraph, get_graph, prune_changes, reset_graph, write_snapshot
+from .instrumentation import instrument
+from .knowledge import KnownTopics, get_known_topics, reset_known_topics
+from .models import (
+    KnownTopicsVersion, Resource, ResourceRelation, ResourceVote, Topic, TopicClosure, TopicComponent,
+    TopicGraphChange, TopicRelation, TopicRelationVote, UserGoal, UserKnowledge)
+from .pagination import KeysetPaginator, encode_cursor
+from .sampling import reset_random_topics, sample_topics
+from .search import search_topics
+from .suggest import PrefixIndex, reset_suggest_index, update_suggest_index
+from .synthetic import generate_graph
+from .voting import apply_votes, flush_votes, insert_votes, reset_vote_buffer
+from .views import add_user_topics, get_all_prereqs, get_learning_path, get_next_steps, get_next_steps_for_goals
+
+
+PREREQ_OF = TopicRelation.RelationType.PREREQ_OF
+CHILD_OF = TopicRelation.RelationType.CHILD_OF
+
+
+def create_topics(*titles):
+    return [Topic.objects.create(title=title) for title in titles]
+
 
-from .models import Question
+def relate(source, target, relation_type=PREREQ_OF, weight=1):
+    return TopicRelation.objects.create(
+        source=source, target=target, relation_type=relation_type, weight=weight)
 
 
-class QuestionModelTests(TestCase):
+# Per-process caches, so the suite neither sees nor wipes a dev server's
+# topic pages, nor leaves files behind.
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'topic_pages': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'topic-pages'},
+}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PollsTestCase(TestCase):
+
+    def setUp(self):
+        # The graph and page caches live per process, and test rollbacks
+        # don't tell them.
+        reset_graph()
+        self.addCleanup(reset_graph)
+        reset_suggest_index()
+        self.addCleanup(reset_suggest_index)
+        reset_random_topics()
+        self.addCleanup(reset_random_topics)
+        reset_vote_buffer()
+        self.addCleanup(reset_vote_buffer)
+        reset_known_topics()
+        self.addCleanup(reset_known_topics)
+        for cache in caches.all():
+            cache.clear()
+
+
+class TopicGraphTests(PollsTestCase):
+
+    def test_edges_are_split_by_type_and_direction(self):
+        """
+        incoming()/outgoing() only return edges of the requested type.
+        """
+        a, b, c = create_topics("a", "b", "c")
+        relate(a, c, PREREQ_OF, weight=2)
+        relate(b, c, CHILD_OF)
+
+        graph = TopicGraph.load()
+        self.assertEqual(list(graph.incoming(c.id, PREREQ_OF)), [(a.id, 2.0)])
+        self.assertEqual(graph.sources(c.id, CHILD_OF), [b.id])
+        self.assertEqual(graph.targets(a.id, PREREQ_OF), [c.id])
+        self.assertEqual(graph.targets(a.id, CHILD_OF), [])
+        self.assertEqual(graph.sources(12345, PREREQ_OF), [])
 
-    def test_was_published_recently_with_future_question(self):
+    def test_prereq_closure_handles_cycles(self):
         """
-        was_published_recently() returns False for questions whose pub_date
-        is in the future.
+        A prereq cycle doesn't loop forever, and everything on it is returned.
         """
-        time = timezone.now() + datetime.timedelta(days=30)
-        future_question = Question(pub_date=time)
-        self.assertIs(future_question.was_published_recently(), False)
+        a, b, c = create_topics("a", "b", "c")
+        relate(a, b)
+        relate(b, c)
+        relate(c, a)
+
+        prereqs, next_steps = TopicGraph.load().prereq_closure(c.id)
+        self.assertEqual(prereqs, {a.id, b.id, c.id})
+        self.assertEqual(next_steps, set())
+
+
+class LearningPathTests(PollsTestCase):
+
+    def test_prereqs_come_first_and_weight_breaks_ties(self):
+        a, b, c, goal = create_topics("a", "b", "c", "goal")
+        relate(a, goal, weight=1)
+        relate(b, goal, weight=5)
+        relate(c, b)
+        relate(a, c, CHILD_OF)
+
+        graph = TopicGraph.load()
+        path, cycles = graph.learning_path(goal.id)
+        self.assertEqual(path, [a.id, c.id, b.id, goal.id])
+        self.assertEqual(cycles, [])
+        self.assertEqual(graph.depth(goal.id), 3)
+        self.assertEqual(graph.subtree_size(goal.id), 3)
+
+        path, _ = graph.learning_path(goal.id, known={a.id})
+        self.assertEqual(path, [c.id, b.id, goal.id])
+
+    def test_cycles_are_reported_and_broken(self):
+        a, b, c, goal = create_topics("a", "b", "c", "goal")
+        relate(a, b)
+        relate(b, c)
+        relate(c, a, weight=2)
+        relate(c, goal)
+
+        graph = TopicGraph.load()
+        path, cycles = graph.learning_path(goal.id)
+        self.assertEqual(cycles, [[c.id, a.id, b.id]])
+        self.assertEqual(path, [c.id, a.id, b.id, goal.id])
+
+    def test_depth_memo_is_dropped_on_edit(self):
+        a, b = create_topics("a", "b")
+        graph = get_graph()
+        self.assertEqual(graph.depth(b.id), 0)
+        relate(a, b)
+        get_graph()
+        self.assertEqual(graph.depth(b.id), 1)
+
+
+class CycleTests(PollsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.a, self.b, self.c, self.d, self.e = create_topics(*"abcde")
+        relate(self.a, self.b)
+        relate(self.b, self.a, CHILD_OF)
+        relate(self.b, self.c)
+        relate(self.c, self.d)
+        relate(self.e, self.e)
+
+    def test_components_and_condensation(self):
+        graph = TopicGraph.load()
+        self.assertEqual(graph.strongly_connected_components(), [
+            [self.a.id, self.b.id], [self.e.id]])
+
+        component_of, condensed = graph.condensation()
+        self.assertEqual(component_of[self.b.id], self.a.id)
+        self.assertEqual(condensed.strongly_connected_components(), [])
+        self.assertEqual(condensed.sources(self.c.id, PREREQ_OF), [self.a.id])
+        self.assertEqual(graph.depth(self.a.id), graph.depth(self.b.id))
+        self.assertEqual(graph.depth(self.d.id), 2)
+
+    def test_depth_only_condenses_the_topics_subgraph(self):
+        # A big unrelated part of the graph, then an edit, as sync() applies.
+        edges = [(self.d.id + i, self.d.id + i + 1, PREREQ_OF, 1) for i in range(1, 5000)]
+        graph = TopicGraph(list(TopicGraph.load().topic_ids()), list(TopicGraph.load().edges()) + edges)
+        graph.depth(self.d.id)
+        graph.add_edge(self.e.id, self.a.id, PREREQ_OF, 1)
+        with instrument() as metrics:
+            path, cycles = graph.learning_path(self.d.id)
+        self.assertEqual(graph.depth(self.d.id), 3)
+        self.assertEqual(graph.depth(self.a.id), graph.depth(self.b.id))
+        self.assertEqual(len(path), 5)
+        self.assertIsNone(graph._condensation)
+        self.assertLess(metrics.nodes, 50)
 
-    def test_was_published_recently_with_old_question(self):
+    def test_command_saves_components(self):
+        out = StringIO()
+        call_command('find_topic_cycles', '--save', stdout=out)
+        self.assertIn("Found 2 cycles", out.getvalue())
+        self.assertEqual(
+            set(TopicComponent.objects.values_list('topic_id', 'component_id')),
+            {(self.a.id, self.a.id), (self.b.id, self.a.id), (self.e.id, self.e.id)})
+
+
+class GraphSyncTests(PollsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.a, self.b, self.c = create_topics("a", "b", "c")
+        self.ab = relate(self.a, self.b)
+
+    def test_changes_committing_below_the_loaded_generation_are_applied(self):
+        # b -> c gets its change id before the graph loads, commits after.
+        late = TopicGraphChange.objects.create(
+            action=TopicGraphChange.Action.EDGE_ADDED, source_id=self.b.id, target_id=self.c.id,
+            relation_type=PREREQ_OF, weight=1)
+        late_id = late.id
+        late.delete()
+        relate(self.c, self.a, CHILD_OF)
+        graph = get_graph()
+
+        TopicRelation.objects.bulk_create([TopicRelation(source=self.b, target=self.c, relation_type=PREREQ_OF)])
+        late.id = late_id
+        late.save(force_insert=True)
+        self.assertIs(get_graph(), graph)
+        self.assertEqual(graph.sources(self.c.id, PREREQ_OF), [self.b.id])
+
+    def test_cached_graph_follows_edits(self):
         """
-        was_published_recently() returns False for questions whose pub_date
-        is older than 1 day.
+        Saves and deletes patch the cached graph instead of reloading it.
         """
-        time = timezone.now() - datetime.timedelta(days=1, seconds=1)
-        old_question = Question(pub_date=time)
-        self.assertIs(old_question.was_published_recently(), False)
+        graph = get_graph()
+        relate(self.b, self.c)
+        self.ab.relation_type = CHILD_OF
+        self.ab.save()
+
+        self.assertIs(get_graph(), graph)
+        self.assertEqual(graph.sources(self.c.id, PREREQ_OF), [self.b.id])
+        self.assertEqual(graph.sources(self.b.id, PREREQ_OF), [])
+        self.assertEqual(graph.sources(self.b.id, CHILD_OF), [self.a.id])
+
+        c_id = self.c.id
+        self.c.delete()
+        get_graph()
+        self.assertNotIn(c_id, graph)
+        self.assertEqual(graph.targets(self.b.id, PREREQ_OF), [])
 
-    def test_was_published_recently_with_recent_question(self):
+    def test_other_process_applies_delta(self):
         """
-        was_published_recently() returns True for questions whose pub_date
-        is within the last day.
+        A graph loaded elsewhere catches up from the change log alone.
         """
-        time = timezone.now() - datetime.timedelta(hours=23, minutes=59, seconds=59)
-        recent_question = Question(pub_date=time)
-        self.assertIs(recent_question.was_published_recently(), True)
+        other = TopicGraph.load()
+        relate(self.b, self.c, weight=3)
+        TopicRelation.objects.filter(pk=self.ab.pk).delete()
+        d = Topic.objects.create(title="d")
 
+        with self.assertNumQueries(1):
+            self.assertTrue(other.sync())
+        self.assertEqual(other.incoming(self.c.id, PREREQ_OF), [(self.b.id, 3)])
+        self.assertEqual(other.sources(self.b.id, PREREQ_OF), [])
+        self.assertIn(d.id, other)
 
-def create_question(question_text, days):
-    """
-    Create a question with the given `question_text` and published the
-    given number of `days` offset to now (negative for questions published
-    in the past, positive for questions that have yet to be published).
-    """
-    time = timezone.now() + datetime.timedelta(days=days)
-    return Question.objects.create(question_text=question_text, pub_date=time)
+    def test_duplicate_rows_are_rejected(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            relate(self.a, self.b)
 
+    def test_compact_keeps_edges(self):
+        graph = get_graph()
+        relate(self.b, self.c)
+        self.ab.delete()
+        get_graph()
+        before = sorted(graph.edges())
+        graph.compact()
+        self.assertEqual(graph.overlay_size, 0)
+        self.assertEqual(sorted(graph.edges()), before)
+        self.assertEqual(graph.sources(self.c.id, PREREQ_OF), [self.b.id])
 
-class QuestionIndexViewTests(TestCase):
-    
-    def test_no_questions(self):
+
+class GetAllPrereqsTests(PollsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("learner", password="pw")
+        # basics -> algebra -> calculus, with limits a child of calculus.
+        self.basics, self.algebra, self.calculus, self.limits = create_topics(
+            "basics", "algebra", "calculus", "limits")
+        relate(self.basics, self.algebra)
+        relate(self.algebra, self.calculus)
+        relate(self.limits, self.calculus, CHILD_OF)
+
+    def test_prereqs_and_next_steps(self):
         """
-        If no questions exist, an appropriate message is displayed.
+        Prereqs include children, and next steps are the unknown leaves.
         """
-        response = self.client.get(reverse('polls:index'))
-        self.assertEqual(response.status_code, 200)
-        self.assertContains(response, "No polls are available.")
-        self.assertQuerysetEqual(response.context['latest_question_list'], [])
+        prereqs, next_steps = get_all_prereqs(self.calculus.id, None)
+        self.assertEqual(prereqs, {self.basics, self.algebra, self.limits})
+        self.assertEqual(next_steps, {self.basics, self.limits})
 
-    def test_past_question(self):
+    def test_known_topics_are_skipped(self):
         """
-        Questions with a pub_date in the past are displayed on the
-        index page.
+        Known topics, and anything only reachable through them, are left out.
         """
-        question = create_question(question_text="Past question.", days=-30)
-        response = self.client.get(reverse('polls:index'))
-        self.assertQuerysetEqual(
-            response.context['latest_question_list'],
-            [question],
-        )
+        UserKnowledge.objects.create(user=self.user, topic=self.algebra)
+        prereqs, next_steps = get_all_prereqs(self.calculus.id, self.user.id)
+        self.assertEqual(prereqs, {self.limits})
+        self.assertEqual(next_steps, {self.limits})
 
-    def test_future_question(self):
+    def test_query_count_does_not_grow_with_depth(self):
         """
-        Questions with a pub_date in the future aren't displayed on
-        the index page.
+        Once the graph is loaded, a traversal costs a fixed number of queries.
         """
-        create_question(question_text="Future question.", days=30)
-        response = self.client.get(reverse('polls:index'))
-        self.assertContains(response, "No polls are available.")
-        self.assertQuerysetEqual(response.context['latest_question_list'], [])
+        get_all_prereqs(self.calculus.id, self.user.id)
+        # Graph sync, the known topics' version (the set itself is cached) and titles.
+        with self.assertNumQueries(3):
+            get_all_prereqs(self.calculus.id, self.user.id)
+
+    def test_goal_and_user_views(self):
+        UserGoal.objects.create(user=self.user, topic=self.calculus)
+        self.client.force_login(self.user)
 
-    def test_future_question_and_past_question(self):
+        response = self.client.get(reverse('polls:goal_detail', args=[self.calculus.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['prereqs'], [self.basics, self.limits, self.algebra])
+
+        response = self.client.get(reverse('polls:user_detail', args=[self.user.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['next_steps'], {"calculus": {self.basics, self.limits}})
+
+
+class BatchedNextStepsTests(PollsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("learner", password="pw")
+        self.topics = create_topics(*"abcdefg")
+        a, b, c, d, e, f, g = self.topics
+        # Two goals (f, g) sharing most of their prereqs, with a cycle.
+        relate(a, c)
+        relate(b, c)
+        relate(c, d)
+        relate(d, c)
+        relate(d, f)
+        relate(d, g)
+        relate(e, g, CHILD_OF)
+        UserKnowledge.objects.create(user=self.user, topic=b)
+
+    def test_matches_per_goal_results(self):
+        goal_ids = [self.topics[5].id, self.topics[6].id, self.topics[0].id]
+        batched = get_next_steps_for_goals(goal_ids, self.user.id)
+        self.assertEqual(batched, {
+            goal_id: get_next_steps(goal_id, self.user.id) for goal_id in goal_ids})
+        a, e = self.topics[0], self.topics[4]
+        self.assertEqual(batched[self.topics[6].id], {a, e})
+
+    def test_user_page_queries_dont_grow_with_goals(self):
+        get_graph()
+        UserGoal.objects.create(user=self.user, topic=self.topics[5])
+        url = reverse('polls:user_detail', args=[self.user.id])
+        with self.assertNumQueries(5) as one_goal:
+            self.client.get(url)
+        UserGoal.objects.create(user=self.user, topic=self.topics[6])
+        with self.assertNumQueries(len(one_goal)):
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['next_steps']), 2)
+
+
+class SQLClosureTests(PollsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("learner", password="pw")
+        self.a, self.b, self.c, self.d, self.e = create_topics("a", "b", "c", "d", "e")
+        relate(self.a, self.b)
+        relate(self.b, self.c)
+        relate(self.c, self.b)  # cycle
+        relate(self.d, self.c, CHILD_OF)
+        relate(self.e, self.d)
+
+    def test_matches_memory_backend(self):
         """
-        Even if both past and future questions exist, only past questions
-        are displayed.
+        The recursive query gives the same answer as the in-memory graph.
         """
-        question = create_question(question_text="Past question.", days=-30)
-        create_question(question_text="Future question.", days=30)
-        response = self.client.get(reverse('polls:index'))
-        self.assertQuerysetEqual(
-            response.context['latest_question_list'],
-            [question],
-        )
+        UserKnowledge.objects.create(user=self.user, topic=self.d)
+        for user_id in (None, self.user.id):
+            with override_settings(POLLS_GRAPH_BACKEND='sql'):
+                sql_result = get_all_prereqs(self.c.id, user_id)
+            self.assertEqual(sql_result, get_all_prereqs(self.c.id, user_id))
+
+            with override_settings(POLLS_GRAPH_BACKEND='sql'):
+                sql_path = get_learning_path(self.c.id, user_id)
+            self.assertEqual(sql_path[:2], get_learning_path(self.c.id, user_id)[:2])
 
-    def test_two_past_questions(self):
+    def test_single_query(self):
         """
-        The questions index page may display multiple questions.
+        Known topics are pruned inside the one query.
         """
-        question1 = create_question(question_text="Past question 1.", days=-30)
-        question2 = create_question(question_text="Past question 2.", days=-5)
-        response = self.client.get(reverse('polls:index'))
-        self.assertQuerysetEqual(
-            response.context['latest_question_list'],
-            [question2, question1],
-        )
+        UserKnowledge.objects.create(user=self.user, topic=self.b)
+        with self.assertNumQueries(1):
+            prereqs, next_steps = closure.prereq_closure(self.c.id, self.user.id)
+        self.assertEqual(prereqs, {self.d, self.e})
+        self.assertEqual(next_steps, {self.e})
+
 
+@override_settings(POLLS_GRAPH_BACKEND='closure')
+class TopicClosureTests(PollsTestCase):
 
-class QuestionDetailViewTests(TestCase):
-    
-    def test_future_question(self):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("learner", password="pw")
+        self.a, self.b, self.c, self.d = create_topics("a", "b", "c", "d")
+        relate(self.a, self.b)
+        relate(self.b, self.c)
+        relate(self.d, self.c, CHILD_OF)
+        call_command('rebuild_topic_closure', stdout=StringIO())
+
+    def closure(self, topic):
+        return {
+            (row.ancestor_id, row.depth, row.child_depth)
+            for row in TopicClosure.objects.filter(descendant=topic)
+        }
+
+    def test_rebuild(self):
+        self.assertEqual(self.closure(self.c), {
+            (self.b.id, 1, None), (self.a.id, 2, None), (self.d.id, 1, 1)})
+        call_command('check_topic_closure', stdout=StringIO())
+
+    def test_incremental_updates(self):
         """
-        The detail view of a question with a pub_date in the future
-        returns a 404 not found.
+        Adding and removing relations keeps the table consistent.
         """
-        future_question = create_question(question_text='Future question.', days=5)
-        url = reverse('polls:detail', args=(future_question.id,))
-        response = self.client.get(url)
-        self.assertEqual(response.status_code, 404)
+        with self.captureOnCommitCallbacks(execute=True):
+            e = Topic.objects.create(title="e")
+            relate(e, self.a)
+        self.assertIn((e.id, 3, None), self.closure(self.c))
+        call_command('check_topic_closure', stdout=StringIO())
+
+        # A shortcut, and a cycle through c.
+        with self.captureOnCommitCallbacks(execute=True):
+            relate(e, self.c, CHILD_OF)
+            relate(self.c, self.a)
+        self.assertIn((e.id, 1, 1), self.closure(self.c))
+        self.assertIn((self.c.id, 3, None), self.closure(self.c))
+        call_command('check_topic_closure', stdout=StringIO())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TopicRelation.objects.get(source=self.c).delete()
+            TopicRelation.objects.get(source=self.b).delete()
+        self.assertEqual(self.closure(self.c), {(self.d.id, 1, 1), (e.id, 1, 1)})
+        call_command('check_topic_closure', stdout=StringIO())
+
+    def test_random_edits_stay_consistent(self):
+        rng = random.Random(0)
+        topics = create_topics(*(f"t{i}" for i in range(12)))
+        call_command('rebuild_topic_closure', stdout=StringIO())
+        reset_graph()
+        for _ in range(150):
+            source, target = rng.sample(topics, 2)
+            relation_type = rng.choice([PREREQ_OF, CHILD_OF])
+            with self.captureOnCommitCallbacks(execute=True):
+                existing = TopicRelation.objects.filter(source=source, target=target, relation_type=relation_type)
+                if existing.exists():
+                    existing.delete()
+                else:
+                    relate(source, target, relation_type)
+        self.assertEqual(check_closure(), ([], [], []))
+        # Removals worked from the table, without loading the graph.
+        self.assertIsNone(graph_module._graph)
+
+    def test_check_reports_drift(self):
+        TopicClosure.objects.filter(ancestor=self.a).delete()
+        with self.assertRaises(CommandError):
+            call_command('check_topic_closure', stdout=StringIO())
+
+    def test_goal_lookup_matches_memory_backend(self):
+        self.assertEqual(get_all_prereqs(self.c.id, None), ({self.a, self.b, self.d}, {self.a, self.d}))
+
+        UserKnowledge.objects.create(user=self.user, topic=self.b)
+        get_all_prereqs(self.c.id, self.user.id)
+        # Known topics' version, the edges among the ancestors, the topics.
+        with self.assertNumQueries(3):
+            prereqs, next_steps = get_all_prereqs(self.c.id, self.user.id)
+        self.assertEqual(prereqs, {self.d})
+        self.assertEqual(next_steps, {self.d})
+
+        # Knowing a topic doesn't hide what else leads to the goal through
+        # other routes.
+        g, a, b, k = create_topics("g", "a2", "b2", "k")
+        with self.captureOnCommitCallbacks(execute=True):
+            relate(a, g)
+            relate(b, a)
+            relate(b, k)
+            UserKnowledge.objects.create(user=self.user, topic=k)
+        closure_result = get_all_prereqs(g.id, self.user.id)
+        self.assertEqual(closure_result, ({a, b}, {b}))
+        with override_settings(POLLS_GRAPH_BACKEND='memory'):
+            self.assertEqual(get_all_prereqs(g.id, self.user.id), closure_result)
+
+
+class TopicDetailViewTests(PollsTestCase):
+
+    def add_neighbours(self, topic, count):
+        for i in range(count):
+            other = Topic.objects.create(title=f"{topic.title} {i}")
+            relate(other, topic)
+            relate(topic, other)
+            relate(other, topic, CHILD_OF)
+            relate(topic, other, CHILD_OF)
+            resource = Resource.objects.create(title=f"book {i}", author="someone", link="#")
+            ResourceRelation.objects.create(resource=resource, topic=topic, votes=i)
+
+    def test_lists_split_by_direction_and_type(self):
+        topic, other = create_topics("topic", "other")
+        relate(other, topic)
+        relate(topic, other, CHILD_OF)
+        response = self.client.get(reverse('polls:topic_detail', args=[topic.id]))
+        self.assertEqual([r.source for r in response.context['prereq_list']], [other])
+        self.assertEqual([r.target for r in response.context['parent_list']], [other])
+        self.assertEqual(response.context['succ_list'], [])
+        self.assertEqual(response.context['child_list'], [])
 
-    def test_past_question(self):
+    def test_query_count_is_fixed(self):
         """
-        The detail view of a question with a pub_date in the past
-        displays the question's text.
+        The page costs the same number of queries however many neighbours it has.
         """
-        past_question = create_question(question_text='Past Question.', days=-5)
-        url = reverse('polls:detail', args=(past_question.id,))
+        small, big = create_topics("small", "big")
+        self.add_neighbours(small, 1)
+        self.add_neighbours(big, 10)
+
+        with self.assertNumQueries(3):
+            self.client.get(reverse('polls:topic_detail', args=[small.id]))
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('polls:topic_detail', args=[big.id]))
+        self.assertEqual(len(response.context['child_list']), 10)
+        self.assertEqual(response.context['resource_list'][0].votes, 9)
+
+    async def test_served_natively_under_asgi(self):
+        topic, other = await sync_to_async(create_topics)("topic", "other")
+        await sync_to_async(relate)(other, topic)
+        user = await User.objects.acreate(username="learner")
+        await sync_to_async(UserGoal.objects.create)(user=user, topic=topic)
+
+        response = await self.async_client.get(reverse('polls:topic_detail', args=[topic.id]))
+        self.assertContains(response, "other")
+        response = await self.async_client.get(reverse('polls:user_detail', args=[user.id]))
+        self.assertContains(response, "topic")
+        response = await self.async_client.get(reverse('polls:topic_search_results'), {'q': "oth"})
+        self.assertEqual([t.title for t in response.context['object_list']], ["other"])
+        response = await self.async_client.get(reverse('polls:goal_detail', args=[topic.id]))
+        self.assertEqual(response.context['prereqs'], [other])
+        response = await self.async_client.get(reverse('polls:topic_detail', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+
+class TopicPageCacheTests(PollsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.topic, self.other = create_topics("topic", "other")
+        self.url = reverse('polls:topic_detail', args=[self.topic.id])
+        self.user = User.objects.create_user("learner", password="pw")
+
+    def test_anonymous_hits_skip_the_db(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, "No prerequisites found.")
+
+    def test_writes_invalidate_only_affected_topics(self):
+        third, = create_topics("third")
+        third_url = reverse('polls:topic_detail', args=[third.id])
+        self.client.get(self.url)
+        self.client.get(third_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            relate(self.other, self.topic)
+        self.assertContains(self.client.get(self.url), "other")
+        with self.assertNumQueries(0):
+            self.client.get(third_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.title = "renamed"
+            self.other.save()
+        self.assertContains(self.client.get(self.url), "renamed")
+
+        resource = Resource.objects.create(title="a book", author="someone", link="#")
+        with self.captureOnCommitCallbacks(execute=True):
+            ResourceRelation.objects.create(resource=resource, topic=self.topic)
+        self.assertContains(self.client.get(self.url), "a book")
+
+    def test_other_workers_see_the_invalidation(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        shared = dict(TEST_CACHES, topic_pages={
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory.name})
+        override = override_settings(CACHES=shared)
+        override.enable()
+        self.addCleanup(override.disable)
+        # A second connection to the alias stands in for another process.
+        other_worker = caches.create_connection(settings.POLLS_TOPIC_CACHE)
+        self.client.get(self.url)
+        cached_key = f"topic-page:{self.topic.id}:{other_worker.get(f'topic-version:{self.topic.id}')}"
+        self.assertIsNotNone(other_worker.get(cached_key))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            relate(self.other, self.topic)
+        self.assertNotEqual(
+            f"topic-page:{self.topic.id}:{other_worker.get(f'topic-version:{self.topic.id}')}", cached_key)
+
+    def test_logged_in_users_reuse_relation_fragment(self):
+        relate(self.other, self.topic)
+        self.client.force_login(self.user)
+        self.client.get(self.url)
+        # Session, user, topic and resources; the relations come from the cache.
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url)
+        self.assertContains(response, "other")
+        self.assertContains(response, "Mark as Known")
+
+
+class InstrumentationTests(PollsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.a, self.b, self.c = create_topics("a", "b", "c")
+        relate(self.a, self.b)
+        relate(self.b, self.c)
+        self.user = User.objects.create(username="learner")
+        get_graph()
+
+    def test_instrument_counts_queries_and_traversal(self):
+        with CaptureQueriesContext(connection) as queries, instrument() as metrics:
+            get_all_prereqs(self.c.id, self.user.id)
+        self.assertEqual(metrics.queries, len(queries))
+        self.assertGreater(metrics.db_time, 0)
+        self.assertEqual((metrics.nodes, metrics.edges), (3, 2))
+
+    def test_nested_blocks_add_to_the_outer_one(self):
+        with instrument() as outer:
+            with instrument() as inner:
+                get_graph().ancestors(self.c.id)
+            get_graph().ancestors(self.b.id)
+        self.assertEqual((inner.nodes, outer.nodes), (2, 3))
+
+    def test_server_timing_header_and_log(self):
+        with CaptureQueriesContext(connection) as queries, \
+                self.assertLogs('polls.instrumentation', 'INFO') as logs:
+            response = self.client.get(reverse('polls:goal_detail', args=[self.c.id]))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn(f'desc="{len(queries)} queries"', response['Server-Timing'])
+        self.assertIn('render;dur=', response['Server-Timing'])
+        metrics = logs.records[0].metrics
+        self.assertEqual(metrics['view'], 'polls:goal_detail')
+        self.assertEqual(metrics['status'], 200)
+        self.assertEqual(metrics['queries'], len(queries))
+        self.assertGreaterEqual(metrics['graph_nodes'], 3)
+        self.assertGreater(metrics['render_ms'], 0)
+
+    @override_settings(POLLS_SERVER_TIMING=False, POLLS_SLOW_REQUEST_MS=0)
+    def test_header_can_be_turned_off_and_slow_requests_warn(self):
+        with self.assertLogs('polls.instrumentation', 'WARNING'):
+            response = self.client.get(reverse('polls:topic_detail', args=[self.a.id]))
+        self.assertNotIn('Server-Timing', response)
+
+    async def test_async_views(self):
+        response = await self.async_client.get(reverse('polls:goal_detail', args=[self.c.id]))
+        self.assertIn('graph;desc="', response['Server-Timing'])
+        self.assertNotIn('desc="0 queries"', response['Server-Timing'])
+
+
+class UserTopicViewTests(PollsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.topic, = create_topics("topic")
+        self.user = User.objects.create_user("learner", password="pw")
+        self.client.force_login(self.user)
+
+    def test_marking_twice_adds_one_row(self):
+        for _ in range(2):
+            self.client.post(reverse('polls:mark_known', args=[self.topic.id]))
+            self.client.post(reverse('polls:mark_goal', args=[self.topic.id]))
+        self.assertEqual(str(UserKnowledge.objects.get()), "learner knows topic")
+        self.assertEqual(UserGoal.objects.count(), 1)
+        self.assertEqual(self.client.post(reverse('polls:mark_known', args=[0])).status_code, 404)
+
+    def test_bulk_mark(self):
+        others = create_topics("a", "b")
+        ids = [self.topic.id] + [t.id for t in others]
+        UserKnowledge.objects.create(user=self.user, topic=self.topic)
+        # Session, user, then the topic check, insert and known-topics version
+        # bump (in a savepoint here).
+        with self.assertNumQueries(8):
+            response = self.client.post(reverse('polls:mark_known_bulk'), {'topic_ids': ids + [0]})
+        self.assertRedirects(response, reverse('polls:user_detail', args=[self.user.id]),
+                             fetch_redirect_response=False)
+        self.assertEqual(set(UserKnowledge.objects.values_list('topic_id', flat=True)), set(ids))
+
+        response = self.client.post(
+            reverse('polls:mark_goals_bulk'), {'topic_ids': ids[1:]}, content_type='application/json')
+        self.assertEqual(response.json(), {'marked': 2})
+        self.assertEqual(UserGoal.objects.count(), 2)
+
+        url = reverse('polls:mark_goals_bulk')
+        for payload in ({'topic_ids': ["x"]}, {'topic_ids': str(self.topic.id)}, {'topic_ids': {"1": 1}},
+                        {'topic_ids': [True]}, {'topic_ids': [1.0]}, [self.topic.id], {'topic_ids': [10 ** 30]}):
+            response = self.client.post(url, payload, content_type='application/json')
+            self.assertEqual(response.status_code, 400, payload)
+        for value in ("1x", "²", str(10 ** 30)):
+            self.assertEqual(self.client.post(url, {'topic_ids': [value]}).status_code, 400, value)
+        with override_settings(POLLS_BULK_MARK_MAX=2):
+            self.assertEqual(self.client.post(url, {'topic_ids': ids}).status_code, 400)
+        self.assertEqual(UserGoal.objects.count(), 2)
+
+    def test_many_ids_are_checked_in_batches(self):
+        topics = Topic.objects.bulk_create(Topic(title=f"t{i}") for i in range(1200))
+        self.assertEqual(add_user_topics(UserKnowledge, self.user.id, [t.id for t in topics] + [0]), 1200)
+        self.assertEqual(UserKnowledge.objects.filter(user=self.user).count(), 1200)
+
+    def test_mark_known_with_prereqs(self):
+        a, b, c, unrelated = create_topics("a", "b", "c", "unrelated")
+        relate(a, b)
+        relate(b, self.topic, CHILD_OF)
+        relate(self.topic, c)
+        response = self.client.post(reverse('polls:mark_known_with_prereqs', args=[self.topic.id]))
+        self.assertRedirects(response, reverse('polls:topic_detail', args=[self.topic.id]),
+                             fetch_redirect_response=False)
+        self.assertEqual(set(UserKnowledge.objects.values_list('topic_id', flat=True)),
+                         {a.id, b.id, self.topic.id})
+
+    def test_remove_goal(self):
+        UserGoal.objects.create(user=self.user, topic=self.topic)
+        response = self.client.post(reverse('polls:remove_goal', args=[self.topic.id]))
+        self.assertRedirects(response, reverse('polls:user_detail', args=[self.user.id]))
+        self.assertFalse(UserGoal.objects.exists())
+
+
+class KnownTopicsTests(PollsTestCase):
+
+    def test_set_behaviour(self):
+        ids = {1, 2, 70000, 70001, (5 << 16) + 9}
+        known = KnownTopics(ids)
+        self.assertEqual(len(known), 5)
+        self.assertEqual(list(known), sorted(ids))
+        self.assertNotIn(3, known)
+        self.assertNotIn(1 << 20, known)
+
+        # Dense chunks switch to a bitmap and keep working.
+        known.update(range(100, 10000))
+        known.add(2)
+        self.assertEqual(len(known), 5 + 9900)
+        self.assertIn(5000, known)
+        self.assertNotIn(10000, known)
+        copy = KnownTopics.from_bytes(known.to_bytes())
+        self.assertEqual(list(copy), list(known))
+        self.assertEqual(len(copy), len(known))
+
+    def test_cached_and_kept_current(self):
+        a, b, c = create_topics("a", "b", "c")
+        user = User.objects.create_user("learner", password="pw")
+        UserKnowledge.objects.create(user=user, topic=a)
+        self.assertEqual(list(get_known_topics(user.id)), [a.id])
+        # Just the version.
+        with self.assertNumQueries(1):
+            self.assertIn(a.id, get_known_topics(user.id))
+
+        self.client.force_login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('polls:mark_known', args=[b.id]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('polls:mark_known_bulk'), {'topic_ids': [c.id]})
+        with self.assertNumQueries(1):
+            self.assertEqual(list(get_known_topics(user.id)), [a.id, b.id, c.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            UserKnowledge.objects.filter(topic=b).delete()
+        self.assertEqual(list(get_known_topics(user.id)), [a.id, c.id])
+
+    def test_changes_made_by_another_worker_are_seen(self):
+        a, b = create_topics("a", "b")
+        user = User.objects.create_user("learner", password="pw")
+        self.assertEqual(list(get_known_topics(user.id)), [])
+        # The other worker's on-commit callbacks never run in this process.
+        self.client.force_login(user)
+        with self.captureOnCommitCallbacks(execute=False):
+            self.client.post(reverse('polls:mark_known', args=[a.id]))
+        self.assertEqual(list(get_known_topics(user.id)), [a.id])
+        with self.captureOnCommitCallbacks(execute=False):
+            UserKnowledge.objects.filter(topic=a).delete()
+        self.assertEqual(list(get_known_topics(user.id)), [])
+
+    def test_deleting_the_user(self):
+        a, = create_topics("a")
+        user = User.objects.create_user("learner")
+        UserKnowledge.objects.create(user=user, topic=a)
+        user.delete()
+        self.assertFalse(KnownTopicsVersion.objects.exists())
+
+
+class VoteTests(PollsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.topic, = create_topics("topic")
+        resource = Resource.objects.create(title="a book", author="someone", link="#")
+        self.rr = ResourceRelation.objects.create(resource=resource, topic=self.topic)
+        self.user = User.objects.create_user("learner", password="pw")
+        self.other = User.objects.create_user("other", password="pw")
+        self.url = reverse('polls:vote_for_resource', args=[self.rr.id])
+
+    def vote(self, user):
+        self.client.force_login(user)
+        return self.client.post(self.url)
+
+    def test_users_vote_once(self):
+        response = self.vote(self.user)
+        self.assertRedirects(response, reverse('polls:topic_detail', args=[self.topic.id]),
+                             fetch_redirect_response=False)
+        self.vote(self.user)
+        self.vote(self.other)
+        self.rr.refresh_from_db()
+        self.assertEqual(self.rr.votes, 2)
+        self.assertEqual(ResourceVote.objects.count(), 2)
+
+    def test_vote_expires_cached_page(self):
+        topic_url = reverse('polls:topic_detail', args=[self.topic.id])
+        self.client.get(topic_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vote(self.user)
+        self.client.logout()
+        self.assertContains(self.client.get(topic_url), "<td>1</td>", html=True)
+
+    @override_settings(POLLS_VOTE_BUFFER_SIZE=3)
+    def test_buffered_votes_flush_in_batches(self):
+        self.vote(self.user)
+        self.vote(self.user)
+        self.rr.refresh_from_db()
+        self.assertEqual(self.rr.votes, 0)
+
+        third = User.objects.create_user("third", password="pw")
+        self.vote(self.other)
+        self.vote(third)
+        self.rr.refresh_from_db()
+        self.assertEqual(self.rr.votes, 3)
+
+        # Already counted, so flushing it again changes nothing.
+        self.vote(self.user)
+        flush_votes()
+        self.rr.refresh_from_db()
+        self.assertEqual(self.rr.votes, 3)
+
+    def fake_timers(self):
+        # (interval, function) of each timer started; run them by hand, as
+        # a timer thread's connection couldn't see this test's rows.
+        timers = []
+
+        def timer(interval, function):
+            timers.append((interval, function))
+            return mock.Mock()
+
+        patcher = mock.patch('polls.voting.threading.Timer', timer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return timers
+
+    @override_settings(POLLS_VOTE_BUFFER_SIZE=3, POLLS_VOTE_FLUSH_INTERVAL=5)
+    def test_buffered_votes_flush_on_a_timer(self):
+        timers = self.fake_timers()
+        self.vote(self.user)
+        self.vote(self.other)
+        self.assertEqual([interval for interval, _ in timers], [5])
+        timers[0][1]()
+        self.rr.refresh_from_db()
+        self.assertEqual(self.rr.votes, 2)
+
+    @override_settings(POLLS_VOTE_BUFFER_SIZE=3)
+    def test_failed_flushes_keep_the_votes(self):
+        timers = self.fake_timers()
+        self.vote(self.user)
+        with mock.patch('polls.voting.insert_votes', side_effect=DatabaseError), \
+                self.assertLogs('polls.voting', 'ERROR'):
+            timers[0][1]()
+        self.assertEqual(len(timers), 2)
+        timers[1][1]()
+        self.rr.refresh_from_db()
+        self.assertEqual(self.rr.votes, 1)
+
+    def test_votes_flushed_elsewhere_are_not_counted_again(self):
+        # Another process already inserted (and counted) this vote.
+        ResourceVote.objects.create(user=self.user, resource_relation=self.rr)
+        third = User.objects.create_user("third", password="pw")
+        votes = {(self.user.id, self.rr.id): self.topic.id, (self.other.id, self.rr.id): self.topic.id}
+        self.assertEqual(apply_votes(votes), 1)
+        with mock.patch.object(connection, 'vendor', 'other'):
+            self.assertEqual(insert_votes([(self.other.id, self.rr.id), (third.id, self.rr.id)]),
+                             [(third.id, self.rr.id)])
+        self.rr.refresh_from_db()
+        self.assertEqual(self.rr.votes, 1)
+
+
+class VoteAggregationTests(PollsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.a, self.b, self.c = create_topics("a", "b", "c")
+        self.ab = relate(self.a, self.b)
+        self.bc = relate(self.b, self.c)
+        self.user = User.objects.create_user("learner", password="pw")
+
+    def vote(self, source, target, origin='user'):
+        return TopicRelationVote.objects.create(
+            source=source, target=target, relation_type=PREREQ_OF, user=self.user, origin=origin, reason="")
+
+    @override_settings(POLLS_VOTE_ORIGIN_WEIGHTS={'user': 1, 'textbook': 5})
+    def test_weights_sum_votes_by_origin(self):
+        self.vote(self.a, self.b)
+        self.vote(self.a, self.b, origin='textbook')
+        self.vote(self.b, self.c, origin='blog')
+        self.vote(self.c, self.a)  # no such relation
+        self.assertEqual(aggregate_votes(chunk_size=1), (3, 1))
+        self.ab.refresh_from_db()
+        self.bc.refresh_from_db()
+        self.assertEqual((self.ab.weight, self.bc.weight), (6, 1))
+
+    def test_votes_without_a_source_are_kept_but_not_scored(self):
+        self.vote(self.a, self.b)
+        unattributed = self.vote(None, self.b)
+        self.assertEqual(aggregate_votes(full=True), (1, 0))
+        self.ab.refresh_from_db()
+        self.assertEqual(self.ab.weight, 1)
+        self.assertTrue(TopicRelationVote.objects.filter(pk=unattributed.pk).exists())
+
+    def test_only_newly_voted_edges_are_rescored(self):
+        self.vote(self.a, self.b)
+        self.vote(self.b, self.c)
+        aggregate_votes()
+        TopicRelation.objects.filter(pk=self.bc.pk).update(weight=7)
+
+        self.vote(self.a, self.b)
+        self.assertEqual(aggregate_votes(), (1, 1))
+        self.assertEqual(aggregate_votes(), (0, 0))
+        self.assertEqual(aggregate_votes(full=True), (2, 1))
+        self.bc.refresh_from_db()
+        self.assertEqual(self.bc.weight, 1)
+
+    def test_cached_graph_sees_new_weights(self):
+        get_graph()
+        self.vote(self.a, self.b)
+        self.vote(self.a, self.b)
+        with self.captureOnCommitCallbacks(execute=True):
+            aggregate_votes()
+        self.assertEqual(get_graph().incoming(self.b.id, PREREQ_OF), [(self.a.id, 2)])
+
+
+class ImportGraphTests(PollsTestCase):
+
+    def write(self, suffix, text):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def import_graph(self, *args):
+        out = StringIO()
+        call_command('import_graph', *args, '--batch-size', '2', stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_jsonl_and_csv(self):
+        existing, = create_topics("algebra")
+        get_graph()
+        jsonl = self.write('.jsonl', "\n".join([
+            '{"kind": "relation", "source": "algebra", "target": "calculus"}',
+            '{"kind": "topic", "title": "calculus"}',
+            '{"kind": "topic", "title": "algebra"}',
+            '{"kind": "resource", "title": "a book", "author": "someone", "link": "#", "topics": ["calculus"]}',
+            '{"kind": "relation", "source": "algebra", "target": "nowhere"}',
+        ]))
+        csv_path = self.write('.csv', "source,target,relation_type,weight\n"
+                                      "calculus,algebra,child_of,2\n"
+                                      "algebra,calculus,prereq_of,1\n")
+        out = self.import_graph(jsonl, csv_path, '--kind', 'relation')
+        self.assertIn("topic: 1 created, 1 skipped", out)
+        self.assertIn("relation: 2 created, 2 skipped", out)
+
+        calculus = Topic.objects.get(title="calculus")
+        self.assertEqual(Topic.objects.count(), 2)
+        self.assertEqual(
+            set(TopicRelation.objects.values_list('source', 'target', 'relation_type', 'weight')),
+            {(existing.id, calculus.id, PREREQ_OF, 1), (calculus.id, existing.id, CHILD_OF, 2)})
+        self.assertTrue(ResourceRelation.objects.filter(topic=calculus, resource__title="a book").exists())
+        self.assertEqual(get_graph().sources(existing.id, CHILD_OF), [calculus.id])
+
+        # Rerunning changes nothing.
+        self.assertIn("relation: 0 created, 4 skipped", self.import_graph(jsonl, csv_path, '--kind', 'relation'))
+        self.assertEqual(TopicRelation.objects.count(), 2)
+
+        resources = self.write('.csv', "title,author,link,topics\n"
+                                        "a course,someone else,#,algebra|calculus\n"
+                                        "a paper,someone,#,\n")
+        out = self.import_graph(resources, '--kind', 'resource')
+        self.assertIn("resource: 2 created, 0 skipped", out)
+        self.assertIn("resource_relation: 2 created, 0 skipped", out)
+        self.assertEqual(
+            set(ResourceRelation.objects.filter(resource__title="a course").values_list('topic__title', flat=True)),
+            {"algebra", "calculus"})
+
+    def test_graph_sees_batches_committed_before_a_failure(self):
+        get_graph()
+        jsonl = self.write('.jsonl', "\n".join([
+            '{"kind": "topic", "title": "algebra"}',
+            '{"kind": "topic", "title": "calculus"}',
+            '{"kind": "relation", "source": "algebra", "target": "calculus", "weight": 0}',
+            '{"kind": "relation", "source": "calculus", "target": "algebra", "relation_type": "child_of"}',
+            '{"kind": "relation", "source": "algebra"}',
+        ]))
+        with self.assertRaises(CommandError):
+            self.import_graph(jsonl)
+        algebra, calculus = Topic.objects.get(title="algebra"), Topic.objects.get(title="calculus")
+        self.assertEqual(get_graph().incoming(calculus.id, PREREQ_OF), [(algebra.id, 0)])
+        self.assertEqual(self.client.get(reverse('polls:api_topic', args=[algebra.id])).status_code, 200)
+
+    def test_topics_only_import_reaches_the_graph(self):
+        get_graph()
+        self.import_graph(self.write('.jsonl', '{"kind": "topic", "title": "algebra"}'))
+        self.assertIn(Topic.objects.get(title="algebra").id, get_graph())
+
+    def test_csv_needs_kind(self):
+        with self.assertRaises(CommandError):
+            self.import_graph(self.write('.csv', "title\nalgebra\n"))
+
+
+class ExportGraphTests(PollsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.a, self.b, self.c = create_topics("a", "b", "c")
+        relate(self.a, self.b, weight=2.5)
+        relate(self.b, self.c, CHILD_OF)
+        resource = Resource.objects.create(title="a book", author="someone", link="#")
+        ResourceRelation.objects.create(resource=resource, topic=self.b, votes=3)
+
+    def export(self, fmt):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        call_command('export_graph', path, '--format', fmt, stdout=StringIO())
+        return path
+
+    def test_jsonl_round_trip(self):
+        path = self.export('jsonl')
+        before = set(TopicRelation.objects.values_list('source__title', 'target__title', 'relation_type', 'weight'))
+        Topic.objects.all().delete()
+        Resource.objects.all().delete()
+
+        call_command('import_graph', path, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(set(Topic.objects.values_list('title', flat=True)), {"a", "b", "c"})
+        self.assertEqual(set(TopicRelation.objects.values_list(
+            'source__title', 'target__title', 'relation_type', 'weight')), before)
+        self.assertEqual(ResourceRelation.objects.get().votes, 3)
+
+    def test_edge_list_matches_db(self):
+        path = self.export('edges')
+        graph = TopicGraph.load_edge_list(path)
+        self.assertEqual(graph.topic_ids(), {self.a.id, self.b.id, self.c.id})
+        self.assertEqual(sorted(graph.edges()), sorted(TopicGraph.load().edges()))
+
+    def test_edge_list_replays_changes_that_commit_late(self):
+        late = TopicGraphChange.objects.create(
+            action=TopicGraphChange.Action.EDGE_ADDED, source_id=self.c.id, target_id=self.a.id,
+            relation_type=PREREQ_OF, weight=1)
+        late_id = late.id
+        late.delete()
+        relate(self.c, self.b, CHILD_OF)
+        path = self.export('edges')
+
+        TopicRelation.objects.bulk_create([TopicRelation(source=self.c, target=self.a, relation_type=PREREQ_OF)])
+        late.id = late_id
+        late.save(force_insert=True)
+        graph = TopicGraph.load_edge_list(path)
+        graph.sync()
+        self.assertEqual(sorted(graph.edges()), sorted(TopicGraph.load().edges()))
+
+    def test_workers_load_edge_list_then_catch_up(self):
+        path = self.export('edges')
+        d, = create_topics("d")
+        relate(self.c, d)
+        with override_settings(POLLS_GRAPH_EDGE_LIST=path):
+            graph = get_graph()
+        self.assertEqual(graph.sources(d.id, PREREQ_OF), [self.c.id])
+        self.assertEqual(sorted(graph.edges()), sorted(TopicGraph.load().edges()))
+
+    def test_endpoint_is_staff_only(self):
+        url = reverse('polls:export_graph', args=['jsonl'])
+        user = User.objects.create_user("learner", password="pw")
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        user.is_staff = True
+        user.save()
         response = self.client.get(url)
-        self.assertContains(response, past_question.question_text)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 7)
+        self.assertEqual(self.client.get(reverse('polls:export_graph', args=['xml'])).status_code, 404)
+
+    async def test_endpoint_streams_under_asgi(self):
+        user = await User.objects.acreate(username="staff", is_staff=True)
+        await sync_to_async(self.async_client.force_login)(user)
+        for fmt in ('jsonl', 'edges'):
+            response = await self.async_client.get(reverse('polls:export_graph', args=[fmt]))
+            self.assertTrue(response.is_async)
+            content = b"".join([chunk async for chunk in response.streaming_content])
+            expected = await sync_to_async(lambda: b"".join(
+                part if isinstance(part, bytes) else part.encode() for part in EXPORT_FORMATS[fmt][0]()))()
+            self.assertEqual(content, expected)
+
+
+class GraphSnapshotTests(PollsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.a, self.b, self.c = create_topics("a", "b", "c")
+        relate(self.a, self.b, weight=2.5)
+        relate(self.b, self.c, CHILD_OF)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "graph.snapshot")
+
+    def test_snapshot_matches_db(self):
+        with override_settings(POLLS_GRAPH_SNAPSHOT=self.path):
+            self.assertTrue(write_snapshot())
+        graph = TopicGraph.load_snapshot(self.path)
+        loaded = TopicGraph.load()
+        self.assertEqual(graph.topic_ids(), loaded.topic_ids())
+        self.assertEqual(sorted(graph.edges()), sorted(loaded.edges()))
+        self.assertEqual(graph.depth(self.c.id), loaded.depth(self.c.id))
+        self.assertEqual([graph.title(t.id) for t in (self.a, self.b, self.c)], ["a", "b", "c"])
+
+    def inline_threads(self):
+        # The writer's own connection couldn't see this test's rows, so run
+        # it here, and record that it was handed to a thread.
+        started = []
+
+        def thread(target, args=(), **kwargs):
+            started.append(target)
+            return mock.Mock(start=lambda: target(*args), is_alive=lambda: False)
+
+        patcher = mock.patch('polls.graph.threading.Thread', thread)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return started
+
+    @override_settings(POLLS_GRAPH_SNAPSHOT_INTERVAL=0)
+    def test_changes_rewrite_snapshot(self):
+        started = self.inline_threads()
+        with override_settings(POLLS_GRAPH_SNAPSHOT=self.path):
+            get_graph()
+            d, = create_topics("d")
+            with self.captureOnCommitCallbacks(execute=True):
+                relate(self.c, d)
+            graph = TopicGraph.load_snapshot(self.path)
+            self.assertEqual(graph.sources(d.id, PREREQ_OF), [self.c.id])
+            self.assertEqual(graph.title(d.id), "d")
+
+            # A fresh worker maps the snapshot, then replays what it missed.
+            with self.captureOnCommitCallbacks(execute=False):
+                relate(d, self.a)
+                self.a.title = "renamed"
+                self.a.save()
+            reset_graph()
+            graph = get_graph()
+        self.assertEqual(graph.sources(self.a.id, PREREQ_OF), [d.id])
+        self.assertEqual(graph.title(self.b.id), "b")
+        self.assertIsNone(graph.title(self.a.id))
+        self.assertEqual(sorted(graph.edges()), sorted(TopicGraph.load().edges()))
+        self.assertTrue(started)
+
+    def test_changes_only_rewrite_snapshot_after_the_interval(self):
+        started = self.inline_threads()
+        with override_settings(POLLS_GRAPH_SNAPSHOT=self.path, POLLS_GRAPH_SNAPSHOT_INTERVAL=300):
+            get_graph()
+            with self.captureOnCommitCallbacks(execute=True):
+                relate(self.c, self.a)
+            self.assertEqual(len(started), 1)
+            with self.captureOnCommitCallbacks(execute=True):
+                relate(self.a, self.c)
+            self.assertEqual(len(started), 1)
+            self.assertEqual(TopicGraph.load_snapshot(self.path).sources(self.a.id, PREREQ_OF), [self.c.id])
+
+            with override_settings(POLLS_GRAPH_SNAPSHOT_INTERVAL=None):
+                reset_graph()
+                get_graph()
+                with self.captureOnCommitCallbacks(execute=True):
+                    relate(self.b, self.a)
+            self.assertEqual(len(started), 1)
+
+
+class GraphChangePruneTests(PollsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.a, self.b, self.c = create_topics("a", "b", "c")
+        relate(self.a, self.b)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "graph.snapshot")
+
+    def age_changes(self):
+        TopicGraphChange.objects.update(created=timezone.now() - timedelta(days=2))
+
+    def change_ids(self):
+        return list(TopicGraphChange.objects.order_by('id').values_list('id', flat=True))
+
+    def test_old_changes_are_pruned(self):
+        self.age_changes()
+        newest_old = self.change_ids()[-1]
+        relate(self.b, self.c)
+        new = self.change_ids()[-1]
+
+        out = StringIO()
+        call_command('prune_graph_changes', stdout=out)
+        self.assertEqual(self.change_ids(), [newest_old, new])
+        self.assertIn("Deleted 3 graph changes", out.getvalue())
+        self.assertEqual(prune_changes(), 0)
+
+    def test_changes_the_snapshot_needs_are_kept(self):
+        with override_settings(POLLS_GRAPH_SNAPSHOT=self.path):
+            self.assertTrue(write_snapshot())
+            relate(self.b, self.c)
+            self.c.title = "renamed"
+            self.c.save()
+            self.age_changes()
+            prune_changes()
+            reset_graph()
+            graph = get_graph()
+        self.assertEqual(sorted(graph.edges()), sorted(TopicGraph.load().edges()))
+        self.assertEqual(graph.sources(self.c.id, PREREQ_OF), [self.b.id])
+        self.assertIsNone(graph.title(self.c.id))
+
+    def test_snapshots_behind_the_pruned_log_are_not_loaded(self):
+        with override_settings(POLLS_GRAPH_SNAPSHOT=self.path):
+            self.assertTrue(write_snapshot())
+        relate(self.b, self.c)
+        relate(self.c, self.a)
+        self.age_changes()
+        self.assertEqual(prune_changes(), 5)
+        with override_settings(POLLS_GRAPH_SNAPSHOT=self.path):
+            reset_graph()
+            graph = get_graph()
+        self.assertEqual(sorted(graph.edges()), sorted(TopicGraph.load().edges()))
+        self.assertIsNone(graph.title(self.a.id))
+
+    def test_idle_workers_reload(self):
+        graph = get_graph()
+        with mock.patch('polls.graph._last_sync', time.monotonic() - 2 * 24 * 60 * 60):
+            self.assertIsNot(get_graph(), graph)
+
+
+class APITests(PollsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.a, self.b, self.c, self.d = create_topics("a", "b", "c", "d")
+        relate(self.a, self.b)
+        relate(self.b, self.c, weight=2)
+        relate(self.d, self.c, CHILD_OF)
+
+    def get(self, name, *args, **params):
+        response = self.client.get(reverse(name, args=args), params)
+        self.assertEqual(response.status_code, 200)
+        return response, response.json()
+
+    def test_topic_list_pages_by_id(self):
+        _, data = self.get('polls:api_topics', limit=3)
+        self.assertEqual([t['title'] for t in data['results']], ["a", "b", "c"])
+        _, data = self.get('polls:api_topics', limit=3, after=data['next'])
+        self.assertEqual([t['title'] for t in data['results']], ["d"])
+        self.assertIsNone(data['next'])
+
+    def test_neighbourhood(self):
+        _, data = self.get('polls:api_neighbourhood', self.c.id, depth=1)
+        self.assertEqual({t['title']: t['hops'] for t in data['topics']}, {"b": 1, "c": 0, "d": 1})
+
+        _, data = self.get('polls:api_neighbourhood', self.c.id, depth=2, types='prereq_of', direction='in')
+        self.assertEqual([t['title'] for t in data['topics']], ["a", "b", "c"])
+        self.assertEqual(
+            sorted((e['source'], e['target'], e['weight']) for e in data['edges']),
+            [(self.a.id, self.b.id, 1), (self.b.id, self.c.id, 2)])
+        self.assertFalse(data['truncated'])
+
+        with override_settings(POLLS_API_MAX_NODES=2):
+            _, data = self.get('polls:api_neighbourhood', self.c.id, depth=3)
+        self.assertEqual(len(data['topics']), 2)
+        self.assertTrue(data['truncated'])
+
+        self.assertEqual(self.client.get(
+            reverse('polls:api_neighbourhood', args=[self.c.id]), {'types': 'sibling_of'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('polls:api_neighbourhood', args=[0])).status_code, 404)
+
+    def test_prereqs_skip_known_topics(self):
+        _, data = self.get('polls:api_prereqs', self.c.id)
+        self.assertEqual([t['title'] for t in data['prereqs']], ["a", "b", "d"])
+        self.assertEqual(data['next_steps'], [self.a.id, self.d.id])
+
+        user = User.objects.create_user("learner", password="pw")
+        UserKnowledge.objects.create(user=user, topic=self.a)
+        self.client.force_login(user)
+        _, data = self.get('polls:api_prereqs', self.c.id)
+        self.assertEqual(data['next_steps'], [self.b.id, self.d.id])
+
+    def test_etag_changes_with_graph(self):
+        url = reverse('polls:api_topic', args=[self.b.id])
+        response, data = self.get('polls:api_topic', self.b.id)
+        self.assertEqual(len(data['edges']), 2)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            relate(self.d, self.b)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class SearchTests(PollsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.linear, self.algebra, self.abstract, self.calculus = create_topics(
+            "Linear algebra", "Algebra", "Abstract algebra and more algebra", "Calculus")
+
+    def test_prefix_matches_rank_first(self):
+        self.assertEqual(list(search_topics("alg")), [self.algebra, self.linear, self.abstract])
+        self.assertEqual(list(search_topics("lin alg")), [self.linear])
+        self.assertEqual(list(search_topics("  ")), [])
+
+    def test_index_follows_topic_writes(self):
+        self.calculus.title = "Calculus of algebras"
+        self.calculus.save()
+        self.algebra.delete()
+        Topic.objects.create(title="Boolean algebra")
+        self.assertEqual(
+            [t.title for t in search_topics("algebra")],
+            ["Linear algebra", "Abstract algebra and more algebra", "Boolean algebra", "Calculus of algebras"])
+
+    def test_search_view_uses_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('polls:topic_search_results'), {'q': 'calc'})
+        self.assertEqual(list(response.context['object_list']), [self.calculus])
+        self.assertTrue(any("MATCH" in q['sql'] for q in queries))
+
+    def test_queries_without_words_find_nothing(self):
+        for query in ('', '!!!', '   '):
+            response = self.client.get(reverse('polls:topic_search_results'), {'q': query})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(list(response.context['object_list']), [])
+
+
+class SuggestTests(PollsTestCase):
+
+    def test_prefix_index_ranks_by_popularity(self):
+        topics = [(1, "Algebra"), (2, "Algorithms"), (3, "Alchemy"), (4, "Algebraic geometry"), (5, "Biology")]
+        index = PrefixIndex(topics, {2: 5, 4: 1}, k=2, max_prefix=2)
+        self.assertEqual(index.suggest("al"), [(2, "Algorithms"), (4, "Algebraic geometry")])
+        self.assertEqual(index.suggest("ALGE"), [(4, "Algebraic geometry"), (1, "Algebra")])
+        self.assertEqual(index.suggest("x"), [])
+
+        index.add(6, "Alpha")
+        index.popularity[6] = 10
+        index.add(6, "Alpha")
+        self.assertEqual(index.suggest("al")[0], (6, "Alpha"))
+        index.remove(6)
+        index.remove(2)
+        self.assertEqual(index.suggest("al"), [(4, "Algebraic geometry"), (1, "Algebra")])
+
+    def test_endpoint_skips_the_db(self):
+        user = User.objects.create_user("learner", password="pw")
+        algebra, algorithms = create_topics("Algebra", "Algorithms")
+        UserGoal.objects.create(user=user, topic=algorithms)
+        url = reverse('polls:topic_suggest')
+
+        self.client.get(url, {'q': 'a'})
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'q': 'alg'})
+        self.assertEqual(response.json(), {'results': [
+            {'id': algorithms.id, 'title': "Algorithms"}, {'id': algebra.id, 'title': "Algebra"}]})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            new = Topic.objects.create(title="Algol")
+        self.assertIn({'id': new.id, 'title': "Algol"}, self.client.get(url, {'q': 'algo'}).json()['results'])
+
+    def test_stale_index_is_rebuilt_in_the_background(self):
+        algebra, = create_topics("Algebra")
+        url = reverse('polls:topic_suggest')
+        self.client.get(url, {'q': 'a'})
+        # Run the rebuild by hand, as a thread's connection couldn't see
+        # this test's rows, and check the old index answers until then.
+        started = []
+        with override_settings(POLLS_SUGGEST_TTL=0), \
+                mock.patch('polls.suggest.threading.Thread', lambda target, **kwargs: mock.Mock(
+                    start=lambda: started.append(target))):
+            Topic.objects.create(title="Algorithms")
+            with self.assertNumQueries(0):
+                response = self.client.get(url, {'q': 'alg'})
+                self.client.get(url, {'q': 'alg'})
+        self.assertEqual(response.json()['results'], [{'id': algebra.id, 'title': "Algebra"}])
+        self.assertEqual(len(started), 1)
+
+        real_load = PrefixIndex.load
+
+        def load_then_edit():
+            index = real_load()
+            # Renamed after the rebuild read the rows.
+            update_suggest_index(algebra.id, "Algebra I")
+            return index
+
+        with mock.patch.object(PrefixIndex, 'load', load_then_edit):
+            started[0]()
+        self.assertEqual(
+            [r['title'] for r in self.client.get(url, {'q': 'alg'}).json()['results']], ["Algebra I", "Algorithms"])
+
+
+class RandomTopicTests(PollsTestCase):
+
+    def test_empty_table(self):
+        response = self.client.get(reverse('polls:index'))
+        self.assertContains(response, "No topics are available.")
+
+    def test_sample_skips_gaps(self):
+        topics = create_topics(*(f"topic {i}" for i in range(20)))
+        Topic.objects.filter(id__in=[t.id for t in topics[5:15]]).delete()
+        sample = sample_topics(5, attempts=20)
+        self.assertEqual(len(sample), 5)
+        self.assertEqual(len(set(t.id for t in sample)), 5)
+        self.assertTrue(set(sample) <= set(topics[:5] + topics[15:]))
+
+    def test_home_page_is_served_from_batch(self):
+        create_topics(*(f"topic {i}" for i in range(10)))
+        self.assertContains(self.client.get(reverse('polls:index')), "topic ")
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(reverse('polls:index')), "topic ")
+
+
+class KeysetPaginationTests(PollsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Duplicate titles, so the id has to break ties.
+        self.topics = create_topics(*(f"topic {i % 7:02}" for i in range(25)))
+        self.ordered = sorted(self.topics, key=lambda t: (t.title, t.id))
+
+    def test_walk_forwards_and_back(self):
+        paginator = KeysetPaginator(Topic.objects.all(), 10)
+        page = paginator.page()
+        self.assertFalse(page.has_previous())
+        seen = list(page)
+        while page.has_next():
+            page = paginator.page(after=page.next_cursor())
+            seen.extend(page)
+        self.assertEqual(seen, self.ordered)
+
+        page = paginator.page(before=page.previous_cursor())
+        self.assertEqual(list(page), self.ordered[10:20])
+        page = paginator.page(before=page.previous_cursor())
+        self.assertEqual(list(page), self.ordered[:10])
+        self.assertFalse(page.has_previous())
+
+    def test_deep_page_has_no_offset_or_count(self):
+        paginator = KeysetPaginator(Topic.objects.all(), 10)
+        cursor = paginator.page(after=paginator.page().next_cursor()).next_cursor()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(list(paginator.page(after=cursor)), self.ordered[20:])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("OFFSET", queries[0]['sql'])
+
+    def test_list_view_links(self):
+        url = reverse('polls:topics')
+        response = self.client.get(url)
+        self.assertEqual(list(response.context['topic_list']), self.ordered[:30])
+        self.assertContains(response, "about 25 topics")
+
+        page = KeysetPaginator(Topic.objects.all(), 10).page()
+        self.assertEqual(page.count, None)
+        response = self.client.get(url, {'after': 'not a cursor'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_empty_and_malformed_cursors_give_the_first_page(self):
+        paginator = KeysetPaginator(Topic.objects.all(), 10)
+        first_row = encode_cursor([self.ordered[0].title, self.ordered[0].id])
+        past_end = encode_cursor(["zzz", 10 ** 9])
+        self.assertEqual(list(paginator.page(before=first_row)), self.ordered[:10])
+        self.assertEqual(list(paginator.page(after=past_end)), self.ordered[:10])
+        for values in ([None, 1], ["topic", "x"], ["topic", True], [["a"], 1], ["topic"], ["a", 10 ** 30], ["a", -2 ** 64]):
+            self.assertEqual(list(paginator.page(after=encode_cursor(values))), self.ordered[:10], values)
+
+        search = (reverse('polls:topic_search_results'), {'q': 'topic'})
+        for url, params in ((reverse('polls:topics'), {}), search):
+            for cursor in (first_row, past_end, encode_cursor([None, 1]), encode_cursor([0, None, 1])):
+                for direction in ('after', 'before'):
+                    response = self.client.get(url, dict(params, **{direction: cursor}))
+                    self.assertEqual(response.status_code, 200)
+                    self.assertTrue(response.context['page_obj'].object_list)
+        for cursor in (encode_cursor(["a", 10 ** 30]), encode_cursor([0, 10 ** 30, 1])):
+            response = self.client.get(reverse('polls:topics'), {'after': cursor})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.context['page_obj'].object_list)
+        response = self.client.get(reverse('polls:api_topics'), {'after': encode_cursor([10 ** 30])})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['results'])
+
+    def test_search_results_pages(self):
+        create_topics(*(f"algebra {i}" for i in range(35)))
+        url = reverse('polls:topic_search_results')
+        first = self.client.get(url, {'q': 'algebra'}).context['page_obj']
+        self.assertEqual(len(first), 30)
+        second = self.client.get(url, {'q': 'algebra', 'after': first.next_cursor()}).context['page_obj']
+        self.assertEqual(len(second), 5)
+        self.assertFalse(set(first) & set(second))
+        self.assertContains(
+            self.client.get(url, {'q': 'algebra'}), f"after={first.next_cursor()}")
+
+
+class BenchmarkTests(PollsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.topic_ids, self.user_ids = generate_graph(
+            60, edges_per_topic=3, users=2, known_per_user=5, goals_per_user=2,
+            cycle_rate=0.2, resources_per_topic=2)
+
+    def test_generated_graph(self):
+        self.assertEqual(len(self.topic_ids), 60)
+        self.assertEqual(ResourceRelation.objects.filter(topic__in=self.topic_ids).count(), 120)
+        self.assertEqual(UserKnowledge.objects.filter(user__in=self.user_ids).count(), 10)
+        self.assertTrue(any(len(c) > 1 for c in get_graph().strongly_connected_components()))
+
+    def test_every_case_is_timed_with_its_queries(self):
+        results = run_benchmarks(self.topic_ids, self.user_ids, repeat=3)
+        self.assertEqual(list(results), list(CASES))
+        for name, result in results.items():
+            row = result.as_dict()
+            self.assertEqual(row['calls'], 3, name)
+            self.assertGreater(row['max_queries'], 0, name)
+        self.assertGreater(results['get_all_prereqs'].as_dict()['mean_graph_nodes'], 0)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RelationIndexBenchmarkTests(TransactionTestCase):
+    # Not in a transaction, since SQLite can't rebuild a table inside one.
+
+    def setUp(self):
+        reset_graph()
+        self.addCleanup(reset_graph)
+
+    def index_names(self):
+        with connection.cursor() as cursor:
+            return {
+                name for table in ('polls_topicrelation', 'polls_usergoal', 'polls_userknowledge')
+                for name in connection.introspection.get_constraints(cursor, table)}
+
+    def test_runs_on_a_tiny_graph(self):
+        indexes = self.index_names()
+        out = StringIO()
+        # In this test database rather than a throwaway one of its own.
+        with mock.patch.object(connection.creation, 'create_test_db'), \
+                mock.patch.object(connection.creation, 'destroy_test_db'):
+            call_command('benchmark_relation_indexes', topics=50, users=2, known=5, lookups=10, stdout=out)
+        self.assertIn("prereq closure (sql)", out.getvalue())
+        self.assertEqual(self.index_names(), indexes)
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 app_name = 'polls'
 urlpatterns = [
@@ -8,21 +8,32 @@ urlpatterns = [
 
     path('topics/', views.TopicListView.as_view(), name='topics'),
     path('topics/search/', views.TopicSearchResultsView.as_view(), name='topic_search_results'),
+    path('topics/suggest/', views.suggest_topics, name='topic_suggest'),
     # path('topics/add/', views.add_topic, name='add_topic'),
     path('topics/<int:pk>/', views.TopicDetailView.as_view(), name='topic_detail'),
     path('topics/<int:topic_id>/edit/', views.edit_topic, name='edit_topic'),
     path('topics/<int:topic_id>/known/', views.mark_known, name='mark_known'),
+    path('topics/<int:topic_id>/known/with_prereqs/', views.mark_known_with_prereqs, name='mark_known_with_prereqs'),
     path('topics/<int:topic_id>/goal/', views.mark_goal, name='mark_goal'),
     path('topics/<int:topic_id>/remove_goal/', views.remove_goal, name='remove_goal'),
 
     path('resources/<int:pk>/', views.ResourceDetailView.as_view(), name='resource_detail'),
     path('resources/vote/<int:resource_relation_id>/', views.vote_for_resource, name='vote_for_resource'),
 
+    path('known/', views.mark_known_bulk, name='mark_known_bulk'),
+    path('goals/', views.mark_goals_bulk, name='mark_goals_bulk'),
     path('goals/<int:pk>/', views.GoalDetailView.as_view(), name='goal_detail'),
 
     # easy way to do username instead?
     path('users/<int:pk>/', views.UserDetailView.as_view(), name='user_detail'),
 
+    path('export/<str:fmt>/', views.export_graph, name='export_graph'),
+
+    path('api/topics/', api.topic_list, name='api_topics'),
+    path('api/topics/<int:topic_id>/', api.topic_detail, name='api_topic'),
+    path('api/topics/<int:topic_id>/neighbourhood/', api.neighbourhood, name='api_neighbourhood'),
+    path('api/topics/<int:topic_id>/prereqs/', api.prereqs, name='api_prereqs'),
+
     # probably should be in different app
     path("register", views.register_request, name="register")
 ]
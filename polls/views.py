@@ -1,118 +1,243 @@
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from django.core.cache.utils import make_template_fragment_key
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
 from django.db.models import Q
-from django.http import HttpResponseRedirect
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse, StreamingHttpResponse)
 from django.shortcuts import get_object_or_404, render, redirect
+from django.template.response import TemplateResponse
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from django.views import generic
+from django.views.decorators.http import require_POST
 
-from random import choice
-
+from . import closure, pagecache
+from .export import FORMATS as EXPORT_FORMATS, aiter_export
 from .forms import TopicForm, TopicRelationFormSet
+from .graph import PREREQ_TYPES, TopicGraph, get_graph
+from .knowledge import KnownTopics, get_known_topics, known_topics_added
 from .models import Topic, TopicRelation, Resource, ResourceRelation, UserGoal, UserKnowledge
+from .pagination import KeysetPaginationMixin, KeysetPaginator, estimated_count
+from .sampling import random_topic
+from .search import search_topics
+from .suggest import get_suggest_index
+from .voting import record_vote
+
+
+logger = logging.getLogger(__name__)
+
+
+# Helpers for the async views. Django 4.2 has no async shortcuts yet.
+
+async def aget_object_or_404(queryset, **kwargs):
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404(f"No {queryset.model._meta.verbose_name} matches the given query.")
+
 
+async def alist(queryset):
+    return [obj async for obj in queryset]
 
-class IndexView(generic.ListView):
+
+def _load_user(request):
+    # request.user is lazy and reads the session and DB on first use, which
+    # must not happen on the event loop.
+    request.user.is_authenticated
+    return request.user
+
+
+aget_user = sync_to_async(_load_user)
+
+
+class IndexView(generic.TemplateView):
     template_name = 'polls/index.html'
-    model = Topic  # TODO: get rid of this
 
     def get_context_data(self, **kwargs):
         context = super(IndexView, self).get_context_data(**kwargs)
 
-        context['random_topic'] = choice(Topic.objects.all())
+        context['random_topic'] = random_topic()
 
         return context
 
 
-class TopicListView(generic.ListView):
+class TopicListView(KeysetPaginationMixin, generic.ListView):
     model = Topic
     paginate_by = 30
     ordering = ["title"]
+    paginate_keys = ('title', 'id')
+
+    def get_count(self, queryset):
+        return estimated_count(queryset, 'topic-count')
+
+
+class TopicDetailView(generic.View):
+    template_name = 'polls/topic_detail.html'
+
+    async def get(self, request, pk):
+        user = await aget_user(request)
+        if user.is_authenticated:
+            return TemplateResponse(request, self.template_name, await self.get_context_data(pk))
+
+        # Anonymous visitors all see the same page, so serve it whole from
+        # the cache without touching the DB.
+        cache = pagecache.topic_cache()
+        key = await sync_to_async(pagecache.page_key)(pk)
+        content = await cache.aget(key)
+        if content is None:
+            response = TemplateResponse(request, self.template_name, await self.get_context_data(pk))
+            await sync_to_async(response.render)()
+            await cache.aset(key, response.content)
+            return response
+        return HttpResponse(content)
+
+    async def get_context_data(self, pk):
+        topic = await aget_object_or_404(Topic.objects.all(), pk=pk)
+        version = await sync_to_async(pagecache.topic_version)(pk)
+        cache_name = getattr(settings, 'POLLS_TOPIC_CACHE', 'default')
+
+        # Skip the relations if their cached fragment is there; they're
+        # still fetched lazily if it expires before the template gets to it.
+        fragment = make_template_fragment_key('topic_relations', [pk, version])
+        if await pagecache.topic_cache().ahas_key(fragment):
+            resource_list = await alist(self.resources(pk))
+            relation_lists = SimpleLazyObject(lambda: get_relation_lists(pk))
+        else:
+            resource_list, relation_lists = await asyncio.gather(
+                alist(self.resources(pk)), aget_relation_lists(pk))
+
+        context = {
+            'object': topic,
+            'topic': topic,
+            'view': self,
+            'topic_version': version,
+            'topic_cache': cache_name,
+            'resource_list': resource_list,
+        }
+        for name in ('prereq_list', 'succ_list', 'parent_list', 'child_list'):
+            context[name] = SimpleLazyObject(lambda name=name: relation_lists[name])
+        return context
 
+    def resources(self, topic_id):
+        return ResourceRelation.objects.filter(topic=topic_id).select_related('resource').order_by('-votes', 'id')
 
-class TopicDetailView(generic.DetailView):
-    model = Topic
 
-    def get_context_data(self, **kwargs):
-        context = super(TopicDetailView, self).get_context_data(**kwargs)
-
-        context['resource_list'] = ResourceRelation.objects.filter(topic=self.object.id)
-
-        context['prereq_list'] = TopicRelation.objects.filter(
-            target=self.object.id
-        ).filter(
-            relation_type=TopicRelation.RelationType.PREREQ_OF
-        )
-        context['succ_list'] = TopicRelation.objects.filter(
-            source=self.object.id
-        ).filter(
-            relation_type=TopicRelation.RelationType.PREREQ_OF
-        )
-
-        context['parent_list'] = TopicRelation.objects.filter(
-            source=self.object.id
-        ).filter(
-            relation_type=TopicRelation.RelationType.CHILD_OF
-        )
-        context['child_list'] = TopicRelation.objects.filter(
-            target=self.object.id
-        ).filter(
-            relation_type=TopicRelation.RelationType.CHILD_OF
-        )
+# All relations touching a topic from one query, split up the way the
+# topic page shows them.
+def _relations(topic_id):
+    return TopicRelation.objects.filter(
+        Q(source=topic_id) | Q(target=topic_id)
+    ).select_related('source', 'target').order_by('id')
 
-        return context
 
+def _split_relations(topic_id, relations):
+    lists = {'prereq_list': [], 'succ_list': [], 'parent_list': [], 'child_list': []}
+    for rel in relations:
+        if rel.relation_type == TopicRelation.RelationType.PREREQ_OF:
+            if rel.target_id == topic_id:
+                lists['prereq_list'].append(rel)
+            if rel.source_id == topic_id:
+                lists['succ_list'].append(rel)
+        elif rel.relation_type == TopicRelation.RelationType.CHILD_OF:
+            if rel.source_id == topic_id:
+                lists['parent_list'].append(rel)
+            if rel.target_id == topic_id:
+                lists['child_list'].append(rel)
+    return lists
 
-class GoalDetailView(generic.DetailView):
-    model = Topic
+
+def get_relation_lists(topic_id):
+    return _split_relations(topic_id, _relations(topic_id))
+
+
+async def aget_relation_lists(topic_id):
+    return _split_relations(topic_id, await alist(_relations(topic_id)))
+
+
+class GoalDetailView(generic.View):
     template_name = 'polls/goal_detail.html'
 
-    def get_context_data(self, **kwargs):
-        context = super(GoalDetailView, self).get_context_data(**kwargs)
-        print(f"Getting prereqs for user {self.request.user.id}")
-        context['prereqs'], _ = get_all_prereqs(self.object.id, self.request.user.id)
-        print(f"Done getting prereqs, found {len(context['prereqs'])}")
-        return context
+    async def get(self, request, pk):
+        topic, user = await asyncio.gather(aget_object_or_404(Topic.objects.all(), pk=pk), aget_user(request))
+        logger.debug("Getting prereqs of topic %s for user %s", pk, user.id)
+        # The graph walk is CPU-bound and may load the graph; keep it off the loop.
+        path, cycles, subtree_size = await sync_to_async(get_learning_path)(pk, user.id)
+        prereqs = [t for t in path if t.id != pk]
+        logger.debug("Found %d prereqs", len(prereqs))
+        return TemplateResponse(request, self.template_name, {
+            'object': topic,
+            'topic': topic,
+            'view': self,
+            'prereqs': prereqs,
+            'cycles': cycles,
+            'subtree_size': subtree_size,
+        })
 
 
 class ResourceDetailView(generic.DetailView):
     model = Resource
 
 
-class TopicSearchResultsView(generic.ListView):
-    model = Topic
+class TopicSearchResultsView(generic.View):
     template_name = 'polls/topic_search_results.html'
     paginate_by = 30
-    ordering = ["title"]
-
-    def get_queryset(self):
-        query = self.request.GET.get('q')
-        object_list = Topic.objects.filter(
-            Q(title__icontains=query) # | Q(state__icontains=query)
-        )
-        return object_list
+    # Best matches first; see polls.search.
+    paginate_keys = ('prefix', 'rank', 'id')
+
+    async def get(self, request):
+        paginator = KeysetPaginator(search_topics(request.GET.get('q')), self.paginate_by, self.paginate_keys)
+        page = await paginator.apage(request.GET.get('after'), request.GET.get('before'))
+        return TemplateResponse(request, self.template_name, {
+            'view': self,
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': page.has_other_pages(),
+            'object_list': page.object_list,
+            'topic_list': page.object_list,
+        })
+
+
+# Type-ahead for topic titles, answered from the in-process prefix index.
+def suggest_topics(request):
+    suggestions = get_suggest_index().suggest(request.GET.get('q', ''))
+    return JsonResponse({
+        'results': [{'id': topic_id, 'title': title} for topic_id, title in suggestions],
+    })
 
 
 # require login?
-class UserDetailView(generic.DetailView):
-    model = User
+class UserDetailView(generic.View):
     template_name = 'polls/user_detail.html'
 
-    def get_context_data(self, **kwargs):
-        context = super(UserDetailView, self).get_context_data(**kwargs)
-
-        context['goals'] = UserGoal.objects.filter(user=self.object.id)
-        context['known'] = UserKnowledge.objects.filter(user=self.object.id)
+    async def get(self, request, pk):
+        user, goals, known = await asyncio.gather(
+            aget_object_or_404(User.objects.all(), pk=pk),
+            alist(UserGoal.objects.filter(user=pk).select_related('topic')),
+            alist(UserKnowledge.objects.filter(user=pk).select_related('topic')))
 
-        context['next_steps'] = dict()
-        for goal in context['goals']:
-            goal_topic_id = goal.topic.id
-            context['next_steps'][goal.topic.title] = get_next_steps(goal_topic_id, self.object.id)
+        next_steps = await sync_to_async(get_next_steps_for_goals)(
+            [goal.topic_id for goal in goals], pk, known_ids=KnownTopics(k.topic_id for k in known))
 
-        return context
+        return TemplateResponse(request, self.template_name, {
+            'object': user,
+            'user': user,
+            'view': self,
+            'goals': goals,
+            'known': known,
+            'next_steps': {goal.topic.title: next_steps[goal.topic_id] for goal in goals},
+        })
 
 
 @login_required
@@ -123,19 +248,9 @@ def mark_known(request, topic_id):
     # print(f"topic id: {topic_id}")
     # print(f"user id: {request.user.id}")
 
-    existing = UserKnowledge.objects.filter(
-        user=request.user.id
-    ).filter(
-        topic=topic_id
-    )
-
-    if len(existing) == 0:
-        print("Topic not yet marked as known; adding.")
-        topic = get_object_or_404(Topic, pk=topic_id)
-        known = UserKnowledge(
-            user=request.user,
-            topic=topic)
-        known.save()
+    # The unique constraint settles two requests racing to add the same row.
+    topic = get_object_or_404(Topic, pk=topic_id)
+    UserKnowledge.objects.get_or_create(user=request.user, topic=topic)
 
     # return HttpResponseRedirect(reverse('polls:user_detail', args=[request.user.id]))
     return HttpResponseRedirect(reverse('polls:topic_detail', args=[topic_id]))
@@ -160,105 +275,185 @@ def mark_known(request, topic_id):
 
 @login_required
 def mark_goal(request, topic_id):
-    existing = UserGoal.objects.filter(
-        user=request.user.id
-    ).filter(
-        topic=topic_id
-    )
-
-    if len(existing) == 0:
-        topic = get_object_or_404(Topic, pk=topic_id)
-        goal = UserGoal(
-            user=request.user,
-            topic=topic)
-        goal.save()
+    topic = get_object_or_404(Topic, pk=topic_id)
+    UserGoal.objects.get_or_create(user=request.user, topic=topic)
 
     return HttpResponseRedirect(reverse('polls:topic_detail', args=[topic_id]))
 
 
 @login_required
 def remove_goal(request, topic_id):
-    existing = UserGoal.objects.filter(
-        user=request.user.id
-    ).filter(
-        target=topic_id
-    )
-
-    if len(existing) > 0:
-        existing[0].delete()
+    UserGoal.objects.filter(user=request.user.id, topic=topic_id).delete()
 
     return HttpResponseRedirect(reverse('polls:user_detail', args=[request.user.id]))
 
 
+# Bulk versions of mark_known / mark_goal, for onboarding. They take topic
+# ids as repeated `topic_ids` form fields or a JSON {"topic_ids": [...]}
+# body, and answer JSON requests with {"marked": n} instead of redirecting.
+
+def get_posted_topic_ids(request):
+    # Raises ValueError unless topic_ids is a list of at most
+    # POLLS_BULK_MARK_MAX integers (ASCII digit strings, from a form) that
+    # fit a BigAutoField.
+    if request.content_type == 'application/json':
+        payload = json.loads(request.body)
+        ids = payload.get('topic_ids', []) if isinstance(payload, dict) else None
+        if not isinstance(ids, list) or not all(type(i) is int for i in ids):
+            raise ValueError("topic_ids must be a list of integers")
+    else:
+        ids = request.POST.getlist('topic_ids')
+        if not all(i.isascii() and i.isdigit() for i in ids):
+            raise ValueError("topic_ids must be integers")
+        ids = [int(i) for i in ids]
+    if len(ids) > getattr(settings, 'POLLS_BULK_MARK_MAX', 1000):
+        raise ValueError("too many topic_ids")
+    if not all(-2 ** 63 <= i < 2 ** 63 for i in ids):
+        raise ValueError("topic_ids out of range")
+    return set(ids)
+
+
+def add_user_topics(model, user_id, topic_ids, batch_size=500):
+    # Bulk INSERTs in one transaction; rows the user already has are skipped
+    # by the (user, topic) unique constraint. Ids are checked batch_size at a
+    # time to stay under the DB's limit on query parameters. Returns how many
+    # ids were topics.
+    topic_ids = list(topic_ids)
+    with transaction.atomic():
+        topic_ids = [
+            topic_id
+            for start in range(0, len(topic_ids), batch_size)
+            for topic_id in Topic.objects.filter(
+                id__in=topic_ids[start:start + batch_size]).values_list('id', flat=True)
+        ]
+        model.objects.bulk_create(
+            [model(user_id=user_id, topic_id=topic_id) for topic_id in topic_ids], ignore_conflicts=True)
+        # bulk_create skips the signal that keeps the cached set current.
+        if model is UserKnowledge:
+            known_topics_added(user_id, topic_ids)
+    return len(topic_ids)
+
+
+def bulk_mark_response(request, count, url):
+    if request.content_type == 'application/json':
+        return JsonResponse({'marked': count})
+    return HttpResponseRedirect(url)
+
+
+def bulk_mark(request, model):
+    try:
+        topic_ids = get_posted_topic_ids(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(f"topic_ids must be a list of topic ids: {e}")
+    count = add_user_topics(model, request.user.id, topic_ids)
+    return bulk_mark_response(request, count, reverse('polls:user_detail', args=[request.user.id]))
+
+
+@login_required
+@require_POST
+def mark_known_bulk(request):
+    return bulk_mark(request, UserKnowledge)
+
+
+@login_required
+@require_POST
+def mark_goals_bulk(request):
+    return bulk_mark(request, UserGoal)
+
+
+@login_required
+@require_POST
+def mark_known_with_prereqs(request, topic_id):
+    graph = get_graph()
+    if topic_id not in graph:
+        raise Http404(f"No topic {topic_id}")
+    topic_ids = set(graph.ancestors(topic_id, PREREQ_TYPES)) | {topic_id}
+    count = add_user_topics(UserKnowledge, request.user.id, topic_ids)
+    return bulk_mark_response(request, count, reverse('polls:topic_detail', args=[topic_id]))
+
+
 @login_required
 def vote_for_resource(request, resource_relation_id):
-    rr = ResourceRelation.objects.get(pk=resource_relation_id)
-    rr.votes += 1
-    rr.save()
-    return HttpResponseRedirect(reverse('polls:topic_detail', args=[rr.topic.id]))
+    topic_id = get_object_or_404(
+        ResourceRelation.objects.values_list('topic_id', flat=True), pk=resource_relation_id)
+    record_vote(request.user.id, resource_relation_id, topic_id)
+    return HttpResponseRedirect(reverse('polls:topic_detail', args=[topic_id]))
 
 
 # Return a list of all prereq topics for the given topic.
 def get_all_prereqs(topic_id, user_id):
-    # TODO: use a graph db or in-memory graph or anything other than this.
-    prereq_topics = set()  # WARNING - uses id to hash, so if not saved won't work.
-    next_steps = set()  # Only the "boundary" of unknown topics.
-    open_set = set([Topic.objects.get(pk=topic_id)])
-    closed_set = set()  # seem there are some cycles somewhere?
-
-    known_topics = set()
-    if user_id:
-        known = UserKnowledge.objects.filter(user=user_id)
-        known_topics = set([k.topic for k in known])
-        print("known topics: ", known_topics)
-
-    while len(open_set) > 0:
-        curr_topic = open_set.pop()
-        if curr_topic in closed_set:
-            continue
-        closed_set.add(curr_topic)
-
-        prereq_relations = TopicRelation.objects.filter(target=curr_topic).filter(
-            relation_type=TopicRelation.RelationType.PREREQ_OF
-        )
-        added_child = False
-        for rel in prereq_relations:
-            if rel.source in known_topics:
-                print(f"already know {rel.source.title}")
-                continue
-            print(f"adding {rel.source.title}")
-            open_set.add(rel.source)
-            prereq_topics.add(rel.source)
-            added_child = True
-
-        # Add children topics too.
-        child_relations = TopicRelation.objects.filter(target=curr_topic).filter(
-            relation_type=TopicRelation.RelationType.CHILD_OF
-        )
-        for rel in child_relations:
-            if rel.source in known_topics:
-                print(f"already know {rel.source.title}")
-                continue
-            print(f"adding {rel.source.title}")
-            open_set.add(rel.source)
-            prereq_topics.add(rel.source)
-            added_child = True
-
-        if not added_child and curr_topic not in known_topics:
-            # Add (unknown) nodes with no unknown children/predecessors.
-            print(f"marking {curr_topic.title} as a next_step")
-            next_steps.add(curr_topic)
+    backend = getattr(settings, 'POLLS_GRAPH_BACKEND', 'memory')
+    if backend == 'sql':
+        # No in-process graph: one recursive query instead.
+        return closure.prereq_closure(topic_id, user_id)
+    if backend == 'closure':
+        return closure.prereq_closure_from_table(topic_id, user_id)
+
+    known_ids = get_known_ids(user_id)
+    prereq_ids, next_step_ids = get_graph().prereq_closure(topic_id, known_ids)
+
+    # WARNING - Topics hash by id, so the sets only work for saved topics.
+    topics = Topic.objects.in_bulk(prereq_ids | next_step_ids)
+    prereq_topics = set(topics[i] for i in prereq_ids if i in topics)
+    next_steps = set(topics[i] for i in next_step_ids if i in topics)  # Only the "boundary" of unknown topics.
 
     # TODO: make sure ordered?
     return prereq_topics, next_steps
 
 
+# The goal and its prereqs as topics in an order they can be learned in,
+# each with its `depth`, plus any prereq cycles (lists of topics) found on
+# the way and the number of topics below the goal.
+def get_learning_path(topic_id, user_id):
+    known_ids = get_known_ids(user_id)
+    if getattr(settings, 'POLLS_GRAPH_BACKEND', 'memory') == 'memory':
+        graph = get_graph()
+    else:
+        # Order just the prereqs the backend found, using their relations.
+        prereqs, _ = get_all_prereqs(topic_id, user_id)
+        ids = set(topic.id for topic in prereqs) | {topic_id}
+        graph = TopicGraph(ids, list(TopicRelation.objects.filter(
+            source__in=ids, target__in=ids
+        ).values_list('source_id', 'target_id', 'relation_type', 'weight')))
+
+    path_ids, cycle_ids = graph.learning_path(topic_id, known_ids)
+    topics = Topic.objects.in_bulk(path_ids)
+    for topic in topics.values():
+        topic.depth = graph.depth(topic.id)
+
+    path = [topics[i] for i in path_ids if i in topics]
+    cycles = [[topics[i] for i in cycle if i in topics] for cycle in cycle_ids]
+    return path, cycles, graph.subtree_size(topic_id)
+
+
 def get_next_steps(topic_id, user_id):
     # TODO: change prereqs function to return something more like a graph instead?
     _, next_steps = get_all_prereqs(topic_id, user_id)
     return next_steps
 
 
+# Next steps for several goals at once, as {goal topic id: set of topics}.
+def get_next_steps_for_goals(goal_topic_ids, user_id, known_ids=None):
+    if getattr(settings, 'POLLS_GRAPH_BACKEND', 'memory') != 'memory':
+        # The SQL backends answer one goal per query anyway.
+        return {goal_id: get_next_steps(goal_id, user_id) for goal_id in goal_topic_ids}
+
+    if known_ids is None:
+        known_ids = get_known_ids(user_id)
+    next_step_ids = get_graph().next_steps_by_goal(goal_topic_ids, known_ids)
+
+    topics = Topic.objects.in_bulk(set().union(*next_step_ids.values()))
+    return {
+        goal_id: set(topics[i] for i in ids if i in topics)
+        for goal_id, ids in next_step_ids.items()
+    }
+
+
+def get_known_ids(user_id):
+    # A cached KnownTopics; supports `in`, len() and iteration like a set.
+    return get_known_topics(user_id)
+
+
 # Probably should be in a different app
 def register_request(request):
     if request.method == "POST":
@@ -266,11 +461,11 @@ def register_request(request):
         if form.is_valid():
             user = form.save()
             login(request, user)
-            print("Registration successful!")
+            logger.info("Registered user %s", user.username)
             # messages.success(request, "Registration successful." )
             # return redirect("main:homepage")
             return redirect("polls:topics")
-        print("Unsuccessful registration")
+        logger.info("Unsuccessful registration: %s", form.errors.as_json())
         # messages.error(request, "Unsuccessful registration. Invalid information.")
     form = UserCreationForm()
     return render (request=request, template_name="polls/register.html", context={"register_form":form})
@@ -289,8 +484,7 @@ def edit_topic(request, topic_id=None):
         rel['source'] = source
         rel['target'] = target
 
-    print(f"found {len(relationships)} rels")
-    print(relationships)
+    logger.debug("Editing topic %s with %d relations", topic_id, len(relationships))
 
     rel_forms = TopicRelationFormSet(initial=relationships)
     # print(rel_forms.as_table())
@@ -315,3 +509,16 @@ def edit_topic(request, topic_id=None):
         form = TopicForm(instance=topic)
 
     return render(request, 'polls/edit_topic.html', {'object': topic, 'form': form, 'rel_forms': rel_forms})
+
+
+@staff_member_required
+def export_graph(request, fmt):
+    if fmt not in EXPORT_FORMATS:
+        raise Http404(f"No export format {fmt}")
+    export, content_type, extension = EXPORT_FORMATS[fmt]
+    # Under ASGI a sync iterator would be read into memory in full before
+    # anything is sent.
+    content = aiter_export(export) if isinstance(request, ASGIRequest) else export()
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="topic-graph.{extension}"'
+    return response
@@ -0,0 +1,178 @@
+import atexit
+from collections import Counter
+import logging
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+from .models import ResourceRelation, ResourceVote
+from .pagecache import invalidate_topics
+
+
+logger = logging.getLogger(__name__)
+
+
+INSERT_VOTES_SQL = """
+INSERT INTO {table} (user_id, resource_relation_id) VALUES {values}
+ON CONFLICT DO NOTHING RETURNING user_id, resource_relation_id
+"""
+
+
+def insert_votes(pairs, batch_size=500):
+    """Insert (user_id, resource_relation_id) votes, skipping ones already
+    cast. Returns the pairs this call actually inserted, so two processes
+    flushing the same vote can't both count it.
+    """
+    pairs = list(pairs)
+    if connection.vendor not in ('sqlite', 'postgresql') or not connection.features.can_return_rows_from_bulk_insert:
+        # No INSERT ... RETURNING: one savepoint per vote instead.
+        inserted = []
+        for user_id, rr_id in pairs:
+            try:
+                with transaction.atomic():
+                    ResourceVote.objects.create(user_id=user_id, resource_relation_id=rr_id)
+            except IntegrityError:
+                continue
+            inserted.append((user_id, rr_id))
+        return inserted
+
+    table = connection.ops.quote_name(ResourceVote._meta.db_table)
+    inserted = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            sql = INSERT_VOTES_SQL.format(table=table, values=", ".join(["(%s, %s)"] * len(batch)))
+            cursor.execute(sql, [value for pair in batch for value in pair])
+            inserted.extend(tuple(row) for row in cursor.fetchall())
+    return inserted
+
+
+def apply_votes(votes):
+    """Write a batch of {(user_id, resource_relation_id): topic_id} votes.
+
+    Votes the user already cast are dropped, and each ResourceRelation gets
+    one `votes = votes + n` UPDATE per distinct n rather than a row save.
+    Returns the number of votes counted.
+    """
+    if not votes:
+        return 0
+    with transaction.atomic():
+        new = insert_votes(votes)
+        by_count = {}
+        for rr_id, count in Counter(rr_id for _, rr_id in new).items():
+            by_count.setdefault(count, []).append(rr_id)
+        for count, rr_ids in by_count.items():
+            ResourceRelation.objects.filter(pk__in=rr_ids).update(votes=F('votes') + count)
+
+    # update() skips the signals that normally expire cached topic pages.
+    invalidate_topics(*(votes[vote] for vote in new))
+    return len(new)
+
+
+class VoteBuffer:
+    """Collects votes in memory and writes them with apply_votes in batches.
+
+    Flushed once `size` votes are waiting, by a timer `interval` seconds
+    after the first of them came in, and at exit. Repeat votes within a
+    batch are dropped before they reach the DB.
+    """
+
+    def __init__(self, size, interval):
+        self.size = size
+        self.interval = interval
+        self.pending = {}
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def add(self, user_id, resource_relation_id, topic_id):
+        with self.lock:
+            if not self.pending:
+                self._start_timer()
+            self.pending.setdefault((user_id, resource_relation_id), topic_id)
+            due = len(self.pending) >= self.size
+        if due:
+            self.flush()
+
+    def _start_timer(self):
+        # Caller holds the lock.
+        self.timer = threading.Timer(self.interval, self._flush_on_timer)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def _flush_on_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Couldn't write buffered votes, will retry")
+        finally:
+            # The timer thread's own connection, which nothing else will close.
+            connection.close()
+
+    def flush(self):
+        with self.lock:
+            votes, self.pending = self.pending, {}
+            self.cancel()
+        try:
+            return apply_votes(votes)
+        except Exception:
+            # Put them back for the next flush rather than drop them.
+            with self.lock:
+                if not self.pending:
+                    self._start_timer()
+                for vote, topic_id in votes.items():
+                    self.pending.setdefault(vote, topic_id)
+            raise
+
+    def cancel(self):
+        # Caller holds the lock.
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_vote_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = VoteBuffer(
+                settings.POLLS_VOTE_BUFFER_SIZE, getattr(settings, 'POLLS_VOTE_FLUSH_INTERVAL', 5))
+            atexit.register(_buffer.flush)
+        return _buffer
+
+
+def record_vote(user_id, resource_relation_id, topic_id):
+    if getattr(settings, 'POLLS_VOTE_BUFFER_SIZE', 0) > 1:
+        get_vote_buffer().add(user_id, resource_relation_id, topic_id)
+        return
+
+    # Unbuffered: the unique constraint catches repeat votes, no lookup needed.
+    try:
+        with transaction.atomic():
+            ResourceVote.objects.create(user_id=user_id, resource_relation_id=resource_relation_id)
+            ResourceRelation.objects.filter(pk=resource_relation_id).update(votes=F('votes') + 1)
+    except IntegrityError:
+        return
+    invalidate_topics(topic_id)
+
+
+def flush_votes():
+    if _buffer is not None:
+        _buffer.flush()
+
+
+def reset_vote_buffer():
+    """Drop this process's buffer (and any unflushed votes) so the next vote
+    builds a new one from the current settings."""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is not None:
+            atexit.unregister(_buffer.flush)
+            with _buffer.lock:
+                _buffer.cancel()
+        _buffer = None
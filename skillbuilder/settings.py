@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'polls.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -113,6 +114,25 @@ USE_I18N = True
 USE_TZ = True
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Rendered topic pages and their versions. Must be shared by every
+    # worker, or a write only expires pages in the worker that made it; a
+    # directory works on one machine, use memcached or Redis across several.
+    'topic_pages': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'topic-pages',
+        'TIMEOUT': 24 * 60 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/4.0/howto/static-files/
 
@@ -122,3 +142,91 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Polls
+
+# How get_all_prereqs walks the topic graph: 'memory' keeps a copy of every
+# TopicRelation in each process, 'sql' runs one recursive query per call,
+# 'closure' reads the TopicClosure table (which is then kept up to date on
+# every TopicRelation write; fill it with `manage.py rebuild_topic_closure`).
+POLLS_GRAPH_BACKEND = 'memory'
+
+# Seconds between checks of the TopicGraphChange log by the cached topic
+# graph; 0 checks on every use.
+POLLS_GRAPH_SYNC_INTERVAL = 0
+
+# CACHES alias for rendered topic pages and fragments.
+POLLS_TOPIC_CACHE = 'topic_pages'
+
+# Type-ahead: suggestions per request, and how often (in seconds) each
+# process rebuilds its title index to see other processes' edits.
+POLLS_SUGGEST_LIMIT = 10
+POLLS_SUGGEST_TTL = 300
+
+# Resource votes are written straight away unless POLLS_VOTE_BUFFER_SIZE is
+# above 1, in which case each process holds them in memory and writes them
+# once that many are waiting, or POLLS_VOTE_FLUSH_INTERVAL seconds after the
+# first of them (from a timer thread), or at exit. Until then a vote isn't on
+# the page, and a worker that's killed outright loses the votes it holds.
+POLLS_VOTE_BUFFER_SIZE = 0
+POLLS_VOTE_FLUSH_INTERVAL = 5
+
+# TopicRelation.weight is the sum of its votes, each counted by origin
+# (unlisted origins count 1). `manage.py aggregate_relation_votes` applies
+# new votes; set POLLS_AGGREGATE_VOTES_ON_SAVE to do it as they come in.
+POLLS_VOTE_ORIGIN_WEIGHTS = {'user': 1}
+POLLS_AGGREGATE_VOTES_ON_SAVE = False
+
+# Binary edge list (`manage.py export_graph --format edges`) that workers
+# load the topic graph from at startup instead of querying TopicRelation;
+# they then catch up from the TopicGraphChange log. None loads from the DB.
+POLLS_GRAPH_EDGE_LIST = None
+
+# Snapshot of the in-memory topic graph (CSR arrays plus titles) that
+# workers mmap at startup, sharing one copy between them. Rewritten on a
+# background thread by the process that makes a graph change, at most every
+# POLLS_GRAPH_SNAPSHOT_INTERVAL seconds; workers catch up from the change
+# log either way. Or run `manage.py write_graph_snapshot` from cron and set
+# the interval to None. None disables the snapshot.
+POLLS_GRAPH_SNAPSHOT = None
+POLLS_GRAPH_SNAPSHOT_INTERVAL = 300
+
+# Seconds the TopicGraphChange log is kept for. Writing the snapshot (or
+# `manage.py prune_graph_changes`) deletes older rows, except those the
+# snapshot or edge list still replay from; a worker idle for longer reloads
+# the graph instead of catching up. At least two minutes.
+POLLS_GRAPH_CHANGE_RETENTION = 24 * 60 * 60
+
+# Most topic ids one bulk mark-known or mark-goal request may send.
+POLLS_BULK_MARK_MAX = 1000
+
+# Limits on /polls/api/ neighbourhood requests (and topic list page size).
+POLLS_API_MAX_DEPTH = 3
+POLLS_API_MAX_NODES = 500
+
+# Each user's known topics are cached as a compact set (in the default
+# cache) for POLLS_KNOWN_TOPICS_TTL seconds, and each process keeps the most
+# recent POLLS_KNOWN_TOPICS_LOCAL of them in memory. Both are keyed by a
+# version kept in the DB, so a per-process cache is fine.
+POLLS_KNOWN_TOPICS_TTL = 86400
+POLLS_KNOWN_TOPICS_LOCAL = 1000
+
+# Every request's query count, DB time, graph traversal size and render time
+# go out in a Server-Timing header (turn POLLS_SERVER_TIMING off to keep them
+# from clients) and to the 'polls.instrumentation' logger: at INFO, or at
+# WARNING once a request takes POLLS_SLOW_REQUEST_MS (None never warns).
+POLLS_SERVER_TIMING = True
+POLLS_SLOW_REQUEST_MS = 1000
+
+# Raise 'polls' to INFO to log every request, DEBUG for view details too.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'polls': {'handlers': ['console'], 'level': 'WARNING'},
+    },
+}